@@ -1,2 +1,13 @@
 from .pvr3 import *
+from .apvr3 import *
+from .devmgr import *
+from .framing import *
+from .commands import *
+from .decoders import *
+from .results import *
+from .metrics import *
+from .tracing import *
+from .reader import *
+from .clock import *
 from .mysermock import *
+from .simulator import *
@@ -0,0 +1,509 @@
+import asyncio
+import functools
+import inspect
+
+from .framing import ExpectFrames
+from .pvr3 import PyVoiceRecognitionV3Base
+
+class AsyncPyVoiceRecognitionV3(PyVoiceRecognitionV3Base):
+    """
+    asyncio driver for the Elechouse Voice Recognition Module V3
+
+    The class offers the same commands as ``PyVoiceRecognitionV3``, but every
+    command is a coroutine:
+
+        vr = AsyncPyVoiceRecognitionV3(device=dev)
+        await vr.load_to_recognizer(10)
+        async for event in vr.recognitions():
+            print(event["recognized_record"])
+
+    Reading is driven by the event loop: the file descriptor of the serial
+    port is watched with ``loop.add_reader()`` and data is read as soon as it
+    arrives. No thread and no sleep is involved, so one event loop can serve
+    many modules. Recognitions (0d) are handed to the running
+    ``recognitions()`` iterators, all other messages are responses to
+    commands. Thus, commands can be issued while recognitions are monitored.
+
+    For serial ports without file descriptor (e.g. on Windows) the port is
+    polled every millisecond instead.
+    """
+    def __init__(self,
+            device=None,                # Serial device
+            tout=10,                    # Timeout in ms
+            latency=50,                 # Response latency in ms
+            records=None,        # Number of record slots
+            keep_raw=True,              # Keep raw messages in results
+            ):
+        """
+        Create an instance of class ``AsyncPyVoiceRecognitionV3``
+
+        The serial port is attached to the running event loop with the first
+        command.
+
+        Parameters:
+            device (device): serial device
+            tout (int): timeout for the serial communication in milliseconds
+                (ms)
+            latency (int): latency for the response from the module in
+                milliseconds (ms)
+            records (int or None): number of record slots of the module
+                (V3: 80, V3.1: 255). If ``None`` unknown.
+            keep_raw (bool): if ``False`` results do not keep the raw
+                messages from the module. All fields are decoded right away
+                and the messages are dropped.
+
+        Returns:
+            Nothing
+        """
+
+        super().__init__(device = device, tout = tout, latency = latency,
+                records = records, keep_raw = keep_raw)
+
+        self._loop = None           # Event loop the port is attached to
+        self._fd = None             # Watched file descriptor
+        self._poll_task = None      # Polling task (no file descriptor)
+        self._lock = None           # Serializes commands
+        self._timeout = None        # Read timeout of the port before
+        self._responses = None      # Queue of command responses
+        self._recognitions = []     # Queues of the recognition iterators
+
+    def _attach(self):
+        """
+        Attach the serial port to the running event loop
+
+        Parameters:
+            None
+
+        Returns:
+            Nothing
+        """
+
+        if None != self._loop:
+            return
+
+        self._loop = asyncio.get_running_loop()
+        self._lock = asyncio.Lock()
+        self._responses = asyncio.Queue()
+
+        # The event loop tells when data is available; reads must never
+        # block. The timeout of the port is restored by close().
+        self._timeout = self.ser.timeout
+        self.ser.timeout = 0
+        self._decoder.reset()
+
+        fileno = getattr(self.ser, "fileno", None)
+        try:
+            self._fd = fileno() if None != fileno else None
+        except (OSError, ValueError):
+            self._fd = None
+
+        if None != self._fd:
+            self._loop.add_reader(self._fd, self._on_readable)
+        else:
+            self._poll_task = self._loop.create_task(self._poll())
+
+    def close(self):
+        """
+        Detach the serial port from the event loop
+
+        The read timeout of the serial port is restored.
+
+        Parameters:
+            None
+
+        Returns:
+            Nothing
+        """
+
+        if None != self._fd:
+            self._loop.remove_reader(self._fd)
+            self._fd = None
+        if None != self._poll_task:
+            self._poll_task.cancel()
+            self._poll_task = None
+        if None != self._loop:
+            self.ser.timeout = self._timeout
+        self._loop = None
+
+    async def _poll(self):
+        """
+        Poll the serial port of a device without file descriptor
+
+        Parameters:
+            None
+
+        Returns:
+            Nothing
+        """
+
+        while True:
+            if self.ser.in_waiting:
+                self._on_readable()
+            await asyncio.sleep(0.001)
+
+    def _on_readable(self):
+        """
+        Read pending data and route the completed messages
+
+        Called by the event loop whenever the serial port is readable.
+        Recognition messages (0d) are put into the queues of the running
+        ``recognitions()`` iterators, all other messages into the response
+        queue. If reading fails, the exception is handed to everyone waiting.
+
+        Parameters:
+            None
+
+        Returns:
+            Nothing
+        """
+
+        # SerialException of pyserial is an OSError
+        try:
+            data = self.ser.read(max(self.ser.in_waiting, 1))
+        except (OSError, ValueError) as e:
+            self.close()
+            self._responses.put_nowait(e)
+            for q in self._recognitions:
+                q.put_nowait(e)
+            return
+
+        for frame in self._decoder.feed(data):
+            if 13 == frame[2]:      # \x0d
+                for q in self._recognitions:
+                    q.put_nowait(frame)
+            else:
+                self._responses.put_nowait(frame)
+
+    def _send_cmd(self, command):
+        """
+        Sends command to the module
+
+        Responses that nobody waited for are dropped before sending.
+
+        Parameters:
+            command (bytearray): command to be send to the module.
+
+        Returns:
+            Nothing
+        """
+
+        while not self._responses.empty():
+            self._responses.get_nowait()
+        self.ser.write(command)
+
+    async def _recv_frames(self, timeout):
+        """
+        Wait for the next part of a response
+
+        Parameters:
+            timeout (int or float): maximum time to wait in milliseconds (ms)
+
+        Returns:
+            messages (list of Frame or None): messages received. ``None``
+                if the line stayed quiet.
+        """
+
+        try:
+            messages = [await asyncio.wait_for(self._responses.get(),
+                    max(timeout, 0) / 1000.)]
+        except asyncio.TimeoutError:
+            return None
+        # Take everything else that is already queued
+        while not self._responses.empty():
+            messages.append(self._responses.get_nowait())
+
+        for m in messages:
+            if isinstance(m, Exception):
+                raise m
+        return messages
+
+    async def _recv_rsp(self, tout=None, latency=None, expect=None):
+        """
+        Receive response/data from the module
+
+        See ``PyVoiceRecognitionV3._recv_rsp()``.
+
+        Parameters:
+            tout (int or None): timeout of the serial communication in
+                milliseconds (ms). If ``None`` defaults to ``self.tout``.
+            latency (int): latency for the response from the module in
+                milliseconds (ms). If ``None`` defaults to ``self.latency``.
+            expect (callable or None): expected response
+
+        Returns:
+            messages (array of Frame): the response messages (one or
+                multiple) from the module
+        """
+
+        if None == tout:        # Timeout in ms
+            tout = self.tout
+        if None == latency:     # Latency in ms
+            latency = self.latency
+
+        messages = await self._recv_frames(latency) or []
+        while None == expect or not expect(messages):
+            frames = await self._recv_frames(tout)
+            if None == frames:
+                break
+            messages += frames
+
+        # If messages is empty than set it to None
+        if [] == messages:
+            messages = None
+
+        return messages
+
+    def _execute(self, command, expect, parse, *args):
+        """
+        Sends a command to the module and interprets the response
+
+        See ``PyVoiceRecognitionV3Base._execute()``. The command methods of
+        the base class return the coroutine of ``_aexecute()``.
+
+        Parameters:
+            command (bytearray): command to be sent to the module
+            expect (callable): expected response (e.g. ``ExpectFrames``)
+            parse (callable): method interpreting the response
+            args: additional arguments for ``parse``
+
+        Returns:
+            response (coroutine): coroutine resolving to the return value of
+                ``parse``
+        """
+
+        return self._aexecute(command, expect, parse, *args)
+
+    async def _aexecute(self, command, expect, parse, *args):
+        """
+        Sends a command to the module and interprets the response
+
+        Parameters:
+            command (bytearray): command to be sent to the module
+            expect (callable): expected response (e.g. ``ExpectFrames``)
+            parse (callable): method interpreting the response
+            args: additional arguments for ``parse``
+
+        Returns:
+            response: return value of ``parse``
+        """
+
+        self._attach()
+        async with self._lock:
+            self._send_cmd(command)
+            messages = await self._recv_rsp(expect = expect)
+        return parse(messages, *args)
+
+    async def send_cmd(self, command, expect=None):
+        """
+        Sending a command to the module and receiving response(s)
+
+        Parameters:
+            command (bytearray): command to be sent to the module
+            expect (callable or None): expected response. If ``None`` wait
+                until the line becomes quiet.
+
+        Returns:
+            messages (array of Frame): response messages from
+                the module
+        """
+
+        return await self._aexecute(command, expect, lambda messages: messages)
+
+    async def check_record_signature(self, record=None):
+        """
+        Check the signature of a record (03)
+
+        See ``PyVoiceRecognitionV3.check_record_signature()``.
+
+        Parameters:
+            record (int): Record number
+
+        Returns:
+            response (dict): dictionary containing the response
+                from the voice recognition module
+        """
+
+        # Initialize response dict
+        response_dict = None
+
+        # Proceed only if record number was given
+        if None != record:
+            # Ask for the signature only if the record is trained. For
+            # untrained records the module returns random characters.
+            status = await self.check_record_train_status(record)
+            if "trained" == status["train_status"][0]:
+                command = self._compile_signature_cmd(record)
+                response_dict = await self._aexecute(command,
+                        ExpectFrames(0x03),
+                        self._parse_check_record_signature, record)
+            else:
+                response_dict = {
+                        "raw": None,
+                        "record": record,
+                        "signature": None,
+                        }
+
+        return response_dict
+
+    async def train_record(self, record=None, signature=None):
+        """
+        Train a record without (20) or with signature (21)
+
+        See ``PyVoiceRecognitionV3.train_record()``.
+
+        Parameters:
+            record (int): Record number to train
+            signature (str or None): Signature for record
+
+        Returns:
+            response (dict): dictionary containing the response
+                from the voice recognition module
+
+        Raises:
+            BadSignature: signature is too long or contains bad characters
+        """
+
+        # Initialize response dict
+        response_dict = None
+
+        # Compile command; check signature
+        command = self._compile_train_cmd(record, signature)
+
+        # Proceed only if record number was given
+        if None != record:
+            self._attach()
+            async with self._lock:
+                self._send_cmd(command)
+
+                # Every prompt and the status message must arrive within the
+                # dialog timeout
+                dialog_tout = 8000      # timeout for dialog with module
+                                        # in milliseconds
+                expect = ExpectFrames((0x0a, 0x20, 0x21))
+                while None == response_dict:
+                    messages = await self._recv_rsp(latency = dialog_tout,
+                            expect = expect)
+                    if None == messages:
+                        break
+                    for response_bin in messages:
+                        status = self._parse_train_message(response_bin,
+                                record, signature)
+                        if None != status:
+                            response_dict = status
+
+        return response_dict
+
+    async def recognitions(self, timeout=None):
+        """
+        Iterate over the records recognized by the module (0d)
+
+        This method requires that at least one record is loaded to the
+        recognizer of the module. Otherwise the iteration ends immediately.
+
+            async for event in vr.recognitions(timeout=20000):
+                print(event["recognized_record"])
+
+        Each event is a dictionary as described in
+        ``PyVoiceRecognitionV3.record_recognized()``. Commands can be issued
+        while iterating.
+
+        Parameters:
+            timeout (int or None): Time in milliseconds after which the
+                iteration ends. If ``None`` iterate until the consumer stops.
+
+        Returns:
+            events (async iterator of dict): recognitions
+        """
+
+        # At least one record has to be loaded to recognizer
+        status_recognizer = await self.check_recognizer()
+        if (None == status_recognizer
+                or status_recognizer["no_records_in_recognizer"] == 0):
+            return
+
+        queue = asyncio.Queue()
+        self._recognitions.append(queue)
+        start = self._loop.time()
+        try:
+            while True:
+                if None != timeout:
+                    remaining = timeout / 1000. - (self._loop.time() - start)
+                    try:
+                        response_bin = await asyncio.wait_for(queue.get(),
+                                max(remaining, 0))
+                    except asyncio.TimeoutError:
+                        return
+                else:
+                    response_bin = await queue.get()
+
+                if isinstance(response_bin, Exception):
+                    raise response_bin
+
+                yield self._recognition_dict(response_bin,
+                        1000 * (self._loop.time() - start), status_recognizer)
+        finally:
+            self._recognitions.remove(queue)
+
+    async def record_recognized(self, timeout=None, callback_func=None):
+        """
+        Wait until trained record is recognized (0d)
+
+        See ``PyVoiceRecognitionV3.record_recognized()``. The callback
+        function can be a plain function or a coroutine function.
+
+        Parameters:
+            timeout (int): Timeout in milliseconds to wait for
+                a recognition
+            callback_func (Name of callback function or None): Name
+                of callback function to call when record is recognized.
+
+        Returns:
+            Nothing
+        """
+
+        # Check argument callback_func
+        if None == callback_func:
+            # Set to default callback function
+            callback_func = self._default_callback
+
+        if None == timeout:
+            # Set timeout to practically infinite
+            timeout = 10**10       # corresponds to ~ 3 years
+
+        async for response_dict in self.recognitions(timeout = timeout):
+            result = callback_func(response_dict)
+            if inspect.isawaitable(result):
+                await result
+
+def _async_command(name):
+    """
+    Wrap a command of ``PyVoiceRecognitionV3Base`` in a coroutine function
+
+    The base method returns the coroutine of ``_aexecute()``, or a value
+    without talking to the module (e.g. ``None`` if no record was given).
+    The wrapper makes every call awaitable; argument checks raise when the
+    call is awaited.
+
+    Parameters:
+        name (str): name of the command method
+
+    Returns:
+        command (coroutine function): command of the async driver
+    """
+    method = getattr(PyVoiceRecognitionV3Base, name)
+
+    @functools.wraps(method)
+    async def command(self, *args, **kwargs):
+        response = method(self, *args, **kwargs)
+        if inspect.isawaitable(response):
+            response = await response
+        return response
+
+    return command
+
+for _name in ("check_system_settings", "check_recognizer",
+        "check_record_train_status", "restore_system_settings",
+        "set_baudrate", "set_output_io_mode", "set_output_io_pulse_width",
+        "reset_output_io", "set_signature", "load_to_recognizer",
+        "clear_recognizer"):
+    setattr(AsyncPyVoiceRecognitionV3, _name, _async_command(_name))
@@ -0,0 +1,263 @@
+# Clocks used by the drivers to measure time and to wait for data from the
+# module. The drivers never call the ``time`` module directly, so a test or a
+# benchmark can replace the clock of the operating system by a virtual clock.
+# Its time only advances when somebody waits, hence timeouts cost no wall
+# clock time.
+
+import heapq
+import itertools
+import select
+import threading
+import time
+
+class SystemClock:
+    """
+    Clock of the operating system
+
+    Time is measured with ``time.monotonic()``, which is not affected by
+    adjustments of the system time (e.g. by NTP).
+    """
+
+    # Waiting takes real time
+    realtime = True
+
+    def monotonic(self):
+        """
+        Returns the current time
+
+        Parameters:
+            None
+
+        Returns:
+            time (float): time in seconds. Only differences are meaningful.
+        """
+        return time.monotonic()
+
+    def sleep(self, seconds):
+        """
+        Wait for some time
+
+        Parameters:
+            seconds (float): time to wait in seconds
+
+        Returns:
+            Nothing
+        """
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def wait_readable(self, device, timeout):
+        """
+        Wait until data from a serial device is pending
+
+        A device without file descriptor cannot be watched. In this case the
+        method returns ``True`` at once and the waiting is left to the read
+        of the serial driver.
+
+        Parameters:
+            device (device): serial device
+            timeout (float or None): maximum time to wait in seconds. If
+                ``None`` wait until data is pending.
+
+        Returns:
+            readable (bool): ``True`` if data can be read
+        """
+        if device.in_waiting:
+            return True
+        try:
+            fd = device.fileno()
+        except (AttributeError, OSError, ValueError):
+            return True
+        readable, _, _ = select.select([fd], [], [], timeout)
+        return bool(readable)
+
+    def select(self, selector, timeout):
+        """
+        Wait until a file object registered with a selector is ready
+
+        Parameters:
+            selector (selectors.BaseSelector): selector
+            timeout (float or None): maximum time to wait in seconds. If
+                ``None`` wait until a file object is ready.
+
+        Returns:
+            ready (list): ``(key, events)`` tuples as returned by
+                ``selector.select()``
+        """
+        return selector.select(timeout)
+
+# Clock used if none is given
+system_clock = SystemClock()
+
+class VirtualClock:
+    """
+    Clock for tests and benchmarks
+
+    The time of a virtual clock only advances when somebody sleeps or waits.
+    Waiting for data does not take real time either: the clock jumps to the
+    next timer (see ``call_later()``), e.g. data arriving at the mock serial
+    device, or to the end of the timeout:
+
+        clock = VirtualClock()
+        dev = MySerMock(clock=clock)
+        clock.call_later(5, dev.append_to_inbuffer, recognition)
+        vr = PyVoiceRecognitionV3(device=dev)
+        vr.record_recognized(timeout=10000)     # returns at once
+        clock.monotonic()                       # 10.0
+    """
+
+    # Waiting takes no real time
+    realtime = False
+
+    def __init__(self, start=0.0):
+        """
+        Initialize instance
+
+        Parameters:
+            start (float): time in seconds to start with
+
+        Returns:
+            Nothing
+        """
+        self.now = start
+
+        # Timers (time, sequence number, callback, arguments). The sequence
+        # number keeps timers with the same time in order.
+        self._timers = []
+        self._seq = itertools.count()
+
+        # Guards the timers; they can be added from another thread (e.g.
+        # data appended to a mock while a driver waits)
+        self._lock = threading.RLock()
+
+    def monotonic(self):
+        """
+        Returns the current time
+
+        Parameters:
+            None
+
+        Returns:
+            time (float): time in seconds
+        """
+        return self.now
+
+    def call_at(self, when, callback, *args):
+        """
+        Call a function when the clock reaches a given time
+
+        Parameters:
+            when (float): time in seconds
+            callback (function): function to call
+            args: arguments for the function
+
+        Returns:
+            Nothing
+        """
+        with self._lock:
+            heapq.heappush(self._timers,
+                    (when, next(self._seq), callback, args))
+
+    def call_later(self, delay, callback, *args):
+        """
+        Call a function after some time
+
+        Parameters:
+            delay (float): time in seconds from now
+            callback (function): function to call
+            args: arguments for the function
+
+        Returns:
+            Nothing
+        """
+        self.call_at(self.now + delay, callback, *args)
+
+    def advance(self, seconds):
+        """
+        Advance the time and call the timers due on the way
+
+        Parameters:
+            seconds (float): time in seconds
+
+        Returns:
+            Nothing
+        """
+        deadline = self.now + max(seconds, 0)
+        while True:
+            with self._lock:
+                if not self._timers or self._timers[0][0] > deadline:
+                    break
+                when, _, callback, args = heapq.heappop(self._timers)
+                self.now = max(self.now, when)
+            callback(*args)
+        self.now = deadline
+
+    def sleep(self, seconds):
+        """
+        Wait for some time; advances the clock
+
+        Parameters:
+            seconds (float): time to wait in seconds
+
+        Returns:
+            Nothing
+        """
+        self.advance(seconds)
+
+    def wait_until(self, predicate, timeout):
+        """
+        Advance the clock from timer to timer until a condition holds
+
+        Without timeout the clock stops at the last timer, because nothing
+        can change anymore.
+
+        Parameters:
+            predicate (function): condition; called without arguments
+            timeout (float or None): maximum time to wait in seconds. If
+                ``None`` wait until no timer is left.
+
+        Returns:
+            result: last result of ``predicate``
+        """
+        deadline = None if None == timeout else self.now + timeout
+        while True:
+            result = predicate()
+            if result:
+                return result
+            with self._lock:
+                if (not self._timers or
+                        (None != deadline and self._timers[0][0] > deadline)):
+                    break
+                when = self._timers[0][0]
+            self.advance(when - self.now)
+
+        if None != deadline:
+            self.advance(deadline - self.now)
+        return predicate()
+
+    def wait_readable(self, device, timeout):
+        """
+        Wait until data from a serial device is pending
+
+        Parameters:
+            device (device): serial device
+            timeout (float or None): maximum time to wait in seconds
+
+        Returns:
+            readable (bool): ``True`` if data can be read
+        """
+        return bool(self.wait_until(lambda: device.in_waiting, timeout))
+
+    def select(self, selector, timeout):
+        """
+        Wait until a file object registered with a selector is ready
+
+        Parameters:
+            selector (selectors.BaseSelector): selector
+            timeout (float or None): maximum time to wait in seconds
+
+        Returns:
+            ready (list): ``(key, events)`` tuples as returned by
+                ``selector.select()``
+        """
+        return self.wait_until(lambda: selector.select(0), timeout)
@@ -0,0 +1,242 @@
+# Commands of the Elechouse Voice Recognition Module V3*. Protocol definition
+# see:
+# https://github.com/elechouse/VoiceRecognitionV3#protocol
+#
+# Every command is structured as following:
+#
+# |\xaa|[len]|[cmd]|[data]|\x0a|
+#
+# ``[len]`` is computed by the length in bytes of ``[len]`` itself (always 1)
+# plus the length of ``[cmd]`` and ``[data]``. Commands without parameters
+# never change; they are compiled once when the module is imported. Commands
+# with parameters are compiled by builder functions allocating the command in
+# one go. The builders do not check their arguments; this is done by the
+# methods of the drivers.
+
+# Commands without parameters
+cmd_check_system_settings = b'\xaa\x02\x00\x0a'         # 00
+cmd_check_recognizer = b'\xaa\x02\x01\x0a'              # 01
+cmd_check_train_status_all = b'\xaa\x03\x02\xff\x0a'    # 02 (all records)
+cmd_restore_system_settings = b'\xaa\x02\x10\x0a'       # 10
+cmd_reset_output_io_all = b'\xaa\x02\x14\x0a'           # 14 (all pins)
+cmd_clear_recognizer = b'\xaa\x02\x31\x0a'              # 31
+cmd_check_user_group_all = b'\xaa\x04\x32\x04\xff\x0a'  # 32 04 (all groups)
+
+def build_check_train_status(record=None):
+    """
+    Check record train status (02)
+
+    Parameters:
+        record (int or None): record number. If ``None`` all records.
+
+    Returns:
+        command (bytes): compiled command
+    """
+    if None == record:
+        return cmd_check_train_status_all
+    return b'\xaa\x03\x02%c\x0a' % record
+
+def build_check_signature(record):
+    """
+    Check signature of record (03)
+
+    Parameters:
+        record (int): record number
+
+    Returns:
+        command (bytes): compiled command
+    """
+    return b'\xaa\x03\x03%c\x0a' % record
+
+def build_set_baudrate(code):
+    """
+    Set baud rate (11)
+
+    Parameters:
+        code (int): index of the baud rate in ``br_conv``
+
+    Returns:
+        command (bytes): compiled command
+    """
+    return b'\xaa\x03\x11%c\x0a' % code
+
+def build_set_output_io_mode(code):
+    """
+    Set output IO mode (12)
+
+    Parameters:
+        code (int): index of the mode in ``iomode_conv``
+
+    Returns:
+        command (bytes): compiled command
+    """
+    return b'\xaa\x03\x12%c\x0a' % code
+
+def build_set_output_io_pulse_width(code):
+    """
+    Set output IO pulse width (13)
+
+    Parameters:
+        code (int): index of the pulse width in ``iopw_conv``
+
+    Returns:
+        command (bytes): compiled command
+    """
+    return b'\xaa\x03\x13%c\x0a' % code
+
+def build_reset_output_io(pins):
+    """
+    Reset output IO (14)
+
+    Parameters:
+        pins (list of int): output IO pins to be resetted
+
+    Returns:
+        command (bytes): compiled command
+    """
+    return b'\xaa%c\x14%s\x0a' % (2 + len(pins), bytes(pins))
+
+def build_set_power_on_auto_load(bitmap, records):
+    """
+    Set power on auto load (15)
+
+    Parameters:
+        bitmap (int): bitmap of the records to load. 0 disables auto load.
+        records (list of int): records loaded at power on
+
+    Returns:
+        command (bytes): compiled command
+    """
+    return b'\xaa%c\x15%c%s\x0a' % (3 + len(records), bitmap, bytes(records))
+
+def build_train(record, signature=None):
+    """
+    Train record without (20) or with signature (21)
+
+    Parameters:
+        record (int): record number
+        signature (str or None): signature for the record
+
+    Returns:
+        command (bytes): compiled command
+    """
+    if None == signature:
+        return b'\xaa\x03\x20%c\x0a' % record
+    sig = signature.encode("latin-1")
+    return b'\xaa%c\x21%c%s\x0a' % (3 + len(sig), record, sig)
+
+def build_set_signature(record, signature):
+    """
+    Set signature of record (22)
+
+    Parameters:
+        record (int): record number
+        signature (str): signature for the record. An empty string deletes
+            the signature.
+
+    Returns:
+        command (bytes): compiled command
+    """
+    sig = signature.encode("latin-1")
+    return b'\xaa%c\x22%c%s\x0a' % (3 + len(sig), record, sig)
+
+def build_load(records):
+    """
+    Load records to recognizer (30)
+
+    Parameters:
+        records (list of int): record numbers
+
+    Returns:
+        command (bytes): compiled command
+    """
+    return b'\xaa%c\x30%s\x0a' % (2 + len(records), bytes(records))
+
+def build_set_group_control(mode):
+    """
+    Set group control by external IO (32 00)
+
+    Parameters:
+        mode (int): 0 disabled, 1 system group, 2 user group, 255 check
+
+    Returns:
+        command (bytes): compiled command
+    """
+    return b'\xaa\x04\x32\x00%c\x0a' % mode
+
+def build_load_system_group(group):
+    """
+    Load system group to recognizer (32 01)
+
+    Parameters:
+        group (int): system group number
+
+    Returns:
+        command (bytes): compiled command
+    """
+    return b'\xaa\x04\x32\x01%c\x0a' % group
+
+def build_set_user_group(group, records):
+    """
+    Set records of user group (32 02)
+
+    Parameters:
+        group (int): user group number
+        records (list of int): records of the group (max 7)
+
+    Returns:
+        command (bytes): compiled command
+    """
+    return b'\xaa%c\x32\x02%c%s\x0a' % (4 + len(records), group,
+            bytes(records))
+
+def build_load_user_group(group):
+    """
+    Load user group to recognizer (32 03)
+
+    Parameters:
+        group (int): user group number
+
+    Returns:
+        command (bytes): compiled command
+    """
+    return b'\xaa\x04\x32\x03%c\x0a' % group
+
+def build_check_user_group(group=None):
+    """
+    Check user group (32 04)
+
+    Parameters:
+        group (int or None): user group number. If ``None`` all groups.
+
+    Returns:
+        command (bytes): compiled command
+    """
+    if None == group:
+        return cmd_check_user_group_all
+    return b'\xaa\x04\x32\x04%c\x0a' % group
+
+# Command table: command byte (group control: command byte and sub-command)
+# -> compiled command or builder
+command_table = {
+        0x00: cmd_check_system_settings,
+        0x01: cmd_check_recognizer,
+        0x02: build_check_train_status,
+        0x03: build_check_signature,
+        0x10: cmd_restore_system_settings,
+        0x11: build_set_baudrate,
+        0x12: build_set_output_io_mode,
+        0x13: build_set_output_io_pulse_width,
+        0x14: build_reset_output_io,
+        0x15: build_set_power_on_auto_load,
+        0x20: build_train,
+        0x21: build_train,
+        0x22: build_set_signature,
+        0x30: build_load,
+        0x31: cmd_clear_recognizer,
+        (0x32, 0x00): build_set_group_control,
+        (0x32, 0x01): build_load_system_group,
+        (0x32, 0x02): build_set_user_group,
+        (0x32, 0x03): build_load_user_group,
+        (0x32, 0x04): build_check_user_group,
+        }
@@ -0,0 +1,360 @@
+# Decoders for the messages (frames) sent by the Elechouse Voice Recognition
+# Module V3*. Protocol definition see:
+# https://github.com/elechouse/VoiceRecognitionV3#protocol
+#
+# The registry ``decoder_registry`` maps the command byte of a message (third byte)
+# to the function decoding it, so any message received from the module can
+# be decoded with a single lookup (see ``decode_frame()``). Status codes are
+# translated with lookup tuples indexed by the byte value.
+
+from operator import itemgetter
+
+from .results import SystemSettings, RecognizerStatus, TrainStatus
+from .results import LoadResult, RecognitionEvent
+
+# List to convert hex value for IO pulse width to milliseconds
+iopw_conv = (10, 15, 20, 25, 30, 35, 40, 45, 50, 75, 100,
+        100, 300, 400, 500, 1000)
+
+# List to convert hex values for baudrate values
+br_conv = (9600, 2400, 4800, 9600, 19200, 38400)
+
+# List to convert hex values for output IO mode
+iomode_conv = ("pulse", "toggle", "set", "clear")
+
+def _lookup(values, default=None):
+    """
+    Compiles a lookup tuple for all byte values
+
+    Parameters:
+        values (dict or sequence): value for the byte values known
+        default: value for all other byte values
+
+    Returns:
+        lookup (tuple): 256 values indexed by the byte value
+    """
+    if not isinstance(values, dict):
+        values = dict(enumerate(values))
+    return tuple(values.get(i, default) for i in range(256))
+
+# Lookup tuples for the fields of the system settings (00)
+settings_trained_lookup = _lookup({
+        0: (False, False),
+        1: (True, False),
+        255: (None, True),
+        }, (None, None))        # (trained, record value out of range)
+br_lookup = _lookup(br_conv)
+iomode_lookup = _lookup(iomode_conv)
+iopw_lookup = _lookup(iopw_conv)
+autoload_lookup = _lookup({0: False, 1: True})
+group_control_lookup = _lookup({
+        0: "disabled",
+        1: "system group",
+        2: "user group",
+        })
+
+# Lookup tuple for the group mode of the recognizer (01, 0d)
+group_mode_lookup = _lookup({
+        255: "not in group mode",
+        135: "user group mode",
+        })
+
+# Lookup tuple for the train status of a record (02)
+train_status_lookup = _lookup({
+        0: "untrained",
+        1: "trained",
+        255: "out of range",
+        }, "unknown")
+
+# Lookup tuple for the status of a record loaded to the recognizer (30)
+load_status_lookup = _lookup({
+        0: "success",
+        255: "out of range",
+        254: "record untrained",
+        253: "recognizer full",
+        252: "already in recognizer",
+        }, "unknown")
+
+def _signature(data):
+    """
+    Converts the bytes of a signature to a string
+
+    Parameters:
+        data (memoryview): signature bytes
+
+    Returns:
+        signature (str or None): signature. ``None`` if empty.
+    """
+    if 0 == len(data):
+        return None
+    return bytes(data).decode("latin-1")
+
+def _pairs_end(frame):
+    """
+    Returns the end of the record/status pairs of a message (02, 30)
+
+    |\\xaa|[len]|[cmd]|[n]|[rec]|[sta]|...|[rec]|[sta]|\\x0a|
+
+    Parameters:
+        frame (Frame): message from the module
+
+    Returns:
+        end (int): index behind the last complete pair
+    """
+    return 4 + 2 * ((len(frame) - 5) // 2)
+
+def _frame(frame):
+    return frame
+
+# Decoders for the fields of the system settings (00):
+# |\xaa|\x08|\x00|[sta]|[br]|[iom]|[iopw]|[al]|[grp]|\x0a|
+settings_fields = {
+        "raw": _frame,
+        "trained": lambda frame: settings_trained_lookup[frame[3]][0],
+        "rec_value_out_of_range":
+                lambda frame: settings_trained_lookup[frame[3]][1],
+        "baudrate": lambda frame: br_lookup[frame[4]],
+        "output_io_mode": lambda frame: iomode_lookup[frame[5]],
+        "output_io_pulse_width_ms": lambda frame: iopw_lookup[frame[6]],
+        "autoload": lambda frame: autoload_lookup[frame[7]],
+        "group_control": lambda frame: group_control_lookup[frame[8]],
+        }
+
+# Decoders for the fields of the recognizer status (01):
+# |\xaa|\x0b|\x01|[rvn]|[vr0]|...|[vr6]|[grpm]|\x0a|
+recognizer_fields = {
+        "raw": _frame,
+        "no_records_in_recognizer": itemgetter(3),
+        "records_in_recognizer": lambda frame: list(frame[4:11]),
+        "group_mode": lambda frame: group_mode_lookup[frame[11]],
+        }
+
+# Decoders for the fields of a recognition (0d):
+# |\xaa|[len]|\x0d|\x00|[grpm]|[rec]|[idx]|[siglen]|[sig]|\x0a|
+recognition_fields = {
+        "raw": _frame,
+        "recognized_record": itemgetter(5),
+        "index_recognized_record": itemgetter(6),
+        "signature_recognized_record": lambda frame: _signature(frame[8:-1]),
+        "group_mode": lambda frame: group_mode_lookup[frame[4]],
+        }
+
+def decode_system_settings(frame):
+    """
+    Decodes the system settings (00)
+
+    The fields are decoded on first access (see ``LazyResult``).
+
+    Parameters:
+        frame (Frame): message from the module
+
+    Returns:
+        response (SystemSettings): decoded message
+    """
+    return SystemSettings(frame, settings_fields)
+
+def decode_recognizer(frame):
+    """
+    Decodes the status of the recognizer (01)
+
+    The fields are decoded on first access (see ``LazyResult``).
+
+    Parameters:
+        frame (Frame): message from the module
+
+    Returns:
+        response (RecognizerStatus): decoded message
+    """
+    return RecognizerStatus(frame, recognizer_fields)
+
+def decode_train_status(frame):
+    """
+    Decodes the train status of records (02)
+
+    Parameters:
+        frame (Frame): message from the module
+
+    Returns:
+        response (TrainStatus): decoded message
+    """
+    end = _pairs_end(frame)
+    return TrainStatus(
+            raw = frame,
+            no_trained_records = frame[3],
+            trained_records = list(frame[4:end:2]),
+            train_status = [train_status_lookup[s] for s in frame[5:end:2]],
+            )
+
+def decode_signature(frame):
+    """
+    Decodes the signature of a record (03)
+
+    |\\xaa|[len]|\\x03|[rec]|[siglen]|[sig]|\\x0a|
+
+    Parameters:
+        frame (Frame): message from the module
+
+    Returns:
+        response (dict): decoded message
+    """
+    return {
+            "raw": frame,
+            "record": frame[3],
+            "signature": _signature(frame[5:-1]),
+            }
+
+def decode_prompt(frame):
+    """
+    Decodes a prompt of the training dialog (0a)
+
+    |\\xaa|[len]|\\x0a|[rec]|[prompt]|\\x0a|
+
+    Parameters:
+        frame (Frame): message from the module
+
+    Returns:
+        response (dict): decoded message
+    """
+    return {
+            "raw": frame,
+            "record": frame[3],
+            "prompt": bytes(frame[4:-1]).decode("latin-1"),
+            }
+
+def decode_recognition(frame):
+    """
+    Decodes a recognition (0d)
+
+    The time of the recognition and the records in the recognizer are not
+    part of the message and are ``None``. The other fields are decoded on
+    first access (see ``LazyResult``).
+
+    Parameters:
+        frame (Frame): message from the module
+
+    Returns:
+        response (RecognitionEvent): decoded message
+    """
+    return RecognitionEvent(frame, recognition_fields,
+            time_passed_ms = None, records_in_recognizer = None)
+
+def decode_train_result(frame):
+    """
+    Decodes the result of a training (20, 21)
+
+    |\\xaa|[len]|[cmd]|[num]|[rec]|[sta]|[sig]|\\x0a|
+
+    Parameters:
+        frame (Frame): message from the module
+
+    Returns:
+        response (dict): decoded message
+    """
+    return {
+            "raw": frame,
+            "record": frame[4],
+            "signature": _signature(frame[6:-1]),
+            "training_status": frame[5],
+            }
+
+def decode_load(frame):
+    """
+    Decodes the status of records loaded to the recognizer (30)
+
+    Parameters:
+        frame (Frame): message from the module
+
+    Returns:
+        response (LoadResult): decoded message
+    """
+    end = _pairs_end(frame)
+    return LoadResult(
+            raw = frame,
+            no_records_in_recognizer = frame[3],
+            records_in_recognizer = list(frame[4:end:2]),
+            status = [load_status_lookup[s] for s in frame[5:end:2]],
+            )
+
+def decode_ack(frame):
+    """
+    Decodes any other message, e.g. the acknowledgement of a command
+
+    Parameters:
+        frame (Frame): message from the module
+
+    Returns:
+        response (dict): command byte and data of the message
+    """
+    return {
+            "raw": frame,
+            "cmd": frame[2],
+            "data": bytes(frame[3:-1]),
+            }
+
+# Registry: command byte of the message -> decoder
+decoder_registry = {
+        0x00: decode_system_settings,
+        0x01: decode_recognizer,
+        0x02: decode_train_status,
+        0x03: decode_signature,
+        0x0a: decode_prompt,
+        0x0d: decode_recognition,
+        0x20: decode_train_result,
+        0x21: decode_train_result,
+        0x30: decode_load,
+        }
+
+def decode_frame(frame):
+    """
+    Decodes any message received from the module
+
+    Parameters:
+        frame (Frame): message from the module
+
+    Returns:
+        response: decoded message. Messages without decoder in ``decoder_registry``
+            (acknowledgements, errors) are decoded by ``decode_ack()``.
+    """
+    return decoder_registry.get(frame[2], decode_ack)(frame)
+
+# Fields of the responses with record/status pairs (command byte -> number
+# of records, records, status)
+record_fields = {
+        0x02: ("no_trained_records", "trained_records", "train_status"),
+        0x30: ("no_records_in_recognizer", "records_in_recognizer", "status"),
+        }
+
+def decode_records(frames, cmd):
+    """
+    Decodes a response of several messages with record/status pairs (02, 30)
+
+    The module can split the pairs over several messages. The pairs of all
+    messages of type ``cmd`` are joined; the number of records is taken from
+    the last message.
+
+    Parameters:
+        frames (list of Frame): messages from the module
+        cmd (int): command byte of the messages (0x02 or 0x30)
+
+    Returns:
+        response (TrainStatus or LoadResult): decoded response. ``raw`` is
+            the list of messages.
+    """
+    decoder = decoder_registry[cmd]
+    n, records, status = record_fields[cmd]
+    result = None
+    for frame in frames:
+        if cmd != frame[2]:
+            continue
+        part = decoder(frame)
+        if None == result:
+            result = part
+        else:
+            # Join the lists of records and status
+            setattr(result, n, getattr(part, n))
+            getattr(result, records).extend(getattr(part, records))
+            getattr(result, status).extend(getattr(part, status))
+
+    if None != result:
+        result.raw = frames
+    return result
@@ -0,0 +1,631 @@
+import collections
+import concurrent.futures
+import os
+import queue
+import selectors
+import threading
+
+from .clock import system_clock
+from .pvr3 import PyVoiceRecognitionV3Base
+
+class BadDevice(Exception):
+    """
+    Raised when a device cannot be registered with a ``DeviceManager`` (name
+    already in use or serial device without file descriptor).
+    """
+    pass
+
+class ManagedVoiceRecognitionV3(PyVoiceRecognitionV3Base):
+    """
+    Handle for a module registered with a ``DeviceManager``
+
+    The handle offers the commands of ``PyVoiceRecognitionV3Base``. Instead
+    of blocking, every command is queued for the device and a
+    ``concurrent.futures.Future`` is returned. The future resolves to the
+    response dictionary once the manager's loop received the response:
+
+        future = mgr.device("kitchen").check_recognizer()
+        response = mgr.wait(future)
+    """
+    def __init__(self, manager, name, device, tout=10, latency=50,
+            records=None, keep_raw=True):
+        """
+        Create a handle; done by ``DeviceManager.register()``
+
+        Parameters:
+            manager (DeviceManager): manager driving the device
+            name (str): name of the device in the manager
+            device (device): serial device
+            tout (int): timeout for the serial communication in milliseconds
+                (ms)
+            latency (int): latency for the response from the module in
+                milliseconds (ms)
+            records (int or None): number of record slots of the module
+                (V3: 80, V3.1: 255). If ``None`` unknown.
+            keep_raw (bool): if ``False`` results do not keep the raw
+                messages from the module. All fields are decoded right away
+                and the messages are dropped.
+
+        Returns:
+            Nothing
+        """
+
+        super().__init__(device = device, tout = tout, latency = latency,
+                records = records, keep_raw = keep_raw)
+
+        self.manager = manager
+        self.name = name
+
+        # Commands waiting to be sent and the command in flight
+        self._commands = collections.deque()
+        self._inflight = None
+
+        # File descriptor and read timeout of the serial device before it
+        # was registered
+        self._fd = None
+        self._timeout = None
+
+        # Last known status of the recognizer. Recognition events are
+        # completed with it.
+        self.status_recognizer = {
+                "records_in_recognizer": None,
+                "group_mode": None,
+                }
+
+    def _execute(self, command, expect, parse, *args):
+        """
+        Queue a command for the device
+
+        See ``PyVoiceRecognitionV3Base._execute()``.
+
+        Parameters:
+            command (bytearray): command to be sent to the module
+            expect (callable): expected response (e.g. ``ExpectFrames``)
+            parse (callable): method interpreting the response
+            args: additional arguments for ``parse``
+
+        Returns:
+            future (concurrent.futures.Future): resolves to the return value
+                of ``parse``
+        """
+
+        future = concurrent.futures.Future()
+        self._commands.append((command, expect, parse, args, future))
+        self.manager._wakeup()
+        return future
+
+    def send_cmd(self, command, expect=None):
+        """
+        Queue a raw command for the device
+
+        Parameters:
+            command (bytearray): command to be sent to the module
+            expect (callable or None): expected response. If ``None`` wait
+                until the line becomes quiet.
+
+        Returns:
+            future (concurrent.futures.Future): resolves to the list of
+                response messages (or ``None``)
+        """
+
+        return self._execute(command, expect, lambda messages: messages)
+
+    def _parse_check_recognizer(self, response_bin):
+        """
+        Interprets the response to ``check_recognizer()`` and remembers the
+        status of the recognizer for the recognition events
+
+        Parameters:
+            response_bin (list of Frame or None): response messages
+                from the module
+
+        Returns:
+            response (dict): dictionary containing the response
+                from the voice recognition module
+        """
+
+        response_dict = super()._parse_check_recognizer(response_bin)
+        if None != response_dict:
+            self.status_recognizer = response_dict
+        return response_dict
+
+class DeviceManager:
+    """
+    Drive many Voice Recognition Modules V3 from a single loop
+
+    All registered serial devices are multiplexed with one ``selectors``
+    loop (epoll on Linux). Every device has its own frame decoder and
+    command queue. Recognitions of all devices are merged into one event
+    stream, each event tagged with the name of the device:
+
+        mgr = DeviceManager()
+        mgr.register("kitchen", Serial("/dev/ttyUSB0", 9600))
+        mgr.register("garage", Serial("/dev/ttyUSB1", 9600))
+        mgr.wait(mgr.device("garage").load_to_recognizer(3, 4))
+        for name, event in mgr.events():
+            print(name, event["recognized_record"])
+
+    The loop runs in the thread calling ``poll()``, ``wait()`` or
+    ``events()``, or in one background thread started with ``start()``.
+    Either way the number of threads does not grow with the number of
+    modules.
+    """
+    def __init__(self, tout=10, latency=50, clock=None):
+        """
+        Create an instance of class ``DeviceManager``
+
+        Parameters:
+            tout (int): default timeout for the serial communication in
+                milliseconds (ms)
+            latency (int): default latency for the response from the modules
+                in milliseconds (ms)
+            clock (clock or None): clock measuring time and waiting for the
+                devices (see ``SystemClock``). If ``None`` the clock of the
+                operating system.
+
+        Returns:
+            Nothing
+        """
+
+        self.tout = tout
+        self.latency = latency
+        self.clock = clock or system_clock
+
+        self._selector = selectors.DefaultSelector()
+        self._devices = {}
+
+        # Guards the devices and the selector. Devices can be registered
+        # from another thread while the loop runs; the loop does not hold
+        # the lock while it waits in select().
+        self._lock = threading.RLock()
+
+        # Merged recognition events (name, event) of all devices
+        self._events = queue.Queue()
+
+        # Time the manager was created; reference of time_passed_ms
+        self._start = self.clock.monotonic()
+
+        # Pipe to wake up the loop when commands are queued from another
+        # thread
+        self._wakeup_r, self._wakeup_w = os.pipe()
+        os.set_blocking(self._wakeup_r, False)
+        os.set_blocking(self._wakeup_w, False)
+        self._selector.register(self._wakeup_r, selectors.EVENT_READ, None)
+
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    def register(self, name, device, tout=None, latency=None,
+            records=None, keep_raw=True):
+        """
+        Register a serial device
+
+        Parameters:
+            name (str): name of the device. Used to tag its events.
+            device (device): serial device. It must provide a file
+                descriptor (``fileno()``).
+            tout (int or None): timeout for the serial communication in
+                milliseconds (ms). If ``None`` the manager's default is used.
+            latency (int or None): latency for the response from the module
+                in milliseconds (ms). If ``None`` the manager's default is
+                used.
+            records (int or None): number of record slots of the module
+                (V3: 80, V3.1: 255). If ``None`` unknown.
+            keep_raw (bool): if ``False`` results do not keep the raw
+                messages from the module. All fields are decoded right away
+                and the messages are dropped.
+
+        Returns:
+            handle (ManagedVoiceRecognitionV3): handle to issue commands
+
+        Raises:
+            BadDevice: name already in use or device without file descriptor
+        """
+
+        try:
+            fd = device.fileno()
+        except (AttributeError, OSError, ValueError) as e:
+            raise BadDevice("device without file descriptor") from e
+
+        if None == tout:
+            tout = self.tout
+        if None == latency:
+            latency = self.latency
+
+        handle = ManagedVoiceRecognitionV3(self, name, device,
+                tout = tout, latency = latency, records = records,
+                keep_raw = keep_raw)
+
+        with self._lock:
+            if name in self._devices:
+                raise BadDevice("name already in use")
+            # The selector tells when data is available; reads must never
+            # block. The timeout of the port is restored by unregister().
+            handle._fd = fd
+            handle._timeout = device.timeout
+            device.timeout = 0
+            self._devices[name] = handle
+            self._selector.register(fd, selectors.EVENT_READ, handle)
+
+        # Let a loop waiting in select() pick up the device
+        self._wakeup()
+
+        return handle
+
+    def unregister(self, name):
+        """
+        Remove a device from the manager
+
+        Commands still queued for the device are cancelled. The read timeout
+        of the serial device is restored.
+
+        Parameters:
+            name (str): name of the device
+
+        Returns:
+            Nothing
+        """
+
+        self._remove(name)
+
+    def _remove(self, name, error=None):
+        """
+        Remove a device and end its commands
+
+        Parameters:
+            name (str): name of the device
+            error (Exception or None): exception the commands of the device
+                fail with. If ``None`` the commands are cancelled.
+
+        Returns:
+            Nothing
+        """
+
+        def end(future):
+            if None == error:
+                future.cancel()
+            elif not future.done():
+                future.set_exception(error)
+
+        with self._lock:
+            handle = self._devices.pop(name)
+            self._selector.unregister(handle._fd)
+            handle.ser.timeout = handle._timeout
+            if None != handle._inflight:
+                end(handle._inflight["future"])
+                handle._inflight = None
+            while handle._commands:
+                end(handle._commands.popleft()[4])
+
+    def device(self, name):
+        """
+        Returns the handle of a registered device
+
+        Parameters:
+            name (str): name of the device
+
+        Returns:
+            handle (ManagedVoiceRecognitionV3): handle to issue commands
+        """
+        with self._lock:
+            return self._devices[name]
+
+    def devices(self):
+        """
+        Returns the names of all registered devices
+
+        Parameters:
+            None
+
+        Returns:
+            names (list of str): names of the devices
+        """
+        with self._lock:
+            return list(self._devices)
+
+    def _wakeup(self):
+        """
+        Wake up the loop blocking in ``select()``
+
+        Parameters:
+            None
+
+        Returns:
+            Nothing
+        """
+        try:
+            os.write(self._wakeup_w, b'\x00')
+        except BlockingIOError:
+            # Pipe full; the loop will wake up anyway
+            pass
+
+    def _start_command(self, handle, now):
+        """
+        Send the next queued command of a device
+
+        Parameters:
+            handle (ManagedVoiceRecognitionV3): device
+            now (float): current time in seconds
+
+        Returns:
+            Nothing
+        """
+
+        while handle._commands:
+            command, expect, parse, args, future = handle._commands.popleft()
+            if future.set_running_or_notify_cancel():
+                break
+        else:
+            return
+
+        # The input is not flushed: it may hold recognitions
+        handle.ser.write(command)
+        handle._inflight = {
+                "expect": expect,
+                "parse": parse,
+                "args": args,
+                "future": future,
+                "messages": [],
+                # For the first byte of the response allow the latency
+                "deadline": now + handle.latency / 1000.,
+                }
+
+    def _finish_command(self, handle):
+        """
+        Resolve the future of the command in flight
+
+        Parameters:
+            handle (ManagedVoiceRecognitionV3): device
+
+        Returns:
+            Nothing
+        """
+
+        inflight = handle._inflight
+        handle._inflight = None
+
+        messages = inflight["messages"]
+        if [] == messages:
+            messages = None
+        # A malformed response fails the command, not the loop
+        try:
+            result = inflight["parse"](messages, *inflight["args"])
+        except (IndexError, KeyError, TypeError, ValueError) as e:
+            inflight["future"].set_exception(e)
+        else:
+            inflight["future"].set_result(result)
+
+    def _read(self, handle, now):
+        """
+        Read pending data of a device and route the completed messages
+
+        Recognitions (0d) are put into the merged event stream, all other
+        messages belong to the command in flight. If reading fails, the
+        device is removed and its commands fail with the exception; the
+        other devices are not affected.
+
+        Parameters:
+            handle (ManagedVoiceRecognitionV3): device
+            now (float): current time in seconds
+
+        Returns:
+            Nothing
+        """
+
+        # SerialException of pyserial is an OSError
+        ser = handle.ser
+        try:
+            data = ser.read(max(ser.in_waiting, 1))
+        except (OSError, ValueError) as e:
+            self._remove(handle.name, e)
+            return
+
+        for frame in handle._decoder.feed(data):
+            if 13 == frame[2]:      # \x0d
+                event = handle._recognition_dict(frame,
+                        1000 * (now - self._start), handle.status_recognizer)
+                self._events.put((handle.name, event))
+            elif None != handle._inflight:
+                inflight = handle._inflight
+                inflight["messages"].append(frame)
+                expect = inflight["expect"]
+                if None != expect and expect(inflight["messages"]):
+                    self._finish_command(handle)
+
+        # Data keeps the command in flight alive for another timeout
+        if data and None != handle._inflight:
+            handle._inflight["deadline"] = now + handle.tout / 1000.
+
+    def poll(self, timeout=None):
+        """
+        Run one iteration of the loop
+
+        Sends queued commands, waits until a device has data or a command
+        times out, and processes what happened.
+
+        Parameters:
+            timeout (int or None): maximum time to wait in milliseconds (ms).
+                If ``None`` wait until something happens.
+
+        Returns:
+            Nothing
+        """
+
+        with self._lock:
+            now = self.clock.monotonic()
+            handles = list(self._devices.values())
+            for handle in handles:
+                if None == handle._inflight:
+                    self._start_command(handle, now)
+
+            # Do not sleep past the deadline of a command in flight
+            deadlines = [h._inflight["deadline"] for h in handles
+                    if None != h._inflight]
+            if None != timeout:
+                deadlines.append(now + timeout / 1000.)
+            wait = max(min(deadlines) - now, 0) if deadlines else None
+
+        ready = self.clock.select(self._selector, wait)
+
+        with self._lock:
+            now = self.clock.monotonic()
+            for key, _ in ready:
+                if None == key.data:
+                    # Wakeup pipe; new commands are started next iteration
+                    try:
+                        while os.read(self._wakeup_r, 512):
+                            pass
+                    except BlockingIOError:
+                        pass
+                elif key.data is self._devices.get(key.data.name):
+                    # Skip devices unregistered while waiting
+                    self._read(key.data, now)
+
+            for handle in list(self._devices.values()):
+                if (None != handle._inflight
+                        and now >= handle._inflight["deadline"]):
+                    self._finish_command(handle)
+                if None == handle._inflight:
+                    self._start_command(handle, now)
+
+    def wait(self, future, timeout=None):
+        """
+        Wait for the result of a command
+
+        If the loop is not running in a background thread, it is driven by
+        this call until the command finished.
+
+        Parameters:
+            future (concurrent.futures.Future): returned by a command
+            timeout (int or None): maximum time to wait in milliseconds (ms).
+                If ``None`` wait until the command finished.
+
+        Returns:
+            response: result of the command
+
+        Raises:
+            concurrent.futures.TimeoutError: command not finished in time
+        """
+
+        if None != self._thread:
+            return future.result(None if None == timeout else timeout / 1000.)
+
+        start = self.clock.monotonic()
+        while not future.done():
+            remaining = None
+            if None != timeout:
+                remaining = timeout - 1000 * (self.clock.monotonic() - start)
+                if remaining <= 0:
+                    raise concurrent.futures.TimeoutError
+            self.poll(remaining)
+        return future.result()
+
+    def events(self, timeout=None, max_events=None):
+        """
+        Iterate over the recognitions of all devices
+
+        Yields tuples ``(name, event)`` with the name of the device and a
+        dictionary as described in ``PyVoiceRecognitionV3.record_recognized()``.
+        ``time_passed_ms`` counts from the creation of the manager. If the
+        loop is not running in a background thread, it is driven by the
+        iteration.
+
+        Parameters:
+            timeout (int or None): Time in milliseconds after which the
+                iteration ends. If ``None`` there is no time limit.
+            max_events (int or None): Number of events after which the
+                iteration ends. If ``None`` there is no limit.
+
+        Returns:
+            events (iterator of tuple): (name, event)
+        """
+
+        n_events = 0
+        start = self.clock.monotonic()
+        while None == max_events or n_events < max_events:
+            remaining = None
+            if None != timeout:
+                remaining = timeout - 1000 * (self.clock.monotonic() - start)
+                if remaining <= 0:
+                    return
+
+            try:
+                if None != self._thread:
+                    event = self._events.get(timeout = None if None == remaining
+                            else remaining / 1000.)
+                else:
+                    event = self._events.get_nowait()
+            except queue.Empty:
+                if None == self._thread:
+                    self.poll(remaining)
+                continue
+
+            n_events += 1
+            yield event
+
+    def start(self):
+        """
+        Run the loop in a background thread
+
+        Parameters:
+            None
+
+        Returns:
+            Nothing
+        """
+
+        if None == self._thread:
+            self._stop_event.clear()
+            self._thread = threading.Thread(target = self._run,
+                    name = "DeviceManager", daemon = True)
+            self._thread.start()
+
+    def _run(self):
+        """
+        Body of the background thread
+
+        Parameters:
+            None
+
+        Returns:
+            Nothing
+        """
+        while not self._stop_event.is_set():
+            self.poll()
+
+    def stop(self):
+        """
+        Stop the background thread
+
+        Parameters:
+            None
+
+        Returns:
+            Nothing
+        """
+
+        if None != self._thread:
+            self._stop_event.set()
+            self._wakeup()
+            self._thread.join()
+            self._thread = None
+
+    def close(self):
+        """
+        Stop the loop and release all resources
+
+        The serial devices are not closed.
+
+        Parameters:
+            None
+
+        Returns:
+            Nothing
+        """
+
+        self.stop()
+        for name in self.devices():
+            self.unregister(name)
+        self._selector.close()
+        os.close(self._wakeup_r)
+        os.close(self._wakeup_w)
@@ -0,0 +1,324 @@
+# Framing of the messages exchanged with the Elechouse Voice Recognition
+# Module V3*. Protocol definition see:
+# https://github.com/elechouse/VoiceRecognitionV3#protocol
+
+# Frame head and frame end of every message
+frame_head = 0xaa
+frame_end = 0x0a
+
+# Range of the length field of the messages sent by the module. Every
+# message holds a command byte; the longest one is the train status of all
+# 80 records (command, count and 80 record/status pairs). A frame head
+# followed by a length outside this range cannot start a message.
+frame_min_len = 2
+frame_max_len = 3 + 2 * 80
+
+class Frame:
+    """
+    A message (frame) received from the module
+
+    The frame is a read-only view into the chunk of the byte stream it was
+    decoded from; no bytes are copied. Indexing returns the byte values,
+    slicing returns ``memoryview`` objects, and a frame compares equal to
+    ``bytes``/``bytearray`` with the same content:
+
+        frame.cmd           # command byte, e.g. 0x0d for a recognition
+        frame.payload       # bytes between command byte and frame end
+        frame[5]            # single byte
+        bytes(frame)        # copy of the complete frame
+
+    The view keeps the whole chunk alive. Use ``tobytes()`` to keep a frame
+    longer than the chunk is needed.
+    """
+    __slots__ = ("_view",)
+
+    def __init__(self, data):
+        """
+        Initialize instance
+
+        Parameters:
+            data (bytes, bytearray or memoryview): complete frame (incl. frame
+                head and frame end)
+
+        Returns:
+            Nothing
+        """
+        if not isinstance(data, memoryview):
+            data = memoryview(bytes(data))
+        self._view = data
+
+    @property
+    def cmd(self):
+        """
+        Command byte of the frame (message type)
+        """
+        return self._view[2]
+
+    @property
+    def length(self):
+        """
+        Length field of the frame (``len(frame) - 3``)
+        """
+        return self._view[1]
+
+    @property
+    def payload(self):
+        """
+        Data of the frame following the command byte (memoryview)
+        """
+        return self._view[3:-1]
+
+    def tobytes(self):
+        """
+        Returns a copy of the complete frame
+
+        Parameters:
+            None
+
+        Returns:
+            data (bytes): the frame (incl. frame head and frame end)
+        """
+        return self._view.tobytes()
+
+    def __bytes__(self):
+        return self._view.tobytes()
+
+    def __len__(self):
+        return len(self._view)
+
+    def __getitem__(self, key):
+        return self._view[key]
+
+    def __iter__(self):
+        return iter(self._view)
+
+    def __eq__(self, other):
+        if isinstance(other, Frame):
+            other = other._view
+        try:
+            return self._view == other
+        except TypeError:
+            return NotImplemented
+
+    def __hash__(self):
+        return hash(self._view.tobytes())
+
+    def __repr__(self):
+        return "Frame(%r)" % (self._view.tobytes(),)
+
+class FrameDecoder:
+    """
+    Incremental decoder for the byte stream received from the module
+
+    The response messages (frames) from the module are structured as
+    following:
+
+    |\xaa|[len]|[data]|\x0a|
+
+    ``[len]`` is computed by the length in bytes of ``[len]`` itself (always
+    1) plus the length of ``[data]``.
+
+    The decoder can be fed with chunks of arbitrary size. Complete frames are
+    returned as soon as their last byte was fed. An incomplete frame at the
+    end of a chunk is kept until the next chunk arrives, so frames split
+    across two reads are not lost. Garbage between frames is skipped by
+    jumping directly to the next frame head. A frame head followed by an
+    impossible length field (see ``frame_max_len``) is skipped at once, so
+    a stray frame head does not hold back the frames behind it. Every byte
+    is looked at only a bounded number of times, so the total work is linear
+    in the number of bytes received.
+
+    The frames are returned as ``Frame`` objects viewing the received chunk;
+    the decoder itself copies only partial frames left at the end of a chunk.
+    """
+    def __init__(self):
+        """
+        Initialize instance
+
+        Parameters:
+            None
+
+        Returns:
+            Nothing
+        """
+
+        # Bytes received but not yet returned as part of a frame
+        self.buffer = b''
+
+        # Bytes skipped because they did not belong to a frame, and bytes
+        # of partial frames thrown away by reset()
+        self.skipped = 0
+        self.discarded = 0
+
+    def feed(self, data):
+        """
+        Feed data received from the module to the decoder
+
+        Parameters:
+            data (bytes or bytearray): chunk of the byte stream from the
+                module
+
+        Returns:
+            frames (list of Frame): complete frames (incl. frame head and
+                frame end) found in the byte stream so far. Empty list if no
+                frame was completed by ``data``.
+        """
+
+        # The frames view this buffer, so it must never change afterwards
+        if self.buffer:
+            buf = self.buffer + data
+        else:
+            buf = bytes(data)
+        view = memoryview(buf)
+        n = len(buf)
+
+        frames = []
+        p = 0   # Position of "pointer" in buffer
+        while True:
+            # Jump to the next frame head. If there is none, everything left
+            # in the buffer is garbage.
+            q = buf.find(frame_head, p)
+            if q < 0:
+                self.skipped += n - p
+                p = n
+                break
+            if q != p:
+                self.skipped += q - p
+                p = q
+
+            # The length field has not been received yet
+            if p + 1 >= n:
+                break
+
+            # A length no message can have; resynchronize at the next frame
+            # head
+            if not frame_min_len <= buf[p+1] <= frame_max_len:
+                self.skipped += 1
+                p += 1
+                continue
+
+            # If a valid frame starts at p, the frame end is expected at
+            # position (p+l+1). Keep the partial frame if this position has
+            # not been received yet.
+            end = p + buf[p+1] + 1
+            if end >= n:
+                break
+
+            if frame_end == buf[end]:
+                # Extract the frame (incl. frame head and frame end) and
+                # place the pointer at the start of the next frame
+                frames.append(Frame(view[p:end+1]))
+                p = end + 1
+            else:
+                # No valid frame at p; resynchronize at the next frame head
+                self.skipped += 1
+                p += 1
+
+        # Keep everything behind the pointer
+        self.buffer = buf[p:]
+
+        return frames
+
+    def pending(self):
+        """
+        Returns the number of bytes held back as a partial frame
+
+        Parameters:
+            None
+
+        Returns:
+            length (int): Number of buffered bytes
+        """
+        return len(self.buffer)
+
+    def reset(self):
+        """
+        Discard any partial frame
+
+        Parameters:
+            None
+
+        Returns:
+            Nothing
+        """
+        self.discarded += len(self.buffer)
+        self.buffer = b''
+
+# Command byte of the error message sent by the module
+frame_cmd_error = 0xff
+
+class ExpectFrames:
+    """
+    Expected response: a number of frames of specific message type(s)
+
+    Instances are passed as ``expect`` to ``PyVoiceRecognitionV3._recv_rsp()``
+    which returns as soon as the expected response is complete instead of
+    waiting for the line to become quiet. The message type is given by the
+    command byte (third byte of a frame). An error message from the module
+    (command byte \xff) always completes the response.
+    """
+    def __init__(self, cmd, n=1):
+        """
+        Initialize instance
+
+        Parameters:
+            cmd (int or tuple of int): command byte(s) of the expected
+                message(s)
+            n (int): number of expected messages
+
+        Returns:
+            Nothing
+        """
+        if isinstance(cmd, int):
+            cmd = (cmd,)
+        self.cmd = tuple(cmd)
+        self.n = n
+
+    def __call__(self, frames):
+        """
+        Check if the expected response is complete
+
+        Parameters:
+            frames (list of Frame): frames received so far
+
+        Returns:
+            complete (bool): ``True`` if the response is complete
+        """
+        count = 0
+        for f in frames:
+            if f[2] in self.cmd:
+                count += 1
+            elif frame_cmd_error == f[2]:
+                return True
+        return count >= self.n
+
+class ExpectRecords(ExpectFrames):
+    """
+    Expected response: a number of record/status pairs
+
+    Some commands (e.g. check record train status (02) or load to recognizer
+    (30)) report a status for every record involved. The module can split
+    these pairs over several messages of the same type, each structured as
+    following:
+
+    |\xaa|[len]|[cmd]|[n]|[rec]|[sta]|...|[rec]|[sta]|\x0a|
+
+    The response is complete as soon as all pairs are received.
+    """
+    def __call__(self, frames):
+        """
+        Check if the expected response is complete
+
+        Parameters:
+            frames (list of Frame): frames received so far
+
+        Returns:
+            complete (bool): ``True`` if the response is complete
+        """
+        count = 0
+        for f in frames:
+            if f[2] in self.cmd:
+                count += (len(f) - 5) // 2
+            elif frame_cmd_error == f[2]:
+                return True
+        return count >= self.n
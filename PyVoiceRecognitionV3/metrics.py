@@ -0,0 +1,314 @@
+# Runtime metrics of a driver: per command the number of calls, a latency
+# histogram, the bytes written and read and the messages received; the bytes
+# skipped or discarded while reading and the recognitions per record. The
+# metrics are only collected if enabled (``metrics=True``); otherwise the
+# driver holds ``None`` instead of a ``Metrics`` instance and skips all of
+# the bookkeeping.
+
+import bisect
+import os
+import socket
+import stat
+
+from .framing import frame_cmd_error
+
+# Upper bounds of the buckets of the latency histograms in seconds
+latency_buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+        1, 2.5, 5, 10)
+
+class CommandMetrics:
+    """
+    Metrics of one command (command byte)
+    """
+    __slots__ = ("count", "no_response", "errors", "latency_sum",
+            "latency_counts", "bytes_written", "bytes_read", "frames")
+
+    def __init__(self):
+        """
+        Initialize instance
+
+        Parameters:
+            None
+
+        Returns:
+            Nothing
+        """
+        self.count = 0              # Commands sent
+        self.no_response = 0        # Commands without response
+        self.errors = 0             # Commands answered with an error message
+        self.latency_sum = 0.       # Sum of the latencies in seconds
+        # Number of commands per latency bucket; the last one counts the
+        # latencies above the largest bound
+        self.latency_counts = [0] * (len(latency_buckets) + 1)
+        self.bytes_written = 0      # Bytes of the commands
+        self.bytes_read = 0         # Bytes of the response messages
+        self.frames = 0             # Response messages
+
+class Metrics:
+    """
+    Runtime metrics of a driver
+
+    The driver records every command, recognition and discarded data.
+    ``snapshot()`` returns the metrics as dictionary, ``prometheus()`` in
+    the text format of Prometheus:
+
+        vr = PyVoiceRecognitionV3(device=ser, metrics=True)
+        ...
+        vr.stats()["commands"][0x01]["count"]
+        vr.export_metrics("/var/lib/node_exporter/vr.prom")
+    """
+    def __init__(self, decoder=None):
+        """
+        Initialize instance
+
+        Parameters:
+            decoder (FrameDecoder or None): decoder of the driver. The bytes
+                it skipped between messages are reported as garbage, the
+                partial messages it threw away as discarded.
+
+        Returns:
+            Nothing
+        """
+        self.decoder = decoder
+        self.commands = {}          # Command byte -> CommandMetrics
+        self.recognitions = {}      # Record -> number of recognitions
+        self._discarded = 0         # Bytes thrown away by the driver
+
+    @property
+    def garbage_bytes(self):
+        """
+        Bytes skipped by the decoder because they did not belong to a message
+        """
+        if None == self.decoder:
+            return 0
+        return self.decoder.skipped
+
+    @property
+    def discarded_bytes(self):
+        """
+        Bytes thrown away unread: input buffer flushed before a command,
+        partial messages and messages nobody waited for
+        """
+        if None == self.decoder:
+            return self._discarded
+        return self._discarded + self.decoder.discarded
+
+    def command(self, command, latency, messages):
+        """
+        Record a command and its response
+
+        Parameters:
+            command (bytes): command sent to the module
+            latency (float): time in seconds until the response was complete
+            messages (list of Frame or None): response messages
+
+        Returns:
+            Nothing
+        """
+        cmd = command[2]
+        m = self.commands.get(cmd)
+        if None == m:
+            m = self.commands[cmd] = CommandMetrics()
+        m.count += 1
+        m.latency_sum += latency
+        m.latency_counts[bisect.bisect_left(latency_buckets, latency)] += 1
+        m.bytes_written += len(command)
+        if not messages:
+            m.no_response += 1
+            return
+        m.frames += len(messages)
+        for message in messages:
+            m.bytes_read += len(message)
+            if frame_cmd_error == message[2]:
+                m.errors += 1
+
+    def recognition(self, record):
+        """
+        Record a recognition
+
+        Parameters:
+            record (int): recognized record
+
+        Returns:
+            Nothing
+        """
+        self.recognitions[record] = self.recognitions.get(record, 0) + 1
+
+    def discarded(self, n_bytes):
+        """
+        Record data thrown away unread
+
+        Parameters:
+            n_bytes (int): number of bytes
+
+        Returns:
+            Nothing
+        """
+        self._discarded += n_bytes
+
+    def snapshot(self):
+        """
+        Returns the metrics as dictionary
+
+        The latency histogram of a command maps the upper bound of every
+        bucket in seconds to the number of commands with a latency up to
+        this bound (cumulative, like Prometheus). The last bound is
+        ``float("inf")``.
+
+        Parameters:
+            None
+
+        Returns:
+            metrics (dict): snapshot of the metrics:
+                {
+                    "commands": {cmd: {"count", "no_response", "errors",
+                        "latency_sum_s", "latency_histogram",
+                        "bytes_written", "bytes_read", "frames"}},
+                    "recognitions": {record: count},
+                    "garbage_bytes": int,
+                    "discarded_bytes": int,
+                }
+        """
+        commands = {}
+        for cmd in sorted(self.commands):
+            m = self.commands[cmd]
+            histogram = {}
+            total = 0
+            bounds = latency_buckets + (float("inf"),)
+            for i in range(len(bounds)):
+                total += m.latency_counts[i]
+                histogram[bounds[i]] = total
+            commands[cmd] = {
+                    "count": m.count,
+                    "no_response": m.no_response,
+                    "errors": m.errors,
+                    "latency_sum_s": m.latency_sum,
+                    "latency_histogram": histogram,
+                    "bytes_written": m.bytes_written,
+                    "bytes_read": m.bytes_read,
+                    "frames": m.frames,
+                    }
+
+        return {
+                "commands": commands,
+                "recognitions": dict(sorted(self.recognitions.items())),
+                "garbage_bytes": self.garbage_bytes,
+                "discarded_bytes": self.discarded_bytes,
+                }
+
+    def prometheus(self, prefix="pvr3", labels=None):
+        """
+        Returns the metrics in the text format of Prometheus
+
+        Parameters:
+            prefix (str): prefix of the metric names
+            labels (dict or None): labels added to every sample, e.g.
+                ``{"device": "kitchen"}`` to tell the modules apart
+
+        Returns:
+            text (str): metrics in Prometheus text format
+        """
+        base = ""
+        if labels:
+            base = "".join(',%s="%s"' % (k, _escape(labels[k]))
+                    for k in sorted(labels))
+        snap = self.snapshot()
+        lines = []
+
+        def family(name, kind, doc, samples):
+            lines.append("# HELP %s_%s %s" % (prefix, name, doc))
+            lines.append("# TYPE %s_%s %s" % (prefix, name, kind))
+            for suffix, label, value in samples:
+                label = (label + base).lstrip(",")
+                lines.append("%s_%s%s%s %s" % (prefix, name, suffix,
+                        "{%s}" % label if label else "", _number(value)))
+
+        def per_command(key):
+            return [("", 'cmd="0x%02x"' % cmd, snap["commands"][cmd][key])
+                    for cmd in snap["commands"]]
+
+        family("commands_total", "counter", "Commands sent to the module",
+                per_command("count"))
+        family("command_no_response_total", "counter",
+                "Commands without response", per_command("no_response"))
+        family("command_errors_total", "counter",
+                "Commands answered with an error message",
+                per_command("errors"))
+
+        samples = []
+        for cmd in snap["commands"]:
+            c = snap["commands"][cmd]
+            label = 'cmd="0x%02x"' % cmd
+            for bound, count in c["latency_histogram"].items():
+                samples.append(("_bucket",
+                        '%s,le="%s"' % (label, _number(bound)), count))
+            samples.append(("_sum", label, c["latency_sum_s"]))
+            samples.append(("_count", label, c["count"]))
+        family("command_latency_seconds", "histogram",
+                "Time until the response to a command was complete", samples)
+
+        family("bytes_written_total", "counter", "Bytes of the commands",
+                per_command("bytes_written"))
+        family("bytes_read_total", "counter",
+                "Bytes of the response messages", per_command("bytes_read"))
+        family("frames_total", "counter", "Response messages",
+                per_command("frames"))
+        family("garbage_bytes_total", "counter",
+                "Bytes skipped because they did not belong to a message",
+                [("", "", snap["garbage_bytes"])])
+        family("discarded_bytes_total", "counter",
+                "Bytes thrown away unread", [("", "", snap["discarded_bytes"])])
+        family("recognitions_total", "counter", "Recognitions per record",
+                [("", 'record="%d"' % r, n)
+                    for r, n in snap["recognitions"].items()])
+
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, target, prefix="pvr3", labels=None):
+        """
+        Write the metrics in the text format of Prometheus
+
+        If ``target`` is a Unix domain socket, the text is sent to it.
+        Otherwise it is written to the file ``target``. The file is replaced
+        atomically, so a collector (e.g. the textfile collector of the node
+        exporter) never reads a partial file.
+
+        Parameters:
+            target (str): path of the file or socket
+            prefix (str): prefix of the metric names
+            labels (dict or None): labels added to every sample
+
+        Returns:
+            Nothing
+        """
+        text = self.prometheus(prefix = prefix, labels = labels).encode()
+
+        try:
+            is_socket = stat.S_ISSOCK(os.stat(target).st_mode)
+        except FileNotFoundError:
+            is_socket = False
+
+        if is_socket:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.connect(target)
+                sock.sendall(text)
+        else:
+            tmp = target + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(text)
+            os.replace(tmp, target)
+
+def _escape(value):
+    """
+    Escapes a label value for the Prometheus text format
+    """
+    return (str(value).replace("\\", "\\\\").replace('"', '\\"')
+            .replace("\n", "\\n"))
+
+def _number(value):
+    """
+    Formats a number for the Prometheus text format
+    """
+    if float("inf") == value:
+        return "+Inf"
+    return repr(value)
@@ -1,16 +1,33 @@
-import time
+import os
+
+from .clock import VirtualClock
 
 class MySerMock:
     """
     Mockup for serial device
+
+    The input buffer is consumed from the front in place (``del
+    inbuffer[:n]``), which CPython implements by advancing the start of the
+    bytearray. Reading is therefore O(1) per call regardless of the amount of
+    data pending, so megabytes of simulated traffic can be fed through the
+    drivers.
+
+    Reads follow the timeout semantics of ``pyserial`` but never sleep. If
+    fewer bytes are pending than requested, the mock waits on its virtual
+    clock (``clock``) until the timers of the clock appended enough data or
+    the timeout expired. This takes no real time. The time a real port would
+    have waited is accumulated in ``waited``.
     """
-    def __init__(self, inbuffer=None, timeout=None):
+    def __init__(self, inbuffer=None, timeout=None, clock=None):
         """
         Initialize instance
 
         Parameters:
             * inbuffer (bytearray): input buffer
-            * timeout (int): read timeout in seconds
+            * timeout (int or float): read timeout in seconds
+            * clock (VirtualClock): clock of the mock. If None a new virtual
+                clock is created. Drivers use the clock of the device they
+                were created for.
 
         Returns:
             Nothing
@@ -18,6 +35,8 @@ class MySerMock:
 
         # Initialize the input buffer inbuffer
         if None != inbuffer:
+            if not isinstance(inbuffer, bytearray):
+                inbuffer = bytearray(inbuffer)
             self.inbuffer = inbuffer
         else:
             # Empty input buffer
@@ -28,12 +47,102 @@ class MySerMock:
         else:
             self.timeout = 60
 
+        # Baud rate of the port. Only stored; see VR3Simulator for a mock
+        # depending on it.
+        self.baudrate = 9600
+
+        if None != clock:
+            self.clock = clock
+        else:
+            self.clock = VirtualClock()
+
+        # Time in seconds a real serial port would have waited for data
+        # missing in the input buffer
+        self.waited = 0
+
         # Initialize the output buffer outbuffer. The output buffer can be used
         # to check what would have been sent to the module. The write() methods
         # appends to outbuffer.
         self.outbuffer = bytearray(b'')
 
-    def read(self, n_bytes):
+        # Pipe signalling pending data in the input buffer (see fileno()).
+        # Created on first use.
+        self._doorbell = None
+        self._rung = False
+
+    def _ring(self):
+        """
+        Make the doorbell pipe readable if and only if the input buffer holds
+        data
+
+        Parameters:
+            Nothing
+
+        Returns:
+            Nothing
+        """
+        if None == self._doorbell:
+            return
+        if len(self.inbuffer) and not self._rung:
+            os.write(self._doorbell[1], b'\x00')
+            self._rung = True
+        elif not len(self.inbuffer) and self._rung:
+            os.read(self._doorbell[0], 1)
+            self._rung = False
+
+    def fileno(self):
+        """
+        Returns a file descriptor that is readable while the input buffer
+        holds data
+
+        Like a real serial port the mock can thus be watched with
+        ``select``, ``selectors`` or an asyncio event loop.
+
+        Parameters:
+            Nothing
+
+        Returns:
+            * fd (int): file descriptor
+        """
+        if None == self._doorbell:
+            self._doorbell = os.pipe()
+            self._ring()
+        return self._doorbell[0]
+
+    def close(self):
+        """
+        Release the file descriptors created by fileno()
+
+        Parameters:
+            Nothing
+
+        Returns:
+            Nothing
+        """
+        if None != self._doorbell:
+            os.close(self._doorbell[0])
+            os.close(self._doorbell[1])
+            self._doorbell = None
+            self._rung = False
+
+    def _wait(self, n_bytes):
+        """
+        Wait on the clock until enough data is pending or the read timeout
+        expired
+
+        Parameters:
+            * n_bytes (int): number of bytes requested
+
+        Returns:
+            Nothing
+        """
+        if n_bytes > len(self.inbuffer):
+            start = self.clock.monotonic()
+            self.clock.wait_until(lambda: len(self.inbuffer) >= n_bytes,
+                    self.timeout)
+            self.waited += self.clock.monotonic() - start
+
+    def read(self, n_bytes=1):
         """
         Read data from mock serial port
 
@@ -42,34 +151,62 @@ class MySerMock:
         Parameters:
             * n_bytes (int): Number of bytes to read. If n_bytes is larger than
                 the data in the input buffer than this method can return less
-                data.
+                data (see class description).
 
         Returns:
             * data (bytes)
         """
-        len_data = min(len(self.inbuffer), n_bytes)
-        data = self.inbuffer[0:len_data]
-
-        # Simulate timeout
-        if n_bytes > len(self.inbuffer):
-            time.sleep(self.timeout)
+        self._wait(n_bytes)
+        data = bytes(self.inbuffer[:n_bytes])
 
         # What is read is removed from inbuffer
-        self.inbuffer = self.inbuffer[len_data:]
+        del self.inbuffer[:n_bytes]
+        self._ring()
+
+        return data
+
+    def readinto(self, buffer):
+        """
+        Read data from mock serial port into a writable buffer
 
-        return bytes(data)
+        Like ``read(len(buffer))`` but without allocating the data read.
+
+        Parameters:
+            * buffer (bytearray or memoryview): buffer to be filled
+
+        Returns:
+            * length (int): number of bytes read
+        """
+        n_bytes = len(buffer)
+        self._wait(n_bytes)
+        length = min(len(self.inbuffer), n_bytes)
+        with memoryview(self.inbuffer) as src:
+            buffer[:length] = src[:length]
+        del self.inbuffer[:length]
+        self._ring()
+
+        return length
+
+    @property
+    def in_waiting(self):
+        """
+        Current size of the input buffer in bytes
+        """
+        return len(self.inbuffer)
 
     def inWaiting(self):
         """
         Returns the current size of the input buffer
 
+        Deprecated alias of ``in_waiting`` kept for ``pyserial`` < 3.0.
+
         Parameters:
             Nothing
 
         Returns:
             * length (int): Length of input buffer in bytes
         """
-        return len(self.inbuffer)
+        return self.in_waiting
 
     def write(self, data):
         """
@@ -111,6 +248,23 @@ class MySerMock:
             Nothing
         """
         self.inbuffer.extend(data)
+        self._ring()
+
+    def append_later(self, delay, data):
+        """
+        Append new data to the input buffer after some time
+
+        The data is appended when the clock of the mock (``clock``) reached
+        the time, i.e. while a read or a driver waits for data.
+
+        Parameters:
+            * delay (float): time in seconds from now
+            * data (bytearray): data to be append to the input buffer
+
+        Returns:
+            Nothing
+        """
+        self.clock.call_later(delay, self.append_to_inbuffer, data)
 
     def reset(self):
         """
@@ -124,4 +278,5 @@ class MySerMock:
         """
         self.inbuffer = bytearray(b'')
         self.outbuffer = bytearray(b'')
-
+        self.waited = 0
+        self._ring()
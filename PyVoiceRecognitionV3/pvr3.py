@@ -1,24 +1,67 @@
-import time
+import collections
+import queue
+import sys
+import warnings
+
+from .clock import system_clock
+from .framing import FrameDecoder, ExpectFrames, ExpectRecords
+from .framing import frame_cmd_error
+from .metrics import Metrics
+from .reader import ReaderThread
+from . import commands
+from . import decoders
+from .results import Result, RecognitionEvent
 
 # Elechouse Voice Recognition Module V3*
 # Protocol definition see:
 # https://github.com/elechouse/VoiceRecognitionV3#protocol
 
-# List to convert hex value for IO pulse width to milliseconds
-iopw_conv = (10, 15, 20, 25, 30, 35, 40, 45, 50, 75, 100,
-        100, 300, 400, 500, 1000)
+# Lists to convert hex values for IO pulse width (in milliseconds), baudrate
+# and output IO mode
+from .decoders import iopw_conv, br_conv, iomode_conv
 
-# List to convert hex values for baudrate values
-br_conv = (9600, 2400, 4800, 9600, 19200, 38400)
-
-# List to convert hex values for output IO mode
-iomode_conv = ("pulse", "toggle", "set", "clear")
+# Number of records the module can store
+max_records = 80
 
 # Properties for record signature
 sign_max_len = 26               # Maximum length for signature
 sign_char_min_ascii = 33        # Minimum ASCII code for sign. character
 sign_char_max_ascii = 126       # Maximum ASCII code for sign. character
 
+# Baud rates tried by detect_baudrate(): the default of the module first,
+# then from fast to slow
+baudrate_probe_order = (9600, 38400, 19200, 4800, 2400)
+
+# Adaptive timing (see PyVoiceRecognitionV3.__init__(), calibrate())
+adaptive_samples = 64           # Response latencies kept per command
+adaptive_min_samples = 5        # Samples needed before the window adapts
+adaptive_percentile = 0.99      # Percentile of the latencies covered
+adaptive_factor = 1.5           # Safety factor on the percentile
+adaptive_margin = 5             # Safety margin in ms
+adaptive_gap_bytes = 3          # Quiet line ending a response in byte times
+
+# Commands querying the state of the module. Their responses can be cached
+# (see PyVoiceRecognitionV3.__init__()).
+cache_queries = (0x00, 0x01, 0x02, 0x03)
+
+# Cached responses outdated by a command changing the state of the module
+# (command byte -> command bytes of the outdated queries). Commands not
+# listed here outdate all cached responses.
+cache_invalidation = {
+        0x10: (0x00,),          # Restore system settings
+        0x11: (0x00,),          # Set baudrate
+        0x12: (0x00,),          # Set output IO mode
+        0x13: (0x00,),          # Set output IO pulse width
+        0x14: (),               # Reset output IO
+        0x15: (0x00,),          # Set power on auto load
+        0x20: (0x02, 0x03),     # Train record
+        0x21: (0x02, 0x03),     # Train record with signature
+        0x22: (0x03,),          # Set signature
+        0x30: (0x01,),          # Load to recognizer
+        0x31: (0x01,),          # Clear recognizer
+        0x32: (0x00, 0x01),     # Group control
+        }
+
 class BadSignature(Exception):
     """
     Raised when record signature contains bad characters (not in ASCII range 33
@@ -50,9 +93,17 @@ class BadIOPin(Exception):
     """
     pass
 
-class PyVoiceRecognitionV3:
+class PyVoiceRecognitionV3Base:
     """
-    Python class to interact with the Elechouse Voice Recognition Module V3
+    Common base of the drivers for the Elechouse Voice Recognition Module V3
+
+    The base class compiles the commands for the module and interprets the
+    responses. It does not talk to the serial port itself: every command is
+    handed to ``_execute()`` which is implemented by the derived classes,
+    blocking in ``PyVoiceRecognitionV3`` and as coroutine in
+    ``AsyncPyVoiceRecognitionV3``. The command methods return whatever
+    ``_execute()`` returns, i.e. the response dictionary or an awaitable
+    resolving to it.
     """
     def __init__(self,
             device=None,                # Serial device
@@ -66,13 +117,11 @@ class PyVoiceRecognitionV3:
         # from experience is 50 ms. After this time we can
         # expect to get no response.
             latency=50,                 # Response latency in ms
+            records=None,        # Number of record slots
+            keep_raw=True,              # Keep raw messages in results
             ):
         """
-        Create an instance of class ``PyVoiceRecognitionModuleV3``
-
-        Returns an instance and immediately opens a serial port connection to
-        the voice recognition module connected to the serial device
-        ``device``.
+        Initialize the state common to all drivers
 
         Parameters:
             device (device): serial device
@@ -80,6 +129,14 @@ class PyVoiceRecognitionV3:
                 (ms)
             latency (int): latency for the response from the module in
                 milliseconds (ms)
+            records (int or None): number of record slots of the module
+                (V3: 80, V3.1: 255). If given, the check of all records'
+                train status is complete as soon as the status of this many
+                records arrived. If ``None`` it is complete when the line
+                became quiet, which works with any module.
+            keep_raw (bool): if ``False`` results do not keep the raw
+                messages from the module. All fields are decoded right away
+                and the messages are dropped.
 
         Returns:
             Nothing
@@ -88,6 +145,25 @@ class PyVoiceRecognitionV3:
         self.ser = device
         self.latency = latency
         self.tout = tout
+        self.records = records
+
+        # Decoder for the byte stream from the module. It keeps partial
+        # frames between two reads.
+        self._decoder = FrameDecoder()
+
+        # Signatures of the records known from training, set_signature()
+        # and signature checks (record -> interned str or None). Used to
+        # label recognitions without decoding the signature every time.
+        self._signatures = {}
+
+        # Decoders for the fields of recognitions. The signature is taken
+        # from the signature table.
+        self._recognition_fields = dict(decoders.recognition_fields,
+                signature_recognized_record = self._recognized_signature)
+
+        # If False, results do not keep the raw messages from the module.
+        # All fields are decoded right away and the messages are dropped.
+        self.keep_raw = keep_raw
 
 #        self.ser = serial.Serial(
 #            port=self.port,
@@ -134,148 +210,6 @@ class PyVoiceRecognitionV3:
 
         return command
 
-    def _send_cmd(self, command):
-        """
-        Sends command to the module
-
-        Before sending a comand to the module the input buffer from the serial
-        port will be flushed. This ensures that any response from the module
-        read-in after sending to the module relates to the last command.
-
-        Parameters:
-            command (bytearray): command to be send to the module.
-
-        Returns:
-            Nothing
-        """
-        # Before sending a new command clear the input buffer
-        self.ser.reset_input_buffer()
-        self.ser.write(command)
-
-    def _recv_rsp(self, tout=None, latency=None):
-        """
-        Receive response/data from the module
-
-        The response messages follow a similar format/protocol as the commands.
-        The response can be split up into individual messages.
-
-        Each response is structured as following:
-
-        |\xaa|[len]|[data]|\x0a|
-
-        ``[len]`` is computed by the length in bytes of ``[len]`` itself
-        (always 1) plus the length of ``[data]``.
-
-        Parameters:
-            tout (int or None): timeout of the serial communication in
-                milliseconds (ms). If ``None`` defaults to ``self.tout``.
-            latency (int): latency for the response from the module in
-                milliseconds (ms). If ``None`` defaults to ``self.latency``.
-
-        Returns:
-            messages (array of bytearray): the response messages (one or
-                multiple) from the module
-        """
-
-        if None == tout:        # Timeout in ms
-            tout = self.tout
-        if None == latency:     # Latency in ms
-            latency = self.latency
-
-        # Initialize array for byte stream from module
-        response = bytearray()
-
-        # For the first byte of the response allow a specific
-        # latency
-        last = time.time()
-        while ((time.time() - last) < latency/1000.):
-            if self.ser.inWaiting():
-                response += self.ser.read(1)
-                break   # Exit while loop
-
-        # Read rest of response byte by byte until timeout
-        # (tout) is reached
-        last = time.time()
-        while ((time.time() - last) < tout/1000.):
-            if self.ser.inWaiting():
-                response += self.ser.read(1)
-                last = time.time()
-
-        # The response from the voice recognition module consists
-        # of one or multiple messages following a specific format.
-        # A message begins with a frame head (\xaa) followed by a
-        # specific number of data fields and finally a frame end
-        # (\x0a or \n). The first data field after the frame head
-        # denotes the number of data fields between the frame head
-        # and the frame end.
-
-        # Initialize array for response (messages) that can consist
-        # of one or more messages.
-        messages=[]
-
-        # If response from the module is already less than 3 bytes
-        # we can absolutely have no valid message at all. In this
-        # case we do not need to go through the following while
-        # loop.
-        if len(response) >= 3:
-            end_of_resp = False
-        else:
-            end_of_resp = True
-
-        p = 0   # Position of "pointer" in response
-        while not end_of_resp:
-            # If necessary move p to the first occurance of the
-            # frame head (\xaa or 170 (decimal))
-            while response[p] != 170:
-                # Move the pointer to the field containing the
-                # number of data field (field after frame head)
-                p += 1
-                # The minimum-length message has 3 bytes:
-                # \xaa\x01\x0a
-                if not p < len(response) - 3:
-                    end_of_resp = True
-                    break
-
-            # If a valid message starts at current position p then
-            # at position (p+1) should be the length of the message
-            # (l) without header field (\xaa) and end field (\x0a).
-            # Therefore, at position (p+l+1) we expect the end
-            # field (\x0a or 10 decimal). If this is the case,
-            # extract this part as a message and set the pointer
-            # to position (p+l+2).
-            l = response[p+1]
-            if p + l + 1 < len(response) and 10 == response[p+l+1]:
-                # We can extract the message (incl. head + end field)
-                messages.append(response[p:p+l+2])
-                # Place pointer at start of expected next message
-                p = p + l + 2
-                # Check if we already reached end of response
-                if not p < len(response):
-                    end_of_resp = True
-            else:
-                # Try again by restarting at next byte
-                p += 1
-
-        # Lets check the integrity of each message. If the
-        # integrity is not successfully verified, remove the
-        # message from the array messages.
-        for m in messages:
-            data_len = m[1]
-            if len(m) != data_len + 2:
-                messages.remove(m)
-
-        # If the array of messages has only one object return
-        # only this single element rather than a list with a
-        # single element:
-        #if 1 == len(messages):
-        #    messages = messages[0]
-
-        # If messages is empty than set it to None
-        if [] == messages:
-            messages = None
-
-        return messages
-
     def _bytearr2str(self, bytearr=None):
         """
         Converts a bytearray to a string
@@ -293,14 +227,35 @@ class PyVoiceRecognitionV3:
         """
 
         if None != bytearr:
-            retstr = ""
-            for b in bytearr:
-                retstr += chr(b)
+            # Every byte maps to the character with the same code
+            retstr = bytes(bytearr).decode("latin-1")
         else:
             retstr = None
 
         return retstr
 
+    def _remember_signature(self, record, signature):
+        """
+        Store the signature of a record in the signature table
+
+        Parameters:
+            record (int): record number
+            signature (str or None): signature of the record. Empty string
+                or ``None`` if the record has no signature.
+
+        Returns:
+            signature (str or None): the interned signature as stored in the
+                table
+        """
+
+        if signature:
+            signature = sys.intern(signature)
+        else:
+            signature = None
+        self._signatures[record] = signature
+
+        return signature
+
     def _default_callback(self, response_dict):
         """
         Default callback function for ``record_recognized()``
@@ -330,28 +285,32 @@ class PyVoiceRecognitionV3:
             response_dict["time_passed_ms"])
             )
 
-    def send_cmd(self, command):
+    def _execute(self, command, expect, parse, *args):
         """
-        Sending a command to the module and receiving response(s)
+        Sends a command to the module and interprets the response
+
+        The derived classes implement the communication with the module.
 
         Parameters:
             command (bytearray): command to be sent to the module
+            expect (callable): expected response (e.g. ``ExpectFrames``)
+            parse (callable): method interpreting the response. It is called
+                with the list of response messages (or ``None``) followed by
+                ``args``.
+            args: additional arguments for ``parse``
 
         Returns:
-            messages (array of bytearray): response messages from
-                the module
+            response: return value of ``parse``
         """
-
-        self._send_cmd(command)
-        messages = self._recv_rsp()
-        return messages
+        raise NotImplementedError
 
     def check_system_settings(self):
         """
         Checks system settings (00)
 
-        The method returns a dictionary containing the response from the
-        module:
+        The method returns a ``SystemSettings`` result containing the
+        response from the module. Its fields can be read like the keys of the
+        dictionary:
 
             response_dict = {
                     "raw": response_bin,
@@ -368,97 +327,47 @@ class PyVoiceRecognitionV3:
             None
 
         Returns:
-            response (dict): dictionary containing the response
+            response (SystemSettings): result containing the response
                 from the module
         """
 
-        # Compile and send command; return respoonse from module
-        command = self._compile_cmd(payload = b'\x00')
-        self._send_cmd(command)
-        response_bin = self._recv_rsp()
+        # Send precompiled command; return respoonse from module
+        command = commands.cmd_check_system_settings
+        return self._execute(command, ExpectFrames(0x00), self._parse_check_system_settings)
 
-        # Initialize dict for return value of this function
+    def _parse_check_system_settings(self, response_bin):
+        """
+        Interprets the response to ``check_system_settings()``
+
+        Parameters:
+            response_bin (list of Frame or None): response messages
+                from the module
+
+        Returns:
+            response (SystemSettings): result containing the response
+                from the voice recognition module
+        """
+
+        # Initialize result for return value of this function
         response_dict = None
 
         if None != response_bin:
             # The response from the module will always contain
             # one single message
-            if 1 == len(response_bin):
-                response_bin = response_bin[0]
-
-                # Training status and record value out of range
-                if 0 == response_bin[3]:
-                    sta = False
-                    rverr = False
-                elif 1 == response_bin[3]:
-                    sta = True
-                    rverr = False
-                elif  255 == response_bin[3]:
-                    sta = None
-                    rverr = True
-                else:
-                    sta = None
-                    rverr = None
-
-                # Baudrate
-                # Look up value in list br_conv
-                try:
-                    br = br_conv[response_bin[4]]
-                except:
-                    br = None
-
-                # Output IO mode
-                try:
-                    iom = iomode_conv[response_bin[5]]
-                except:
-                    iom = None
-
-                # IOPW: Output IO Pulse Width (Pulse Mode)
-                # Get pulse width length in milliseconds by looking up in
-                # the list iopw_conv:
-                try:
-                    iopw = iopw_conv[response_bin[6]]
-                except:
-                    iopw = None
-
-                # Power on auto load
-                if 0 == response_bin[7]:
-                    al = False
-                elif 1 == response_bin[7]:
-                    al = False
-                else:
-                    al = None
-
-                #GRP: Group control by external IO
-                if 0 == response_bin[8]:
-                    grp = "disabled"
-                elif 1 == response_bin[8]:
-                    grp = "system group"
-                elif 2 == response_bin[8]:
-                    grp = "user group"
-                else:
-                    grp = None
-
-                # Compile dictionary with response from module
-                response_dict = {
-                        "raw": response_bin,
-                        "trained": sta,
-                        "rec_value_out_of_range": rverr,
-                        "baudrate": br,
-                        "output_io_mode": iom,
-                        "output_io_pulse_width_ms": iopw,
-                        "autoload": al,
-                        "group_control": grp,
-                        }
+            if 1 == len(response_bin) and 0x00 == response_bin[0][2]:
+                response_dict = self._finish(
+                        decoders.decode_system_settings(response_bin[0]))
 
         return response_dict
 
+
     def check_recognizer(self):
         """
         Checks recognizer (01)
 
-        The method returns a dictionary containing the response message from
-        the module:
+        The method returns a ``RecognizerStatus`` result containing the
+        response message from the module. Its fields can be read like the keys
+        of the dictionary:
 
             response_dict = {
                     "raw": response_bin,
@@ -471,60 +380,47 @@ class PyVoiceRecognitionV3:
             None
 
         Returns:
-            response (dict): dictionary containing the response
+            response (RecognizerStatus): result containing the response
                 from the voice recognition module
         """
 
-        # Compile and send command; read response from module
-        command = self._compile_cmd(payload = b'\x01')
-        self._send_cmd(command)
-        response_bin = self._recv_rsp()
+        # Send precompiled command; read response from module
+        command = commands.cmd_check_recognizer
+        return self._execute(command, ExpectFrames(0x01), self._parse_check_recognizer)
 
-        # Initialize dict for return value of this function
+    def _parse_check_recognizer(self, response_bin):
+        """
+        Interprets the response to ``check_recognizer()``
+
+        Parameters:
+            response_bin (list of Frame or None): response messages
+                from the module
+
+        Returns:
+            response (RecognizerStatus): result containing the response
+                from the voice recognition module
+        """
+
+        # Initialize result for return value of this function
         response_dict = None
 
         if None != response_bin:
             # The response from the module will always contain
             # one single message
-            if 1 == len(response_bin):
-                response_bin = response_bin[0]
-                # Number of valid records in recognizer (max 7)
-                rvn = response_bin[3]
-
-                # Record values in recognizer
-                vri = response_bin[4:12]
-                vri_dec = []
-                for i in range(len(vri) - 1):
-                    vri_dec.append(vri[i])
-
-                # Group mode indicator
-                if 255 == response_bin[11]:
-                    grpm = "not in group mode"
-                # ToDo: Check if return value \x00 exists. Docu unclear
-                #
-                #elif 0 == response_bin[11]:
-                #    grpm = "system group mode"
-                elif 135 == response_bin[11]:
-                    grpm == "user group mode"
-                else:
-                    grpm = None
-
-                # Compile dictionary with response from module
-                response_dict = {
-                        "raw": response_bin,
-                        "no_records_in_recognizer": rvn,
-                        "records_in_recognizer": vri_dec,
-                        "group_mode": grpm,
-                        }
+            if 1 == len(response_bin) and 0x01 == response_bin[0][2]:
+                response_dict = self._finish(
+                        decoders.decode_recognizer(response_bin[0]))
 
         return response_dict
 
+
     def check_record_train_status(self, record=None):
         """
         Checks record train status (02)
 
-        The method returns a dictionary containing the response message from
-        the module:
+        The method returns a ``TrainStatus`` result containing the
+        response message from the module. Its fields can be read like the keys
+        of the dictionary:
 
             response_dict = {
                     "raw": response_bin,
@@ -537,146 +433,48 @@ class PyVoiceRecognitionV3:
                 all records will be checked.
 
         Returns:
-            response (dict): dictionary containing the response
+            response (TrainStatus): result containing the response
                 from the voice recognition module
         """
 
-        # Compile the command payload (data) from the function's
-        # arguments
-        payload = bytearray(b'\x02')
-        # Append record number to cmd payload
         if None != record:
-            payload.append(record)
+            expect = ExpectRecords(0x02, 1)
+        elif None != self.records:
+            # Check status for all records. The module reports the
+            # status of every record.
+            expect = ExpectRecords(0x02, self.records)
         else:
-            # Check status for all records
-            payload.append(255)
+            # Number of records unknown; wait until the line is quiet
+            expect = None
 
         # Compile and send command; read response from module
-        command = self._compile_cmd(payload = payload)
-        self._send_cmd(command)
-        response_bin = self._recv_rsp()
-
-        # Initialize dict for return value of this function
-        response_dict = None
-
-        if None != response_bin:
-            # Loop over all messages
-
-            # Initialize lists to collect results from the messages
-            # in the response from the module
-            rec = []    # Record numbers
-            sta = []    # Record status
-
-            # Loop over all messages and fill above lists
-            for resp in response_bin:
-                # The total number of trained records is repeated
-                # in every message. It makes no difference from
-                # which message we extract this info.
-                n = resp[3]
-                # Length of data/payload of message
-                nr = int((len(resp) - 5)/ 2)
-                # Extract data
-                for i in range(nr):
-                    rec.append(resp[4 + 2*i])
-                    if 0 == resp[5 + 2*i]:
-                        sta.append("untrained")
-                    elif 1 == resp[5 + 2*i]:
-                        sta.append("trained")
-                    elif 255 == resp[5 + 2*i]:
-                        sta.append("out of range")
-                    else:
-                        sta.append("unknown")
-
-            # Compile dictionary with response from module
-            response_dict = {
-                    "raw": response_bin,
-                    "no_trained_records": n,
-                    "trained_records": rec,
-                    "train_status": sta,
-                    }
+        command = commands.build_check_train_status(record)
+        return self._execute(command, expect, self._parse_check_record_train_status)
 
-        return response_dict
-
-    def check_record_signature(self, record=None):
+    def _parse_check_record_train_status(self, response_bin):
         """
-        Check the signature of a record (03)
-
-        The method returns a dictionary containing the response message from
-        the module:
-
-            response_dict = {
-                "raw": response_bin,
-                "record": record,
-                "signature": signature,
-                    }
-
-        The signature for a record (optional) can be considered as a "label"
-        for the record. In principle, the module allows any ASCII character
-        with ASCII code < 255. The maximum number of characters for the
-        signature is 26 (derived from test on module V3.1). To avoid any
-        potential problems the character range is limited from "!" (ASCII 33)
-        to "~" (ASCII 126).
+        Interprets the response to ``check_record_train_status()``
 
         Parameters:
-            record (int): Record number
+            response_bin (list of Frame or None): response messages
+                from the module
 
         Returns:
-            response (dict): dictionary containing the response
+            response (TrainStatus): result containing the response
                 from the voice recognition module
         """
 
-        # Initialize response dict
+        # Initialize result for return value of this function
         response_dict = None
 
-        # Proceed only if record number was given
-        if None != record:
-            # If this method is applied to a record that is not trained and has
-            # no signature it will not return meaningful results. The signature
-            # returned by the module will contain some random characters. This
-            # is an issue of the module. Therefore, as a first step determine
-            # the traning status of the record. Only, if the record is trained
-            # ask the module for the signature.
-
-            # Get training status for the record
-            sta = self.check_record_train_status(record)["train_status"][0]
-
-            if "trained" == sta:
-                # Compile the command payload (data)
-                payload = bytearray(b'\x03')
-                payload.append(record)
-
-                # Compile and send command; read response from module
-                command = self._compile_cmd(payload = payload)
-                self._send_cmd(command)
-                response_bin = self._recv_rsp()
-
-                # Initialize dict for return value of this function
-                response_dict = None
-
-                if None != response_bin:
-                    # The response from the module will always contain
-                    # one single message
-                    if 1 == len(response_bin):
-                        response_bin = response_bin[0]
-
-                        # Compile dictionary with response from module
-                        sign = self._bytearr2str(response_bin[5:-1])
-                        response_dict = {
-                                "raw": response_bin,
-                                "record": record,
-                                "signature": sign,
-                                }
-            else:
-                # For untrained records no meaningful response from the module
-                # can be retrieved
-                response_dict = {
-                        "raw": None,
-                        "record": record,
-                        "signature": None,
-                        }
+        if None != response_bin:
+            # The record/status pairs can be split over several messages
+            response_dict = self._finish(
+                    decoders.decode_records(response_bin, 0x02))
 
         return response_dict
 
+
     def restore_system_settings(self):
         """
         Restore the system settings of the module to defaults (10)
@@ -696,13 +494,22 @@ class PyVoiceRecognitionV3:
                 from the voice recognition module
         """
 
-        # Compile the command payload (data)
-        payload = bytearray(b'\x10')
+        # Send precompiled command; read response from module
+        command = commands.cmd_restore_system_settings
+        return self._execute(command, ExpectFrames(0x10), self._parse_restore_system_settings)
 
-        # Compile and send command; read response from module
-        command = self._compile_cmd(payload = payload)
-        self._send_cmd(command)
-        response_bin = self._recv_rsp()
+    def _parse_restore_system_settings(self, response_bin):
+        """
+        Interprets the response to ``restore_system_settings()``
+
+        Parameters:
+            response_bin (list of Frame or None): response messages
+                from the module
+
+        Returns:
+            response (dict): dictionary containing the response
+                from the voice recognition module
+        """
 
         # Initialize dict for return value of this function
         response_dict = {
@@ -758,15 +565,24 @@ class PyVoiceRecognitionV3:
         else:
             raise BadBaudrate
 
-        # Compile the command payload (data)
-        payload = bytearray(b'\x11')
-        # Here we use br from above
-        payload.append(br)
+        # Compile and send command; read response from module. Here we use
+        # br from above
+        command = commands.build_set_baudrate(br)
+        return self._execute(command, ExpectFrames(0x11), self._parse_set_baudrate, baudrate)
 
-        # Compile and send command; read response from module
-        command = self._compile_cmd(payload = payload)
-        self._send_cmd(command)
-        response_bin = self._recv_rsp()
+    def _parse_set_baudrate(self, response_bin, baudrate):
+        """
+        Interprets the response to ``set_baudrate()``
+
+        Parameters:
+            response_bin (list of Frame or None): response messages
+                from the module
+            baudrate (int): baud rate sent to the module
+
+        Returns:
+            response (dict): dictionary containing the response
+                from the voice recognition module
+        """
 
         # Initialize dict for return value of this function
         response_dict = {
@@ -832,15 +648,26 @@ class PyVoiceRecognitionV3:
         else:
             raise BadMode
 
-        # Compile the command payload (data)
-        payload = bytearray(b'\x12')
+        # Compile the command
         # Here we use m from above
-        payload.append(m)
+        command = commands.build_set_output_io_mode(m)
 
-        # Compile and send command; read response from module
-        command = self._compile_cmd(payload = payload)
-        self._send_cmd(command)
-        response_bin = self._recv_rsp()
+        # Send command; read response from module
+        return self._execute(command, ExpectFrames(0x12), self._parse_set_output_io_mode, mode)
+
+    def _parse_set_output_io_mode(self, response_bin, mode):
+        """
+        Interprets the response to ``set_output_io_mode()``
+
+        Parameters:
+            response_bin (list of Frame or None): response messages
+                from the module
+            mode (str): output IO mode sent to the module
+
+        Returns:
+            response (dict): dictionary containing the response
+                from the voice recognition module
+        """
 
         # Initialize dict for return value of this function
         response_dict = {
@@ -893,15 +720,28 @@ class PyVoiceRecognitionV3:
         else:
             raise BadPulseWidth
 
-        # Compile the command payload (data)
-        payload = bytearray(b'\x13')
+        # Compile the command
         # Here we use pw from above
-        payload.append(pw)
+        command = commands.build_set_output_io_pulse_width(pw)
 
-        # Compile and send command; read response from module
-        command = self._compile_cmd(payload = payload)
-        self._send_cmd(command)
-        response_bin = self._recv_rsp()
+        # Send command; read response from module
+        return self._execute(command, ExpectFrames(0x13),
+                self._parse_set_output_io_pulse_width, pw, pulsewidth)
+
+    def _parse_set_output_io_pulse_width(self, response_bin, pw, pulsewidth):
+        """
+        Interprets the response to ``set_output_io_pulse_width()``
+
+        Parameters:
+            response_bin (list of Frame or None): response messages
+                from the module
+            pw (int): index of the pulse width sent to the module
+            pulsewidth (int): pulse width in milliseconds
+
+        Returns:
+            response (dict): dictionary containing the response
+                from the voice recognition module
+        """
 
         # Initialize dict for return value of this function
         response_dict = {
@@ -940,7 +780,6 @@ class PyVoiceRecognitionV3:
             BadIOPin: output pin wrong or unsupported
         """
 
-        payload = bytearray(b'\x14')
         pins = []
 
         # Check output io pins provided
@@ -964,152 +803,33 @@ class PyVoiceRecognitionV3:
                 if len(pins) > 7:
                     raise BadIOPin
         # Compile and send command; read response from module
-        for p in range(len(pins)):
-            payload.append(pins[p])
-        command = self._compile_cmd(payload = payload)
-        self._send_cmd(command)
-        response_bin = self._recv_rsp()
+        command = commands.build_reset_output_io(pins)
+        return self._execute(command, ExpectFrames(0x14), self._parse_reset_output_io, pins)
 
-        # Initialize dict for return value of this function
-        response_dict = {
-            "raw": response_bin,
-            "output_io_resetted": sorted(pins),
-                }
-
-        return response_dict
-
-    # set_power_on_auto_load (15)
-
-    def train_record(self, record=None, signature=None):
+    def _parse_reset_output_io(self, response_bin, pins):
         """
-        Train a record without (20) or with signature (21)
-
-        The method returns a dictionary containing the response message from
-        the module:
-
-            response_dict = {
-                "raw": response_bin,
-                "record": record,
-                "signature": signature,
-                "training_status": sta
-                    }
-
-        The signature for a record (optional) can be considered as a "label"
-        for the record. In principle, the module allows any ASCII character
-        with ASCII code < 255. The maximum number of characters for the
-        signature is 26 (derived from test on module V3.1). To avoid any
-        potential problems the character range is limited from "!" (ASCII 33)
-        to "~" (ASCII 126).
+        Interprets the response to ``reset_output_io()``
 
         Parameters:
-            record (int): Record number to train
-            signature (str or None): Signature for record
+            response_bin (list of Frame or None): response messages
+                from the module
+            pins (list of int): output io pins sent to the module
 
         Returns:
             response (dict): dictionary containing the response
                 from the voice recognition module
-
-        Raises:
-            BadSignature: signature is too long or contains bad characters
         """
 
-        # Code from elechouse Arduino library
-        #  train method: https://github.com/elechouse/VoiceRecognitionV3/blob/964d022b81b154b0fc5699e624d38e323915487b/VoiceRecognitionV3.cpp#L95
-
-        # Initialize response dict
-        response_dict = None
-
-        # Check for "good signature"
-        if None != signature:
-            # 1) Length of signature
-            if len(signature) > sign_max_len:
-                raise BadSignature
-            # 2) Search for bad characters
-            for c in range(len(signature)):
-                if ord(signature[c]) < sign_char_min_ascii or ord(signature[c]) > sign_char_max_ascii:
-                    raise BadSignature
-
-        # Proceed only if record number was given
-        if None != record:
-            # Compile the command payload (data) from the function's
-            # arguments. If no signature is provided use command 20, else
-            # command 21
-            if None == signature:
-                # No signature => command 20
-                payload = bytearray(b'\x20')
-                # Append record number to cmd payload
-                payload.append(record)
-            else:
-                # Signature => command 21
-                payload = bytearray(b'\x21')
-                # Append record number to cmd payload
-                payload.append(record)
-                # Append characters of signature as ASCII codes
-                for c in range(len(signature)):
-                    payload.append(ord(signature[c]))
-
-            # Compile and send command
-            command = self._compile_cmd(payload = payload)
-            self._send_cmd(command)
-
-            dialog_tout = 8             # timeout for dialog with module
-                                        # in seconds
-            tick = time.time()          # start time for timeout watchdog
-            train_finished = False      # indicator if training finished
-
-            # Loop until dialog timeout or training is finished
-            while (time.time() - tick < dialog_tout or train_finished):
-                # Read data from module
-                response_bin = self._recv_rsp()
-
-                # There are two response types
-                #  1) prompt msg: b'\xaa\[l]\x0a\[rec]\[prompt]\x0a'
-                #  2) status msg: b'\xaa\[l]\x20\[num]\[rec]\[sta]\[sig]\x0a'
-
-                if None != response_bin:
-                    if 1 == len(response_bin):
-                        # Reset timeout watchdog
-                        tick = time.time()
-
-                        response_bin = response_bin[0]
-                        #print(response_bin)
-
-                        # Prompt message
-                        if 10 == response_bin[2]:       # \x0a
-                            msg = response_bin[4:-1]    # msg
-                            msg = self._bytearr2str(msg)
-                            print("Record", record, ":\t", msg)
-
-                        # Status message (20: train w/o signature)
-                        if 32 == response_bin[2]:       # \x20
-                            # Status message ends training
-                            train_finished = True
-                            sta = response_bin[5]       # train status
-                            print("Training ended.\t", sta)
-
-                            response_dict = {
-                                "raw": response_bin,
-                                "record": record,
-                                "signature": None,
-                                "training_status": sta
-                                    }
-
-                        # Status message (21: train with signature)
-                        if 33 == response_bin[2]:       # \x20
-                            # Status message ends training
-                            train_finished = True
-                            sta = response_bin[5]       # train status
-                            print("Training ended.\t", sta)
-
-                            response_dict = {
-                                "raw": response_bin,
-                                "record": record,
-                                "signature": signature,
-                                "training_status": sta
-                                    }
+        # Initialize dict for return value of this function
+        response_dict = {
+            "raw": response_bin,
+            "output_io_resetted": sorted(pins),
+                }
 
         return response_dict
 
+    # set_power_on_auto_load (15)
+
     def set_signature(self, record=None, signature=None):
         """
         Set signature for record (22)
@@ -1152,7 +872,8 @@ class PyVoiceRecognitionV3:
                 raise BadSignature
             # 2) Search for bad characters
             for c in range(len(signature)):
-                if ord(signature[c]) < sign_char_min_ascii or ord(signature[c]) > sign_char_max_ascii:
+                if (ord(signature[c]) < sign_char_min_ascii
+                        or ord(signature[c]) > sign_char_max_ascii):
                     raise BadSignature
 
         # Proceed only if record number was given
@@ -1162,23 +883,38 @@ class PyVoiceRecognitionV3:
             if None == signature:
                 signature = ""
 
-            payload = bytearray(b'\x22')
-            # Append record number to cmd payload
-            payload.append(record)
-            # Append characters of signature
-            for c in range(len(signature)):
-                payload.append(ord(signature[c]))
-
             # Compile and send command. Read response from module
-            command = self._compile_cmd(payload = payload)
-            self._send_cmd(command)
-            response_bin = self._recv_rsp()
+            command = commands.build_set_signature(record, signature)
+            response_dict = self._execute(command, ExpectFrames(0x22),
+                    self._parse_set_signature, record, signature)
 
-            response_dict = {
-                "raw": response_bin,
-                "record": record,
-                "signature": signature,
-                    }
+        return response_dict
+
+    def _parse_set_signature(self, response_bin, record, signature):
+        """
+        Interprets the response to ``set_signature()``
+
+        Parameters:
+            response_bin (list of Frame or None): response messages
+                from the module
+            record (int): record number sent to the module
+            signature (str): signature sent to the module
+
+        Returns:
+            response (dict): dictionary containing the response
+                from the voice recognition module
+        """
+
+        # Remember the signature if the module accepted it
+        if (None != response_bin and None != record
+                and frame_cmd_error != response_bin[0][2]):
+            self._remember_signature(record, signature)
+
+        response_dict = {
+            "raw": response_bin,
+            "record": record,
+            "signature": signature,
+                }
 
         return response_dict
 
@@ -1186,8 +922,9 @@ class PyVoiceRecognitionV3:
         """
         Load record(s) to recognizer (30)
 
-        The method returns a dictionary containing the response message from
-        the module:
+        The method returns a ``LoadResult`` result containing the
+        response message from the module. Its fields can be read like the keys
+        of the dictionary:
 
             response_dict = {
                     "raw": response_bin,
@@ -1201,7 +938,7 @@ class PyVoiceRecognitionV3:
                 to recognizer.
 
         Returns:
-            response (dict): dictionary containing the response
+            response (LoadResult): result containing the response
                 from the voice recognition module
         """
 
@@ -1210,61 +947,34 @@ class PyVoiceRecognitionV3:
 
         # Proceed only if record number was given
         if None != records:
-            # Compile the command payload (data) from the function's
-            # arguments
-            payload = bytearray(b'\x30')
-            # Append record number(s) to cmd payload
-            if hasattr(records, "__iter__"):
-                for r in records:
-                    payload.append(r)
-            else:
-                payload.append(records)
-
             # Compile and send command; read response from module
-            command = self._compile_cmd(payload = payload)
-            self._send_cmd(command)
-            response_bin = self._recv_rsp()
-
-            if None != response_bin:
-                # Loop over all messages
-
-                # Initialize lists to collect results from the messages
-                # in the response from the module
-                rec = []    # Record numbers
-                sta = []    # Record status
-
-                # Loop over all messages and fill above lists
-                for resp in response_bin:
-                    # The total number of records in recognizer is
-                    # repeated in every message. It makes no difference
-                    # from which message we extract this info.
-                    n = resp[2]
-                    # Length of data/payload of message
-                    nr = int((len(resp) - 5)/ 2)
-                    # Extract data
-                    for i in range(nr):
-                        rec.append(resp[4 + 2*i])
-                        if 0 == resp[5 + 2*i]:
-                            sta.append("success")
-                        elif 255 == resp[5 + 2*i]:
-                            sta.append("out of range")
-                        elif 254 == resp[5 + 2*i]:
-                            sta.append("record untrained")
-                        elif 253 == resp[5 + 2*i]:
-                            sta.append("recognizer full")
-                        elif 252 == resp[5 + 2*i]:
-                            sta.append("already in recognizer")
-                        else:
-                            sta.append("unknown")
-                        sta.append(resp[5 + 2*i])
-
-                # Compile dictionary with response from module
-                response_dict = {
-                        "raw": response_bin,
-                        "no_records_in_recognizer": n,
-                        "records_in_recognizer": rec,
-                        "status": sta,
-                        }
+            command = commands.build_load(records)
+            response_dict = self._execute(command,
+                    ExpectRecords(0x30, len(records)),
+                    self._parse_load_to_recognizer)
+
+        return response_dict
+
+    def _parse_load_to_recognizer(self, response_bin):
+        """
+        Interprets the response to ``load_to_recognizer()``
+
+        Parameters:
+            response_bin (list of Frame or None): response messages
+                from the module
+
+        Returns:
+            response (LoadResult): result containing the response
+                from the voice recognition module
+        """
+
+        # Initialize result for return value of this function
+        response_dict = None
+
+        if None != response_bin:
+            # The record/status pairs can be split over several messages
+            response_dict = self._finish(
+                    decoders.decode_records(response_bin, 0x30))
 
         return response_dict
 
@@ -1287,9 +997,21 @@ class PyVoiceRecognitionV3:
         """
 
         # Compile and send command; return respoonse from module
-        command = self._compile_cmd(payload = b'\x31')
-        self._send_cmd(command)
-        response_bin = self._recv_rsp()
+        command = commands.cmd_clear_recognizer
+        return self._execute(command, ExpectFrames(0x31), self._parse_clear_recognizer)
+
+    def _parse_clear_recognizer(self, response_bin):
+        """
+        Interprets the response to ``clear_recognizer()``
+
+        Parameters:
+            response_bin (list of Frame or None): response messages
+                from the module
+
+        Returns:
+            response (dict): dictionary containing the response
+                from the voice recognition module
+        """
 
         # Initialize dict for return value of this function
         response_dict = None
@@ -1307,106 +1029,1710 @@ class PyVoiceRecognitionV3:
 
     # group_control (32)
 
-    def record_recognized(self, timeout=None, callback_func=None):
+    def _compile_signature_cmd(self, record):
         """
-        Wait until trained record is recognized (0d)
+        Compiles the command to check the signature of a record (03)
 
-        This method requires that at least one record is loaded to the
-        recognizer of the module. It waits until ``timeout`` for a response
-        message indicating that the module recognized a voice input.
+        Parameters:
+            record (int): Record number
 
-        A callback function can be defined by ``callback_func``. If no custom
-        callback function is provided (``None``) the default callback function
-        ``_default_callback`` is used.
-        module. The dictionary for the response has the following keys:
+        Returns:
+            command (bytearray): command for the module
+        """
 
-        * raw (bytearray): raw message from module
-        * time_passed_ms (float): time of recognition in miliseconds after invocation
-          of method ``record_recognized()``
-        * records_in_recognizer (array of int): list of records in recognizer
-        * recognized_record (int): the record number of the recognized record
-        * index_recognized_record (int): index of the recognized record in the
-          recognizer
-        * signature_recognized_record (str or None): signature of the recognized
-          record if present, otherwise ``None``
-        * group_mode (int or None): group mode of module
+        return commands.build_check_signature(record)
 
-        A sample custom callback function could look like:
+    def _parse_check_record_signature(self, response_bin, record):
+        """
+        Interprets the response to ``check_record_signature()``
 
-            def custom_callback_function(response):
-                print("Recognized something!")
-                for key, value in response.items():
-                    print("  ", key, value)
-                print("")
+        Parameters:
+            response_bin (list of Frame or None): response messages
+                from the module
+            record (int): record number sent to the module
+
+        Returns:
+            response (dict): dictionary containing the response
+                from the voice recognition module
+        """
+
+        # Initialize dict for return value of this function
+        response_dict = None
+
+        if None != response_bin:
+            # The response from the module will always contain
+            # one single message
+            if 1 == len(response_bin) and 0x03 == response_bin[0][2]:
+                response_dict = decoders.decode_signature(response_bin[0])
+                response_dict["record"] = record
+                self._remember_signature(record, response_dict["signature"])
+                # No signature is reported as empty string
+                if None == response_dict["signature"]:
+                    response_dict["signature"] = ""
+
+        return response_dict
+
+
+    def _compile_train_cmd(self, record, signature):
+        """
+        Compiles the command to train a record without (20) or with signature
+        (21)
 
         Parameters:
-            timeout (int): Timeout in milliseconds to wait for
-                a recognition
-            callback_func (Name of callback function or None): Name
-                of callback function to call when record is recognized.
+            record (int or None): Record number to train
+            signature (str or None): Signature for record
 
         Returns:
-            Nothing
+            command (bytearray or None): command for the module. ``None`` if
+                no record number was given.
+
+        Raises:
+            BadSignature: signature is too long or contains bad characters
         """
 
-        # Initialize dictionary for response
-        response_dict = {
-                "raw": None,
-                "time_passed_ms": None,
-                "records_in_recognizer": None,
-                "recognized_record": None,
-                "index_recognized_record": None,
-                "signature_recognized_record": None,
-                "group_mode": None,
-                }
+        # Check for "good signature"
+        if None != signature:
+            # 1) Length of signature
+            if len(signature) > sign_max_len:
+                raise BadSignature
+            # 2) Search for bad characters
+            for c in range(len(signature)):
+                if (ord(signature[c]) < sign_char_min_ascii
+                        or ord(signature[c]) > sign_char_max_ascii):
+                    raise BadSignature
 
-        # First check status of recognizer. At least one record
-        # has to be loaded to recognizer.
-        status_recognizer = self.check_recognizer()
-        if status_recognizer["no_records_in_recognizer"] > 0:
-            # Populate some values in response_dict
-            response_dict["records_in_recognizer"] = status_recognizer["records_in_recognizer"]
-            response_dict["group_mode"] = status_recognizer["group_mode"]
-
-            if None == timeout:
-                # Set timeout to practically infinite
-                timeout = 10**10       # corresponds to ~ 3 years
-
-            # Default for time_passed_ms in response_dict is
-            # timeout:
-            response_dict["time_passed_ms"] = timeout
-
-            # Check argument callback_func
-            if None == callback_func:
-                # Set to default callback function
-                callback_func = self._default_callback
-
-            # No nead to send any command. Just wait for the module
-            # to send something
-            start = time.time()
-            while (1000 * (time.time() - start) < timeout):
-                # Read response from module
-                response_bin = self._recv_rsp(latency = 0)
-                if None != response_bin:
-                    # We expect a single message
-                    if 1 == len(response_bin):
-                        response_bin = response_bin[0]
-                        # Proceed only if correct message type
-                        if 13 == response_bin[2]:      # \x0d
-                            response_dict["raw"] = response_bin
-                            response_dict["time_passed_ms"] = 1000 * (time.time() - start)
-                            response_dict["recognized_record"] = response_bin[5]
-                            response_dict["index_recognized_record"] = response_bin[6]
-                            sig = response_bin[8:-1]
-                            sigstr = self._bytearr2str(sig)
-                            if "" == sigstr:
-                                sigstr = None
-                            response_dict["signature_recognized_record"] = sigstr
+        # Proceed only if record number was given
+        if None == record:
+            return None
+
+        # If no signature is provided use command 20, else command 21
+        return commands.build_train(record, signature)
+
+    def _parse_train_message(self, response_bin, record, signature):
+        """
+        Interprets a message of the training dialog
+
+        There are two message types:
+
+        1) prompt msg: |\\xaa|[len]|\\x0a|[rec]|[prompt]|\\x0a|
+        2) status msg: |\\xaa|[len]|\\x20|[num]|[rec]|[sta]|[sig]|\\x0a|
+
+        Prompts are printed to the screen. The status message ends the
+        training.
+
+        Parameters:
+            response_bin (Frame): message from the module
+            record (int): record number to train
+            signature (str or None): signature for the record
+
+        Returns:
+            response (dict or None): dictionary containing the status message
+                from the module. ``None`` if the training is not finished.
+        """
+
+        # Initialize response dict
+        response_dict = None
+
+        # Prompt message
+        if 10 == response_bin[2]:       # \x0a
+            msg = decoders.decode_prompt(response_bin)["prompt"]
+            print("Record", record, ":\t", msg)
+
+        # Status message (20: train w/o signature, 21: train with signature)
+        if response_bin[2] in (32, 33): # \x20, \x21
+            # Status message ends training
+            response_dict = decoders.decode_train_result(response_bin)
+            response_dict["record"] = record
+            response_dict["signature"] = signature
+            sta = response_dict["training_status"]
+            print("Training ended.\t", sta)
+
+            # The signature is not known after training without signature
+            if 0 == sta and None != signature:
+                self._remember_signature(record, signature)
+            else:
+                self._signatures.pop(record, None)
+
+        return response_dict
+
+    def _recognition_dict(self, response_bin, time_passed_ms, status_recognizer):
+        """
+        Interprets a recognition message (0d)
+
+        Parameters:
+            response_bin (Frame): message from the module
+            time_passed_ms (float): time of recognition in milliseconds after
+                the monitoring started
+            status_recognizer (dict): response of ``check_recognizer()`` at
+                the start of the monitoring
+
+        Returns:
+            response (RecognitionEvent): result as described in
+                ``record_recognized()``
+        """
+
+        # The fields of the message are decoded on first access
+        response_dict = RecognitionEvent(response_bin,
+                self._recognition_fields,
+                time_passed_ms = time_passed_ms,
+                records_in_recognizer = status_recognizer["records_in_recognizer"],
+                group_mode = status_recognizer["group_mode"],
+                )
+
+        return self._finish(response_dict)
+
+    def _recognized_signature(self, response_bin):
+        """
+        Returns the signature of the record recognized (0d)
+
+        The signature is looked up in the signature table. It is decoded from
+        the message only if unknown or if its length does not match the
+        signature in the message (e.g. changed by another program).
 
-                            # Execute callback function
-                            callback_func(response_dict)
+        Parameters:
+            response_bin (Frame): recognition message from the module
+
+        Returns:
+            signature (str or None): signature of the recognized record
+        """
+
+        record = response_bin[5]
+        sig_len = len(response_bin) - 9
+        sigstr = self._signatures.get(record, "")
+        if "" == sigstr or len(sigstr or "") != sig_len:
+            sigstr = self._remember_signature(record,
+                    self._bytearr2str(response_bin[8:-1]))
+
+        return sigstr
+
+    def _finish(self, response):
+        """
+        Drops the raw messages of a result unless ``keep_raw`` is set
 
-                # Reduce "speed" of while loop to reduce cpu usage
-                time.sleep(0.05)
+        Parameters:
+            response (Result or None): result of a command or recognition
+
+        Returns:
+            response (Result or None): the result
+        """
 
+        if not self.keep_raw and None != response:
+            response.release()
 
+        return response
+
+class PyVoiceRecognitionV3(PyVoiceRecognitionV3Base):
+    """
+    Python class to interact with the Elechouse Voice Recognition Module V3
+    """
+    def __init__(self,
+            device=None,                # Serial device
+            tout=10,                    # Timeout in ms
+            latency=50,                 # Response latency in ms
+        # Read from the module in a background thread and
+        # route recognitions to subscribers (see
+        # start_reader())
+            threaded=False,
+            cache=False,                # Cache the state of the module
+            clock=None,                 # Clock for timeouts
+            metrics=False,              # Collect runtime metrics
+            tracer=None,                # Sink for tracing spans
+            adaptive=False,             # Adapt timeouts to the module
+            records=None,        # Number of record slots
+            keep_raw=True,              # Keep raw messages in results
+            ):
+        """
+        Create an instance of class ``PyVoiceRecognitionModuleV3``
+
+        Returns an instance and immediately opens a serial port connection to
+        the voice recognition module connected to the serial device
+        ``device``.
+
+        Parameters:
+            device (device): serial device
+            tout (int): timeout for the serial communication in milliseconds
+                (ms)
+            latency (int): latency for the response from the module in
+                milliseconds (ms)
+            threaded (bool): if ``True`` start the background reader thread
+                right away (see ``start_reader()``)
+            cache (bool): if ``True`` cache the responses to the commands
+                querying the state of the module (see ``refresh()``)
+            clock (clock or None): clock measuring time and waiting for data
+                (see ``SystemClock``). If ``None`` the clock of the device is
+                used if it has one (e.g. ``MySerMock``), else the clock of
+                the operating system.
+            metrics (bool): if ``True`` collect runtime metrics (see
+                ``stats()``)
+            tracer (callable or None): sink called with a tracing span
+                (dict) for every phase of the communication, e.g.
+                ``RingSink`` or ``JSONLSink``. If ``None`` there is no
+                tracing.
+            adaptive (bool): if ``True`` the timeout is derived from the
+                baud rate of the serial device and the latency from the
+                response latencies observed per command (see
+                ``calibrate()``). ``tout`` and ``latency`` are used until
+                enough responses were observed; ``tout`` bounds the timeout
+                and ``latency`` the latency.
+            records (int or None): number of record slots of the module
+                (V3: 80, V3.1: 255). If given, the check of all records'
+                train status is complete as soon as the status of this many
+                records arrived. If ``None`` it is complete when the line
+                became quiet, which works with any module.
+            keep_raw (bool): if ``False`` results do not keep the raw
+                messages from the module. All fields are decoded right away
+                and the messages are dropped.
+
+        Returns:
+            Nothing
+        """
+
+        super().__init__(device = device, tout = tout, latency = latency,
+                records = records, keep_raw = keep_raw)
+
+        if None == clock:
+            clock = getattr(device, "clock", None) or system_clock
+        self.clock = clock
+
+        # Cached responses of the query commands (command -> response).
+        # None if caching is disabled.
+        self._cache = {} if cache else None
+        self.cache_hits = 0         # Queries answered from the cache
+        self.cache_misses = 0       # Queries sent to the module
+
+        # Threaded mode: the reader thread puts command responses into a
+        # queue and hands recognitions to the subscribers
+        self._reader = None
+        self._responses = queue.Queue()
+        self._subscribers = []
+
+        # Messages received beyond an expected response. They are returned
+        # by the next read.
+        self._backlog = collections.deque()
+
+        # Recognitions (0d) received among the responses to several commands
+        # (see _execute_many()). They are kept for iter_recognitions() and
+        # are not discarded by a new command.
+        self._recognized = collections.deque()
+
+        # Commands collected by a batch (see batch()). While not None,
+        # _execute() queues commands instead of sending them.
+        self._batch = None
+
+        # Runtime metrics (see stats()). None if disabled.
+        self.metrics = Metrics(self._decoder) if metrics else None
+
+        # Sink for the tracing spans. None if disabled.
+        self.tracer = tracer
+
+        # Adaptive timing: response latencies in ms observed per command
+        # byte (command byte -> deque)
+        self.adaptive = adaptive
+        self._latencies = {}
+        # Time the first message of the last response arrived (clock). None
+        # if there was no response.
+        self._first_message = None
+
+        if threaded:
+            self.start_reader()
+
+    def _span(self, name, start, **attrs):
+        """
+        Emit a tracing span ending now
+
+        Only called if tracing is enabled (see ``tracing.py``).
+
+        Parameters:
+            name (str): name of the phase
+            start (float): start time of the phase (``clock``)
+            attrs: attributes of the phase
+
+        Returns:
+            Nothing
+        """
+        span = {"name": name, "start": start, "end": self.clock.monotonic()}
+        span.update(attrs)
+        self.tracer(span)
+
+    def _gap(self):
+        """
+        Returns the timeout ending a response
+
+        With adaptive timing the line counts as quiet after
+        ``adaptive_gap_bytes`` byte times at the baud rate of the serial
+        device (10 bits per byte) plus ``adaptive_margin``, but not before
+        ``self.tout``: the module pauses between the messages of a response
+        for longer than a few byte times. Otherwise the timeout is
+        ``self.tout``.
+
+        Parameters:
+            None
+
+        Returns:
+            tout (float): timeout in milliseconds (ms)
+        """
+        baudrate = getattr(self.ser, "baudrate", None)
+        if not self.adaptive or not baudrate:
+            return self.tout
+        return max(self.tout,
+                adaptive_gap_bytes * 10000. / baudrate + adaptive_margin)
+
+    def _window(self, cmd):
+        """
+        Returns the latency allowed for the response to a command
+
+        With adaptive timing and at least ``adaptive_min_samples`` observed
+        responses the window is the ``adaptive_percentile`` of the observed
+        latencies times ``adaptive_factor`` plus ``adaptive_margin``, but not
+        longer than ``self.latency``. Otherwise it is ``self.latency``.
+
+        Parameters:
+            cmd (int): command byte
+
+        Returns:
+            latency (float): latency in milliseconds (ms)
+        """
+        samples = self._latencies.get(cmd)
+        if (not self.adaptive or None == samples
+                or len(samples) < adaptive_min_samples):
+            return self.latency
+        window = (_percentile(samples, adaptive_percentile) * adaptive_factor
+                + adaptive_margin)
+        return min(window, self.latency)
+
+    def _learn(self, cmd, latency, messages):
+        """
+        Record the response latency of a command for adaptive timing
+
+        The latency is the time until the first message of the response
+        arrived; the window only has to cover this time. A command without
+        response within its window might have been cut short; its samples are
+        dropped, so the next command waits for ``self.latency`` again.
+
+        Parameters:
+            cmd (int): command byte
+            latency (float or None): time in seconds until the first message
+                of the response arrived
+            messages (list of Frame or None): response messages
+
+        Returns:
+            Nothing
+        """
+        if not messages or None == latency:
+            self._latencies.pop(cmd, None)
+            return
+        samples = self._latencies.get(cmd)
+        if None == samples:
+            samples = self._latencies[cmd] = collections.deque(
+                    maxlen = adaptive_samples)
+        samples.append(1000. * latency)
+
+    def latency_stats(self):
+        """
+        Returns the response latencies observed per command
+
+        Only collected with adaptive timing (see ``__init__()``).
+
+        Parameters:
+            None
+
+        Returns:
+            stats (dict): per command byte a dictionary with the number of
+                samples (``n``), the 50th, 90th and 99th percentile of the
+                latencies (``p50``, ``p90``, ``p99``) and the latency
+                window used for the command (``window``), all in ms
+        """
+        stats = {}
+        for cmd in sorted(self._latencies):
+            samples = self._latencies[cmd]
+            stats[cmd] = {
+                    "n": len(samples),
+                    "p50": _percentile(samples, 0.5),
+                    "p90": _percentile(samples, 0.9),
+                    "p99": _percentile(samples, 0.99),
+                    "window": self._window(cmd),
+                    }
+        return stats
+
+    def calibrate(self, repeat=adaptive_min_samples):
+        """
+        Measure the response latencies of the module
+
+        Enables adaptive timing and sends the commands checking the system
+        settings (00), the recognizer (01) and the train status of record 0
+        (02) ``repeat`` times each. Afterwards these commands use windows
+        fitted to the module; other commands adapt as they are used. Cached
+        responses are bypassed.
+
+            vr = PyVoiceRecognitionV3(device=ser)
+            vr.calibrate()
+            vr.latency_stats()[0x01]["window"]
+
+        Parameters:
+            repeat (int): number of times every command is sent
+
+        Returns:
+            stats (dict): observed latencies, see ``latency_stats()``
+        """
+        self.adaptive = True
+
+        cache = self._cache
+        self._cache = None
+        try:
+            for _ in range(repeat):
+                self.check_system_settings()
+                self.check_recognizer()
+                self.check_record_train_status(0)
+        finally:
+            self._cache = cache
+
+        return self.latency_stats()
+
+    def _send_cmd(self, command):
+        """
+        Sends command to the module
+
+        Before sending a comand to the module the input buffer from the serial
+        port will be flushed. This ensures that any response from the module
+        read-in after sending to the module relates to the last command.
+
+        In threaded mode the input buffer is left alone, because it may hold
+        recognitions not yet seen by the reader thread. Instead, responses
+        that nobody waited for are dropped from the response queue.
+
+        Parameters:
+            command (bytearray): command to be send to the module.
+
+        Returns:
+            Nothing
+        """
+        if None != self.tracer:
+            start = self.clock.monotonic()
+        self._cache_invalidate(command)
+        metrics = self.metrics
+        if None != metrics:
+            metrics.discarded(sum(len(m) for m in self._backlog))
+        # A train status beyond the number of records expected means the
+        # module has more records than configured
+        if any(0x02 == m[2] for m in self._backlog):
+            warnings.warn("train status beyond %s records discarded; the "
+                    "module has more records (see records)" % self.records,
+                    RuntimeWarning)
+        self._backlog = collections.deque()
+        if None != self._reader:
+            # Drop stale responses
+            while True:
+                try:
+                    message = self._responses.get_nowait()
+                except queue.Empty:
+                    break
+                if None != metrics:
+                    metrics.discarded(len(message))
+        else:
+            # Before sending a new command clear the input buffer. A partial
+            # frame kept by the decoder is outdated as well.
+            if None != metrics:
+                metrics.discarded(self.ser.in_waiting)
+            self.ser.reset_input_buffer()
+            self._decoder.reset()
+        self.ser.write(command)
+        if None != self.tracer:
+            self._span("send", start, cmd = command[2])
+
+    def _read_chunk(self, timeout, clock=None):
+        """
+        Wait for data from the module and read all pending bytes
+
+        The method blocks until at least one byte is available at the serial
+        port or ``timeout`` expires. Waiting is done by the clock (``clock``),
+        i.e. by the operating system watching the port, or by the serial
+        driver for ports without file descriptor. Either way it does not
+        consume CPU time. As soon as data arrived, all bytes pending in the
+        input buffer are read with a single call.
+
+        Parameters:
+            timeout (int or float): maximum time to wait for the first byte in
+                milliseconds (ms)
+            clock (clock or None): clock to wait with. If ``None``
+                ``self.clock``.
+
+        Returns:
+            data (bytes): data read from the module. Empty if no data arrived
+                within ``timeout``.
+        """
+
+        if None == clock:
+            clock = self.clock
+
+        # Data already pending; no need to wait
+        pending = self.ser.in_waiting
+        if pending:
+            return self.ser.read(pending)
+
+        # Wait for the first byte
+        timeout = max(timeout, 0) / 1000.
+        if not clock.wait_readable(self.ser, timeout):
+            return b''
+        pending = self.ser.in_waiting
+        if pending:
+            return self.ser.read(pending)
+
+        # The port cannot be watched; let the serial driver wait for the
+        # first byte. The timeout of the port is restored afterwards. Only
+        # touch the port settings if the timeout actually changes, because
+        # reconfiguring a real port is not free.
+        saved = self.ser.timeout
+        if saved != timeout:
+            self.ser.timeout = timeout
+        try:
+            data = self.ser.read(1)
+        finally:
+            if saved != timeout:
+                self.ser.timeout = saved
+
+        # Drain whatever arrived together with the first byte
+        if data:
+            pending = self.ser.in_waiting
+            if pending:
+                data += self.ser.read(pending)
+
+        return data
+
+    def _recv_frames(self, timeout):
+        """
+        Wait for the next part of a response
+
+        Messages left over from the previous response are returned first.
+        Without reader thread the next chunk of data is read from the serial
+        port and split into messages. In threaded mode the messages are taken
+        from the response queue filled by the reader thread.
+
+        Parameters:
+            timeout (int or float): maximum time to wait in milliseconds (ms)
+
+        Returns:
+            messages (collections.deque of Frame or None): messages
+                completed by the data received. ``None`` if the line stayed
+                quiet.
+        """
+
+        if self._backlog:
+            messages = self._backlog
+            self._backlog = collections.deque()
+            return messages
+
+        if None == self._reader:
+            data = self._read_chunk(timeout)
+            if not data:
+                return None
+            return collections.deque(self._decoder.feed(data))
+
+        try:
+            messages = collections.deque([self._responses.get(
+                    timeout = max(timeout, 0) / 1000.)])
+        except queue.Empty:
+            return None
+        # Take everything else that is already queued
+        while True:
+            try:
+                messages.append(self._responses.get_nowait())
+            except queue.Empty:
+                break
+        return messages
+
+    def _route(self, message):
+        """
+        Route a message received by the reader thread
+
+        Recognition messages (0d) are passed to all subscribers, all other
+        messages are responses to commands and are put into the response
+        queue.
+
+        Parameters:
+            message (bytearray): message from the module
+
+        Returns:
+            Nothing
+        """
+
+        if 13 == message[2]:        # \x0d
+            for callback in self._subscribers:
+                if None != self.tracer:
+                    start = self.clock.monotonic()
+                    callback(message)
+                    self._span("callback", start, record = message[5])
+                else:
+                    callback(message)
+        else:
+            self._responses.put(message)
+
+    def _recv_rsp(self, tout=None, latency=None, expect=None):
+        """
+        Receive response/data from the module
+
+        The response messages follow a similar format/protocol as the commands.
+        The response can be split up into individual messages.
+
+        Each response is structured as following:
+
+        |\xaa|[len]|[data]|\x0a|
+
+        ``[len]`` is computed by the length in bytes of ``[len]`` itself
+        (always 1) plus the length of ``[data]``.
+
+        A message that is not complete when the line becomes quiet is kept
+        and completed by the next call of this method.
+
+        If the caller knows which response to expect (``expect``), the method
+        returns as soon as this response is complete. Messages received
+        beyond the expected response are returned by the next call.
+        Otherwise, or if the expected response does not arrive, it returns
+        after the line stayed quiet for ``tout``.
+
+        Parameters:
+            tout (int or None): timeout of the serial communication in
+                milliseconds (ms). If ``None`` defaults to ``self.tout``.
+            latency (int): latency for the response from the module in
+                milliseconds (ms). If ``None`` defaults to ``self.latency``.
+            expect (callable or None): expected response, e.g.
+                ``ExpectFrames`` or ``ExpectRecords``. Called with the list of
+                messages received so far; returns ``True`` when the response
+                is complete.
+
+        Returns:
+            messages (array of Frame): the response messages (one or
+                multiple) from the module
+        """
+
+        if None == tout:        # Timeout in ms
+            tout = self.tout
+        if None == latency:     # Latency in ms
+            latency = self.latency
+
+        # The response from the voice recognition module consists
+        # of one or multiple messages following a specific format.
+        # A message begins with a frame head (\xaa) followed by a
+        # specific number of data fields and finally a frame end
+        # (\x0a or \n). The first data field after the frame head
+        # denotes the number of data fields between the frame head
+        # and the frame end. The decoder splits the byte stream
+        # into these messages as the data arrives.
+
+        # For the first byte of the response allow a specific
+        # latency. The serial driver blocks until data arrives,
+        # so no CPU time is spent while waiting.
+        if None != self.tracer:
+            start = self.clock.monotonic()
+        messages = []
+        frames = self._recv_frames(latency) or collections.deque()
+        if self.adaptive:
+            self._first_message = self.clock.monotonic() if frames else None
+        if None != self.tracer:
+            self._span("wait_first", start, messages = len(frames))
+            start = self.clock.monotonic()
+
+        # Read rest of response in chunks until the expected
+        # response is complete or the line stays quiet for the
+        # timeout (tout)
+        while True:
+            # Take over the messages one by one. Messages beyond
+            # the expected response are kept for the next read.
+            while frames:
+                messages.append(frames.popleft())
+                if None != expect and expect(messages):
+                    self._backlog = frames
+                    if None != self.tracer:
+                        self._span("drain", start, messages = len(messages))
+                    return messages
+
+            frames = self._recv_frames(tout)
+            if None == frames:
+                break
+
+        if None != self.tracer:
+            self._span("drain", start, messages = len(messages))
+
+        # If messages is empty than set it to None
+        if [] == messages:
+            messages = None
+
+        return messages
+
+    def _execute(self, command, expect, parse, *args):
+        """
+        Sends a command to the module and interprets the response
+
+        See ``PyVoiceRecognitionV3Base._execute()``.
+
+        Parameters:
+            command (bytearray): command to be sent to the module
+            expect (callable): expected response (e.g. ``ExpectFrames``)
+            parse (callable): method interpreting the response
+            args: additional arguments for ``parse``
+
+        Returns:
+            response: return value of ``parse``
+        """
+
+        if None != self._batch:
+            self._batch.append((command, expect, parse, args))
+            return None
+
+        # State already known needs no round trip
+        if None != self._cache and command[2] in cache_queries:
+            response = self._cache.get(bytes(command))
+            if None != response:
+                self.cache_hits += 1
+                return response
+            self.cache_misses += 1
+
+        start = self.clock.monotonic()
+        self._send_cmd(command)
+        if self.adaptive:
+            messages = self._recv_rsp(tout = self._gap(),
+                    latency = self._window(command[2]), expect = expect)
+            first = self._first_message
+            self._learn(command[2], None if None == first else first - start,
+                    messages)
+        else:
+            messages = self._recv_rsp(expect = expect)
+        if None != self.metrics:
+            self.metrics.command(command, self.clock.monotonic() - start,
+                    messages)
+        if None != self.tracer:
+            parsed = self.clock.monotonic()
+            response = parse(messages, *args)
+            self._span("parse", parsed, cmd = command[2])
+            self._span("command", start, cmd = command[2])
+        else:
+            response = parse(messages, *args)
+        self._cache_store(command, response)
+        return response
+
+    def _cache_store(self, command, response):
+        """
+        Store the response to a query command in the cache
+
+        Only interpreted responses (results) are stored; raw messages
+        (see ``send_cmd()``) and missing responses are not.
+
+        Parameters:
+            command (bytearray): command sent to the module
+            response: return value of the command's parse method
+
+        Returns:
+            Nothing
+        """
+
+        if (None != self._cache and command[2] in cache_queries
+                and isinstance(response, (dict, Result))):
+            self._cache[bytes(command)] = response
+
+    def _cache_invalidate(self, command):
+        """
+        Drop the cached responses outdated by a command
+
+        Parameters:
+            command (bytearray): command(s) sent to the module. Several
+                commands can be joined.
+
+        Returns:
+            Nothing
+        """
+
+        if not self._cache:
+            return
+
+        # Walk over the joined commands
+        p = 0
+        while p + 2 < len(command):
+            cmd = command[p+2]
+            p += command[p+1] + 2
+            if cmd in cache_queries:
+                continue
+            outdated = cache_invalidation.get(cmd)
+            if None == outdated:
+                self._cache.clear()
+                return
+            for key in [k for k in self._cache if k[2] in outdated]:
+                del self._cache[key]
+
+    def refresh(self, signatures=False):
+        """
+        Read the state of the module into the cache
+
+        All cached responses are dropped. Then the system settings, the
+        recognizer and the train status of all records are queried again.
+        With caching enabled, later queries of this state are answered
+        without a round trip to the module until a command changes it.
+
+        Parameters:
+            signatures (bool): if ``True`` the signatures of the trained
+                records are read as well (see ``scan_signatures()``)
+
+        Returns:
+            Nothing
+        """
+
+        if None != self._cache:
+            self._cache.clear()
+
+        self.check_system_settings()
+        self.check_recognizer()
+        if signatures:
+            self.scan_signatures()
+        else:
+            self.check_record_train_status()
+
+    def _execute_many(self, requests):
+        """
+        Sends several commands back-to-back and interprets the responses
+
+        All commands are written to the module at once. The response messages
+        are assigned to the commands by their command byte and in the order
+        the commands were sent: a message belongs to the first command of the
+        same type whose response is not complete yet. An error message from
+        the module belongs to the first incomplete command. Recognitions (0d)
+        no command waits for are kept for ``iter_recognitions()``.
+
+        Parameters:
+            requests (list of tuple): ``(command, expect, parse, args)`` for
+                every command, see ``_execute()``. If ``expect`` is ``None``
+                all messages of the command's type are collected until the
+                line becomes quiet.
+
+        Returns:
+            responses (list): return values of ``parse`` in the order of
+                ``requests``
+        """
+
+        n = len(requests)
+        messages = [[] for i in range(n)]
+        complete = [False] * n
+
+        # Message types belonging to each command
+        cmds = []
+        for command, expect, parse, args in requests:
+            if None != expect:
+                cmds.append(expect.cmd)
+            else:
+                cmds.append((command[2],))
+
+        start = self.clock.monotonic()
+        self._send_cmd(b''.join(r[0] for r in requests))
+
+        # The first response is waited for as long as the slowest command
+        # needs
+        latency = max(self._window(r[0][2]) for r in requests)
+        tout = self._gap()
+        frames = self._recv_frames(latency) or collections.deque()
+        n_complete = 0
+        while n_complete < n:
+            if not frames:
+                frames = self._recv_frames(tout)
+                if None == frames:
+                    break
+                continue
+            frame = frames.popleft()
+            for i in range(n):
+                if complete[i]:
+                    continue
+                if frame[2] in cmds[i] or frame_cmd_error == frame[2]:
+                    messages[i].append(frame)
+                    expect = requests[i][1]
+                    if None != expect and expect(messages[i]):
+                        complete[i] = True
+                        n_complete += 1
+                    break
+            else:
+                if 13 == frame[2]:      # \x0d
+                    self._recognized.append(frame)
+
+        # Keep messages beyond the responses for the next read
+        if None != frames:
+            self._backlog = frames
+
+        # The commands share the time until all responses were complete
+        if None != self.metrics:
+            latency = self.clock.monotonic() - start
+            for i in range(n):
+                self.metrics.command(requests[i][0], latency, messages[i])
+
+        responses = []
+        for i in range(n):
+            command, expect, parse, args = requests[i]
+            if None != self.tracer:
+                parsed = self.clock.monotonic()
+                responses.append(parse(messages[i] or None, *args))
+                self._span("parse", parsed, cmd = command[2])
+                self._span("command", start, cmd = command[2])
+            else:
+                responses.append(parse(messages[i] or None, *args))
+            # Commands changing the state outdate the responses of the
+            # queries sent before them
+            self._cache_invalidate(command)
+            self._cache_store(command, responses[i])
+        return responses
+
+    def stats(self):
+        """
+        Returns a snapshot of the runtime metrics
+
+        The metrics are only collected if the instance was created with
+        ``metrics=True``. See ``Metrics.snapshot()`` for the content.
+
+        Parameters:
+            None
+
+        Returns:
+            metrics (dict or None): snapshot of the metrics. ``None`` if
+                metrics are disabled.
+        """
+        if None == self.metrics:
+            return None
+        return self.metrics.snapshot()
+
+    def export_metrics(self, target, labels=None):
+        """
+        Write the runtime metrics in the text format of Prometheus
+
+        See ``Metrics.write_prometheus()``.
+
+        Parameters:
+            target (str): path of a file or of a Unix domain socket
+            labels (dict or None): labels added to every sample, e.g.
+                ``{"device": "kitchen"}``
+
+        Returns:
+            Nothing
+        """
+        if None != self.metrics:
+            self.metrics.write_prometheus(target, labels = labels)
+
+    def send_many(self, cmd_list, expects=None):
+        """
+        Sending several commands to the module at once and receiving the
+        responses
+
+        The commands are written back-to-back without waiting for the
+        responses in between. See ``_execute_many()`` for how the response
+        messages are assigned to the commands.
+
+            vr.send_many([vr._compile_cmd(b'\\x00'), vr._compile_cmd(b'\\x01')],
+                    [ExpectFrames(0x00), ExpectFrames(0x01)])
+
+        Parameters:
+            cmd_list (list of bytearray): commands to be sent to the module
+            expects (list of callable or None): expected response for every
+                command (see ``_recv_rsp()``). If ``None`` wait until the
+                line becomes quiet.
+
+        Returns:
+            responses (list of array of Frame): response messages from
+                the module for every command (``None`` if there is none)
+        """
+
+        if None == expects:
+            expects = [None] * len(cmd_list)
+
+        requests = [(cmd_list[i], expects[i], lambda messages: messages, ())
+                for i in range(len(cmd_list))]
+        return self._execute_many(requests)
+
+    def batch(self):
+        """
+        Collect commands and send them at once
+
+        Inside the ``with`` block, commands called on the batch object are
+        compiled and queued. When the block ends, all commands are written
+        back-to-back and the responses are interpreted as usual:
+
+            with vr.batch() as b:
+                b.set_signature(1, "on")
+                b.set_signature(2, "off")
+                b.check_record_train_status(1)
+            print(b.results)
+
+        Every command pays the latency of the module only once per batch
+        instead of once per command. Only commands consisting of a single
+        command/response exchange can be batched (the commands of
+        ``PyVoiceRecognitionV3Base``). A module might not be able to buffer
+        an arbitrary number of commands, so keep batches reasonably small.
+
+        Parameters:
+            None
+
+        Returns:
+            batch (Batch): context manager collecting the commands
+        """
+
+        return Batch(self)
+
+    def send_cmd(self, command, expect=None):
+        """
+        Sending a command to the module and receiving response(s)
+
+        Parameters:
+            command (bytearray): command to be sent to the module
+            expect (callable or None): expected response (see
+                ``_recv_rsp()``). If ``None`` wait until the line becomes
+                quiet.
+
+        Returns:
+            messages (array of Frame): response messages from
+                the module
+        """
+
+        start = self.clock.monotonic()
+        self._send_cmd(command)
+        messages = self._recv_rsp(expect = expect)
+        if None != self.metrics:
+            self.metrics.command(command, self.clock.monotonic() - start,
+                    messages)
+        if None != self.tracer:
+            self._span("command", start, cmd = command[2])
+        return messages
+
+    def start_reader(self, poll=100):
+        """
+        Start threaded mode
+
+        A background thread takes over the serial port. It routes
+        recognitions (0d) to the subscribers (see ``subscribe()``) and command
+        responses to the caller waiting for them. Thus, the module can be
+        queried or reconfigured while it keeps recognizing, without losing
+        recognitions. Commands have to be issued from one thread at a time.
+
+        Parameters:
+            poll (int): maximum time in milliseconds (ms) a single read of the
+                reader thread blocks
+
+        Returns:
+            Nothing
+        """
+
+        if None == self._reader:
+            self._decoder.reset()
+            self._reader = ReaderThread(self, poll = poll)
+            self._reader.start()
+
+    def stop_reader(self):
+        """
+        Stop threaded mode
+
+        Parameters:
+            None
+
+        Returns:
+            Nothing
+        """
+
+        if None != self._reader:
+            self._reader.stop()
+            self._reader = None
+
+    def subscribe(self, callback):
+        """
+        Subscribe to recognitions received in threaded mode
+
+        The callback is called from the reader thread with the recognition
+        message (bytearray) as its only argument. It should return quickly,
+        because no other message is read while it runs.
+
+        Parameters:
+            callback (callable): function to call for every recognition
+
+        Returns:
+            Nothing
+        """
+
+        # Replace rather than modify the list, so the reader thread can
+        # iterate over it without locking
+        self._subscribers = self._subscribers + [callback]
+
+    def unsubscribe(self, callback):
+        """
+        Remove a subscription made with ``subscribe()``
+
+        Parameters:
+            callback (callable): function passed to ``subscribe()``
+
+        Returns:
+            Nothing
+        """
+
+        self._subscribers = [c for c in self._subscribers if c != callback]
+
+    def check_record_signature(self, record=None):
+        """
+        Check the signature of a record (03)
+
+        The method returns a dictionary containing the response message from
+        the module:
+
+            response_dict = {
+                "raw": response_bin,
+                "record": record,
+                "signature": signature,
+                    }
+
+        The signature for a record (optional) can be considered as a "label"
+        for the record. In principle, the module allows any ASCII character
+        with ASCII code < 255. The maximum number of characters for the
+        signature is 26 (derived from test on module V3.1). To avoid any
+        potential problems the character range is limited from "!" (ASCII 33)
+        to "~" (ASCII 126).
+
+        Parameters:
+            record (int): Record number
+
+        Returns:
+            response (dict): dictionary containing the response
+                from the voice recognition module
+        """
+
+        # Initialize response dict
+        response_dict = None
+
+        # Proceed only if record number was given
+        if None != record:
+            # If this method is applied to a record that is not trained and has
+            # no signature it will not return meaningful results. The signature
+            # returned by the module will contain some random characters. This
+            # is an issue of the module. Therefore, as a first step determine
+            # the traning status of the record. Only, if the record is trained
+            # ask the module for the signature.
+
+            # Get training status for the record
+            sta = self.check_record_train_status(record)["train_status"][0]
+
+            if "trained" == sta:
+                # Compile and send command; read response from module
+                command = self._compile_signature_cmd(record)
+                response_dict = self._execute(command, ExpectFrames(0x03),
+                        self._parse_check_record_signature, record)
+            else:
+                # For untrained records no meaningful response from the module
+                # can be retrieved
+                response_dict = {
+                        "raw": None,
+                        "record": record,
+                        "signature": None,
+                        }
+
+        return response_dict
+
+    def scan_signatures(self, batch_size=10):
+        """
+        Scan the signatures of all trained records
+
+        The train status of all records is queried with a single command
+        (02). The signatures (03) are then fetched only for the trained
+        records, several commands at once (see ``batch()``). This takes a few
+        round trips instead of two per record.
+
+        The method returns a dictionary mapping every trained record to its
+        signature (``None`` if the record has no signature):
+
+            signatures = {
+                    record: signature,
+                    }
+
+        Parameters:
+            batch_size (int): maximum number of signature commands sent at
+                once
+
+        Returns:
+            signatures (dict or None): signatures of the trained records.
+                ``None`` if the module did not respond.
+        """
+
+        status = self.check_record_train_status()
+        if None == status:
+            return None
+
+        # Only for trained records the module returns meaningful signatures
+        trained = []
+        for i in range(len(status["trained_records"])):
+            if "trained" == status["train_status"][i]:
+                trained.append(status["trained_records"][i])
+
+        signatures = {}
+        for i in range(0, len(trained), batch_size):
+            requests = []
+            for record in trained[i:i+batch_size]:
+                requests.append((self._compile_signature_cmd(record),
+                        ExpectFrames(0x03),
+                        self._parse_check_record_signature, (record,)))
+
+            for response_dict in self._execute_many(requests):
+                if None != response_dict:
+                    sign = response_dict["signature"]
+                    if "" == sign:
+                        sign = None
+                    signatures[response_dict["record"]] = sign
+
+        return signatures
+
+    def _probe(self, baudrate):
+        """
+        Switch the host port to a baud rate and check whether the module
+        answers (00)
+
+        The response is waited for as long as the command and the response
+        take on the wire at this baud rate plus the latency.
+
+        Parameters:
+            baudrate (int): baud rate
+
+        Returns:
+            response (SystemSettings or None): system settings of the module.
+                ``None`` if the module did not answer at this baud rate.
+        """
+
+        if self.ser.baudrate != baudrate:
+            self.ser.baudrate = baudrate
+
+        # Command (4 bytes) and response (10 bytes), 10 bits per byte
+        command = commands.cmd_check_system_settings
+        wire = 1000. * 10 * (len(command) + 10) / baudrate
+        self._send_cmd(command)
+        messages = self._recv_rsp(latency = self.latency + wire,
+                expect = ExpectFrames(0x00))
+
+        for message in messages or ():
+            if 0x00 == message[2] and 10 == len(message):
+                return decoders.decode_system_settings(message)
+        return None
+
+    def negotiate_baudrate(self, target, restart=None):
+        """
+        Switch module and host port to a new baud rate
+
+        The module is told to use the baud rate ``target`` (see
+        ``set_baudrate()``), the host port is switched to it as well and the
+        connection is verified by checking the system settings (00). A
+        higher baud rate shortens the time every message takes on the wire
+        (9600 baud: ~1 ms per byte).
+
+        The module switches to the new baud rate only when it is restarted.
+        ``restart`` can be given to do so (e.g. by power cycling the module).
+        If the module still answers at the old baud rate, the host port is
+        switched back and the module will use the new baud rate after its
+        next restart.
+
+        Parameters:
+            target (int): baud rate
+            restart (callable or None): function restarting the module;
+                called without arguments after the module acknowledged the
+                new baud rate
+
+        Returns:
+            baudrate (int or None): baud rate used by module and host port
+                now. ``None`` if the module did not acknowledge the new baud
+                rate (the host port is left unchanged) or answered at neither
+                baud rate.
+
+        Raises:
+            BadBaudrate: When an unsupported baud rate is given
+        """
+
+        old = self.ser.baudrate
+        response = self.set_baudrate(target)
+
+        # Proceed only if the module acknowledged the command; it answers
+        # with an error message (ff) if it rejected it
+        acknowledged = False
+        for message in response["raw"] or ():
+            if frame_cmd_error == message[2]:
+                return None
+            if 0x11 == message[2]:
+                acknowledged = True
+        if not acknowledged:
+            return None
+
+        if None != restart:
+            restart()
+
+        for baudrate in (target, old):
+            if None != self._probe(baudrate):
+                return baudrate
+
+        # Leave the host port at the baud rate it was opened with
+        self.ser.baudrate = old
+        return None
+
+    def detect_baudrate(self, rates=None):
+        """
+        Find the baud rate of a module left at an unknown speed
+
+        The host port is switched to every supported baud rate until the
+        module answers the check of its system settings (00). The host port
+        is left at the baud rate found.
+
+        Parameters:
+            rates (list of int or None): baud rates to try. If ``None`` the
+                baud rate of the host port followed by
+                ``baudrate_probe_order``.
+
+        Returns:
+            baudrate (int or None): baud rate of the module. ``None`` if the
+                module answered at none of the baud rates; the host port is
+                then left at its original baud rate.
+        """
+
+        old = self.ser.baudrate
+        if None == rates:
+            rates = [old] + [r for r in baudrate_probe_order if r != old]
+
+        for baudrate in rates:
+            if None != self._probe(baudrate):
+                return baudrate
+
+        self.ser.baudrate = old
+        return None
+
+    def train_record(self, record=None, signature=None):
+        """
+        Train a record without (20) or with signature (21)
+
+        The method returns a dictionary containing the response message from
+        the module:
+
+            response_dict = {
+                "raw": response_bin,
+                "record": record,
+                "signature": signature,
+                "training_status": sta
+                    }
+
+        The signature for a record (optional) can be considered as a "label"
+        for the record. In principle, the module allows any ASCII character
+        with ASCII code < 255. The maximum number of characters for the
+        signature is 26 (derived from test on module V3.1). To avoid any
+        potential problems the character range is limited from "!" (ASCII 33)
+        to "~" (ASCII 126).
+
+        Parameters:
+            record (int): Record number to train
+            signature (str or None): Signature for record
+
+        Returns:
+            response (dict): dictionary containing the response
+                from the voice recognition module
+
+        Raises:
+            BadSignature: signature is too long or contains bad characters
+        """
+
+        # Code from elechouse Arduino library
+        #  train method:
+        #  https://github.com/elechouse/VoiceRecognitionV3/blob/964d022/VoiceRecognitionV3.cpp#L95
+
+        # Initialize response dict
+        response_dict = None
+
+        # Compile command; check signature
+        command = self._compile_train_cmd(record, signature)
+
+        # Proceed only if record number was given
+        if None != record:
+            # Send command
+            start = self.clock.monotonic()
+            received = []               # all messages of the dialog
+            self._send_cmd(command)
+
+            dialog_tout = 8             # timeout for dialog with module
+                                        # in seconds
+            tick = self.clock.monotonic()   # start time for timeout watchdog
+            train_finished = False      # indicator if training finished
+
+            # Every prompt or status message of the dialog is handled
+            # as soon as it is complete
+            expect = ExpectFrames((0x0a, 0x20, 0x21))
+
+            # Loop until dialog timeout or training is finished
+            while (self.clock.monotonic() - tick < dialog_tout
+                    and not train_finished):
+                # Read data from module
+                messages = self._recv_rsp(expect = expect)
+
+                if None != messages:
+                    # Reset timeout watchdog
+                    tick = self.clock.monotonic()
+                    received.extend(messages)
+
+                    for response_bin in messages:
+                        status = self._parse_train_message(response_bin,
+                                record, signature)
+                        # Status message ends training
+                        if None != status:
+                            train_finished = True
+                            response_dict = status
+
+            if None != self.metrics:
+                self.metrics.command(command, self.clock.monotonic() - start,
+                        received)
+            if None != self.tracer:
+                self._span("command", start, cmd = command[2])
+
+        return response_dict
+
+    def iter_recognitions(self, timeout=None, max_events=None, stop_event=None):
+        """
+        Iterate over the records recognized by the module (0d)
+
+        Generator variant of ``record_recognized()``. It yields a dictionary
+        (see ``record_recognized()``) for every recognition as soon as its
+        message is complete. Events are produced lazily and nothing is kept
+        after an event was yielded, so the generator can feed pipelines of
+        arbitrary length:
+
+            for event in vr.iter_recognitions(timeout=20000, max_events=3):
+                print(event["recognized_record"])
+
+        This method requires that at least one record is loaded to the
+        recognizer of the module. Otherwise the iteration ends immediately.
+
+        Parameters:
+            timeout (int or None): Time in milliseconds after which the
+                iteration ends. If ``None`` there is no time limit.
+            max_events (int or None): Number of recognitions after which the
+                iteration ends. If ``None`` there is no limit.
+            stop_event (threading.Event or None): The iteration ends when
+                the event is set. It is checked at least every 100 ms.
+
+        Returns:
+            events (iterator of dict): recognitions
+        """
+
+        # First check status of recognizer. At least one record
+        # has to be loaded to recognizer.
+        status_recognizer = self.check_recognizer()
+        if (None == status_recognizer
+                or status_recognizer["no_records_in_recognizer"] == 0):
+            return
+
+        if None == timeout:
+            # Set timeout to practically infinite
+            timeout = 10**10       # corresponds to ~ 3 years
+
+        # A recognition is handled as soon as its message is
+        # complete
+        recognition = ExpectFrames(0x0d)
+
+        # In threaded mode the reader thread hands over the
+        # recognitions through a queue
+        if None != self._reader:
+            recognitions = queue.Queue()
+            self.subscribe(recognitions.put)
+
+        # No nead to send any command. Just wait for the module
+        # to send something
+        n_events = 0
+        start = self.clock.monotonic()
+        try:
+            while (1000 * (self.clock.monotonic() - start) < timeout):
+                if None != max_events and n_events >= max_events:
+                    break
+                if None != stop_event and stop_event.is_set():
+                    break
+
+                # Time to wait for the next recognition. Wake up
+                # regularly to check stop_event.
+                remaining = timeout - 1000 * (self.clock.monotonic() - start)
+                if None != stop_event:
+                    remaining = min(remaining, 100)
+
+                # Read response from module. Recognitions received
+                # while waiting for responses come first.
+                if self._recognized:
+                    messages = [self._recognized.popleft()]
+                elif None != self._reader:
+                    try:
+                        messages = [recognitions.get(timeout = max(remaining, 0) / 1000.)]
+                    except queue.Empty:
+                        messages = None
+                else:
+                    # Block until the next recognition is complete
+                    # or the time is up. The response contains at
+                    # most one recognition.
+                    messages = self._recv_rsp(latency = remaining,
+                            expect = recognition)
+
+                if None != messages:
+                    for response_bin in messages:
+                        # Proceed only if correct message type
+                        if 13 == response_bin[2]:      # \x0d
+                            n_events += 1
+                            if None != self.metrics:
+                                self.metrics.recognition(response_bin[5])
+                            yield self._recognition_dict(response_bin,
+                                    1000 * (self.clock.monotonic() - start),
+                                    status_recognizer)
+        finally:
+            if None != self._reader:
+                self.unsubscribe(recognitions.put)
+
+    def record_recognized(self, timeout=None, callback_func=None):
+        """
+        Wait until trained record is recognized (0d)
+
+        This method requires that at least one record is loaded to the
+        recognizer of the module. It waits until ``timeout`` for a response
+        message indicating that the module recognized a voice input.
+
+        The method sleeps in the serial driver until data arrives and calls
+        the callback function as soon as a recognition message is complete.
+
+        A callback function can be defined by ``callback_func``. If no custom
+        callback function is provided (``None``) the default callback function
+        ``_default_callback`` is used.
+        The callback receives a ``RecognitionEvent`` result. Its fields can be
+        read like the keys of a dictionary:
+
+        * raw (bytearray): raw message from module
+        * time_passed_ms (float): time of recognition in miliseconds after invocation
+          of method ``record_recognized()``
+        * records_in_recognizer (array of int): list of records in recognizer
+        * recognized_record (int): the record number of the recognized record
+        * index_recognized_record (int): index of the recognized record in the
+          recognizer
+        * signature_recognized_record (str or None): signature of the recognized
+          record if present, otherwise ``None``
+        * group_mode (int or None): group mode of module
+
+        A sample custom callback function could look like:
+
+            def custom_callback_function(response):
+                print("Recognized something!")
+                for key, value in response.items():
+                    print("  ", key, value)
+                print("")
+
+        Parameters:
+            timeout (int): Timeout in milliseconds to wait for
+                a recognition
+            callback_func (Name of callback function or None): Name
+                of callback function to call when record is recognized.
+
+        Returns:
+            Nothing
+        """
+
+        # Check argument callback_func
+        if None == callback_func:
+            # Set to default callback function
+            callback_func = self._default_callback
+
+        for response_dict in self.iter_recognitions(timeout = timeout):
+            # Execute callback function
+            if None != self.tracer:
+                start = self.clock.monotonic()
+                callback_func(response_dict)
+                self._span("callback", start,
+                        record = response_dict["recognized_record"])
+            else:
+                callback_func(response_dict)
+
+class Batch:
+    """
+    Commands collected by ``PyVoiceRecognitionV3.batch()``
+
+    The batch offers the commands of ``PyVoiceRecognitionV3Base``. Calling
+    one queues it and returns its index in ``results``, or ``None`` if the
+    call had nothing to send (e.g. no record given). The commands are sent
+    when the ``with`` block ends; ``results`` then holds the response
+    dictionaries in the order the commands were called.
+    """
+    def __init__(self, vr):
+        """
+        Initialize instance
+
+        Parameters:
+            vr (PyVoiceRecognitionV3): driver the commands are sent with
+
+        Returns:
+            Nothing
+        """
+
+        self.vr = vr
+        self.requests = []
+        self.results = None
+
+    def __getattr__(self, name):
+        """
+        Returns a function queuing the command ``name``
+
+        Parameters:
+            name (str): name of the command
+
+        Returns:
+            function (callable): queues the command and returns its index
+                (``None`` if nothing was queued)
+
+        Raises:
+            AttributeError: ``name`` is no command that can be batched
+        """
+
+        if (name.startswith("_")
+                or not callable(getattr(PyVoiceRecognitionV3Base, name, None))):
+            raise AttributeError(name)
+        method = getattr(self.vr, name)
+
+        def queue_command(*args, **kwargs):
+            n = len(self.requests)
+            self.vr._batch = self.requests
+            try:
+                method(*args, **kwargs)
+            finally:
+                self.vr._batch = None
+            if len(self.requests) == n:
+                return None
+            return n
+
+        return queue_command
+
+    def send(self):
+        """
+        Send the queued commands and interpret the responses
+
+        Called automatically at the end of the ``with`` block.
+
+        Parameters:
+            None
+
+        Returns:
+            results (list): response of every command
+        """
+
+        if self.requests:
+            self.results = self.vr._execute_many(self.requests)
+        else:
+            self.results = []
+        self.requests = []
+        return self.results
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Do not send anything if the block failed
+        if None == exc_type:
+            self.send()
+        return False
+
+def _percentile(samples, q):
+    """
+    Returns a percentile of samples (nearest rank)
+
+    Parameters:
+        samples (iterable of float): samples; not empty
+        q (float): percentile between 0 and 1
+
+    Returns:
+        value (float): smallest sample not exceeded by the fraction ``q`` of
+            the samples
+    """
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
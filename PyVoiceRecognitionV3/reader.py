@@ -0,0 +1,78 @@
+import threading
+import traceback
+
+from .clock import system_clock
+
+class ReaderThread(threading.Thread):
+    """
+    Background thread owning the serial port of a ``PyVoiceRecognitionV3``
+    instance
+
+    The thread continuously reads from the module, splits the byte stream
+    into messages and hands every message to the instance for routing (see
+    ``PyVoiceRecognitionV3._route()``). Recognition messages go to the
+    subscribers, everything else to the caller waiting for a command
+    response.
+
+    The thread always waits for data in real time. A virtual clock (e.g. the
+    one of ``MySerMock``) only advances when somebody waits on it, so the
+    thread would spin through its timeouts without ever blocking, while the
+    caller waits for the responses in real time.
+    """
+    def __init__(self, vr, poll=100):
+        """
+        Initialize instance
+
+        Parameters:
+            vr (PyVoiceRecognitionV3): instance the thread reads for
+            poll (int): maximum time in milliseconds (ms) a single read blocks.
+                This is the time it can take for the thread to notice a stop
+                request if the serial port cannot cancel a pending read.
+
+        Returns:
+            Nothing
+        """
+        super().__init__(name="PyVoiceRecognitionV3-reader", daemon=True)
+        self.vr = vr
+        self.poll = poll
+        self.clock = vr.clock if vr.clock.realtime else system_clock
+        self._stop_event = threading.Event()
+
+    def run(self):
+        """
+        Read and route messages until stopped
+
+        Parameters:
+            None
+
+        Returns:
+            Nothing
+        """
+        vr = self.vr
+        while not self._stop_event.is_set():
+            data = vr._read_chunk(self.poll, clock = self.clock)
+            if data:
+                for frame in vr._decoder.feed(data):
+                    try:
+                        vr._route(frame)
+                    except Exception:
+                        # A failing subscriber must not stop the reader
+                        traceback.print_exc()
+
+    def stop(self):
+        """
+        Stop the thread and wait until it exited
+
+        Parameters:
+            None
+
+        Returns:
+            Nothing
+        """
+        self._stop_event.set()
+        # Wake up a read blocking in the serial driver (pyserial >= 3.0 on
+        # POSIX); otherwise the read returns after at most ``poll`` ms.
+        cancel_read = getattr(self.vr.ser, "cancel_read", None)
+        if None != cancel_read:
+            cancel_read()
+        self.join()
@@ -0,0 +1,245 @@
+# Result types returned by the commands of the drivers. They replace the
+# dictionaries returned before but still behave like read-only dictionaries,
+# so code written for the dictionaries keeps working.
+
+class Result:
+    """
+    Base class of the result types
+
+    The fields of a result are stored in slots (no per-instance dictionary)
+    and can be accessed as attributes or, for compatibility, like the keys of
+    a dictionary:
+
+        rsp = vr.check_recognizer()
+        rsp.records_in_recognizer
+        rsp["records_in_recognizer"]
+        rsp.to_dict()
+
+    A result compares equal to a dictionary with the same keys and values.
+
+    Every result type holds the raw message(s) from the module (``raw``); the
+    other fields are the slots of the result type. ``_fields`` lists all
+    fields in the order of the keys.
+    """
+    __slots__ = ("raw",)
+    _fields = __slots__
+
+    def __init__(self, **fields):
+        """
+        Initialize instance
+
+        Parameters:
+            fields: value of every field of the result type
+
+        Returns:
+            Nothing
+        """
+        for name in fields:
+            setattr(self, name, fields[name])
+
+    def to_dict(self):
+        """
+        Returns the result as dictionary
+
+        Parameters:
+            None
+
+        Returns:
+            result (dict): dictionary with one key per field
+        """
+        return {name: getattr(self, name) for name in self._fields}
+
+    def keys(self):
+        """
+        Returns the names of the fields
+
+        Parameters:
+            None
+
+        Returns:
+            keys (tuple of str): names of the fields
+        """
+        return self._fields
+
+    def values(self):
+        """
+        Returns the values of the fields
+
+        Parameters:
+            None
+
+        Returns:
+            values (list): value of every field in the order of ``keys()``
+        """
+        return [getattr(self, name) for name in self._fields]
+
+    def items(self):
+        """
+        Returns the fields as (name, value) pairs
+
+        Parameters:
+            None
+
+        Returns:
+            items (list of tuple): ``(name, value)`` of every field
+        """
+        return [(name, getattr(self, name)) for name in self._fields]
+
+    def get(self, key, default=None):
+        """
+        Returns the value of a field
+
+        Parameters:
+            key (str): name of the field
+            default: value returned if there is no such field
+
+        Returns:
+            value: value of the field or ``default``
+        """
+        if key in self._fields:
+            return getattr(self, key)
+        return default
+
+    def __getitem__(self, key):
+        if key in self._fields:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self._fields
+
+    def __iter__(self):
+        return iter(self._fields)
+
+    def __len__(self):
+        return len(self._fields)
+
+    def __eq__(self, other):
+        if isinstance(other, Result):
+            return (type(self) == type(other)
+                    and self.values() == other.values())
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    __hash__ = None
+
+    def release(self):
+        """
+        Drop the raw message(s) of the result
+
+        Parameters:
+            None
+
+        Returns:
+            Nothing
+        """
+        self.raw = None
+
+    def __repr__(self):
+        return "%s(%s)" % (type(self).__name__, ", ".join(
+                "%s=%r" % (name, getattr(self, name))
+                for name in self._fields))
+
+class LazyResult(Result):
+    """
+    Base class of the result types decoded from a single message
+
+    A lazy result keeps a reference to the message and decodes a field only
+    when it is read for the first time. The decoded value is stored in the
+    field's slot, so later reads cost no more than reading an attribute:
+
+        settings = SystemSettings(frame, settings_fields)
+        settings.baudrate   # decoded now
+        settings.baudrate   # read from the slot
+
+    Fields can also be given as keyword arguments; these are not decoded.
+    ``release()`` decodes all remaining fields and drops the message.
+    """
+    __slots__ = ("_frame", "_decoders")
+
+    def __init__(self, _frame=None, _decoders=None, **fields):
+        """
+        Initialize instance
+
+        Parameters:
+            _frame (Frame or None): message the fields are decoded from
+            _decoders (dict or None): function decoding each field from the
+                message (field name -> function)
+            fields: values of fields known already
+
+        Returns:
+            Nothing
+        """
+        self._frame = _frame
+        self._decoders = _decoders
+        super().__init__(**fields)
+
+    def __getattr__(self, name):
+        # Only called if the slot of a field is not set yet
+        if name.startswith("_") or None == self._decoders:
+            raise AttributeError(name)
+        try:
+            decode = self._decoders[name]
+        except KeyError:
+            raise AttributeError(name) from None
+        value = decode(self._frame)
+        setattr(self, name, value)
+        return value
+
+    def release(self):
+        """
+        Decode all fields and drop the message
+
+        Parameters:
+            None
+
+        Returns:
+            Nothing
+        """
+        for name in self._fields:
+            getattr(self, name)
+        self._frame = None
+        self._decoders = None
+        super().release()
+
+class SystemSettings(LazyResult):
+    """
+    Response to ``check_system_settings()`` (00)
+    """
+    __slots__ = ("trained", "rec_value_out_of_range", "baudrate",
+            "output_io_mode", "output_io_pulse_width_ms", "autoload",
+            "group_control")
+    _fields = Result._fields + __slots__
+
+class RecognizerStatus(LazyResult):
+    """
+    Response to ``check_recognizer()`` (01)
+    """
+    __slots__ = ("no_records_in_recognizer", "records_in_recognizer",
+            "group_mode")
+    _fields = Result._fields + __slots__
+
+class TrainStatus(Result):
+    """
+    Response to ``check_record_train_status()`` (02)
+    """
+    __slots__ = ("no_trained_records", "trained_records", "train_status")
+    _fields = Result._fields + __slots__
+
+class LoadResult(Result):
+    """
+    Response to ``load_to_recognizer()`` (30)
+    """
+    __slots__ = ("no_records_in_recognizer", "records_in_recognizer",
+            "status")
+    _fields = Result._fields + __slots__
+
+class RecognitionEvent(LazyResult):
+    """
+    Record recognized by the module (0d), see ``record_recognized()``
+    """
+    __slots__ = ("time_passed_ms", "records_in_recognizer",
+            "recognized_record", "index_recognized_record",
+            "signature_recognized_record", "group_mode")
+    _fields = Result._fields + __slots__
@@ -0,0 +1,701 @@
+import bisect
+import threading
+
+from .clock import system_clock
+from .decoders import br_conv
+from .framing import FrameDecoder, frame_cmd_error
+from .mysermock import MySerMock
+
+# Number of records of the module versions
+sim_records_v3 = 80
+sim_records_v31 = 255
+
+# Number of records in the recognizer and number of output IO pins
+sim_recognizer_size = 7
+
+# Number of user groups
+sim_user_groups = 8
+
+# Prompts of the training dialog
+sim_train_prompts = (b'Speak now', b'Speak again')
+
+# Status of a record loaded to the recognizer (30)
+sim_load_success = 0x00
+sim_load_out_of_range = 0xff
+sim_load_untrained = 0xfe
+sim_load_full = 0xfd
+sim_load_already = 0xfc
+
+def _frame(*data):
+    """
+    Compiles a message of the module
+
+    Parameters:
+        data (int or bytes): command byte and data of the message
+
+    Returns:
+        frame (bytes): message incl. frame head, length and frame end
+    """
+    payload = bytearray()
+    for d in data:
+        if isinstance(d, int):
+            payload.append(d)
+        else:
+            payload += d
+    return b'\xaa' + bytes((len(payload) + 1,)) + bytes(payload) + b'\x0a'
+
+class VR3Simulator(MySerMock):
+    """
+    Simulator of the Elechouse Voice Recognition Module V3 behind a serial
+    port
+
+    The simulator can be used instead of a serial port (``pyserial.Serial``)
+    with every driver. It interprets the commands written to it and answers
+    like the module:
+
+        sim = VR3Simulator()
+        vr = PyVoiceRecognitionV3(device=sim)
+        sim.train(1, "on")              # or vr.train_record(1, "on")
+        vr.load_to_recognizer(1)
+        sim.recognize(1)
+        vr.record_recognized(timeout=100)
+
+    Modelled are the record slots (80 for V3, 255 for V3.1) with train
+    status and signature, the recognizer with 7 slots, the system settings,
+    the training dialog, the output IO pins, the user groups and
+    recognitions injected by ``recognize()`` or ``schedule()``.
+
+    With ``timing`` enabled every byte takes the time of 10 bits at the
+    module's baud rate to arrive, and the module answers after
+    ``response_delay``. Otherwise all responses are available right away;
+    recognitions scheduled for later still arrive at their time. Commands
+    written with a baud rate (``baudrate``) other than the module's are not
+    understood and stay unanswered. Like the module, the simulator switches
+    to a new baud rate only when it is restarted (``restart()``).
+
+    The simulator runs in real time (``clock`` is the clock of the operating
+    system), so it also works with the threaded reader, the asyncio driver
+    and the ``DeviceManager``.
+    """
+    def __init__(self,
+            records=sim_records_v3,     # Number of record slots
+            timing=False,               # Model transmission and delays
+            response_delay=0.001,       # Processing time in seconds
+            train_delay=None,           # Time between training prompts
+            baudrate=9600,              # Baud rate of the host port
+            timeout=None,               # Read timeout in seconds
+            module_baudrate=9600,       # Baud rate of the module
+            immediate_baudrate=False,   # Switch baud rate without restart
+            ):
+        """
+        Initialize instance
+
+        Parameters:
+            records (int): number of record slots (80 or 255)
+            timing (bool): if ``True`` model the transmission time of every
+                byte and the response delay of the module
+            response_delay (float): time in seconds the module takes to
+                answer a command (only with ``timing``)
+            train_delay (float or None): time in seconds between the prompts
+                of the training dialog. If ``None`` 1 s with ``timing``,
+                otherwise 0.
+            baudrate (int): baud rate of the host's serial port
+            timeout (float or None): read timeout in seconds. ``None`` blocks
+                until the requested bytes arrived (or nothing more is
+                expected).
+            module_baudrate (int): baud rate the module starts with
+            immediate_baudrate (bool): if ``True`` the module switches to a
+                new baud rate right after acknowledging the command.
+                Otherwise, like the module, only at the next ``restart()``.
+
+        Returns:
+            Nothing
+        """
+
+        super().__init__(timeout = timeout, clock = system_clock)
+        self.timeout = timeout
+        self.baudrate = baudrate
+
+        self.timing = timing
+        self.response_delay = response_delay if timing else 0
+        if None == train_delay:
+            train_delay = 1. if timing else 0
+        self.train_delay = train_delay
+
+        # Module state
+        self.records = records
+        self.trained = [False] * records
+        self.signatures = [b''] * records
+        self.recognizer = []
+        self.user_groups = [[] for g in range(sim_user_groups)]
+        self.outputs = [0] * sim_recognizer_size
+        self.train_success = True   # Outcome of the next trainings
+        self.immediate_baudrate = immediate_baudrate
+        self.restore_system_settings()
+        # Baud rate stored in the settings and baud rate in use
+        self.baudrate_setting = module_baudrate
+        self.module_baudrate = module_baudrate
+
+        # Messages not yet arrived at the host: sorted list of [start time,
+        # sequence number, data, baud rate]. The line transmits them one
+        # after the other.
+        self._pending = []
+        self._seq = 0
+        self._line_free = 0.        # Time the line finishes the last byte
+        self._rx_free = 0.          # Time the module received the last byte
+        self._decoder = FrameDecoder()
+        self._cond = threading.Condition()
+        self._timer = None
+
+    # Module state
+
+    def restore_system_settings(self):
+        """
+        Restore the system settings to the defaults
+
+        Parameters:
+            None
+
+        Returns:
+            Nothing
+        """
+        self.baudrate_setting = 9600
+        if self.immediate_baudrate:
+            self.module_baudrate = 9600
+        self.output_io_mode = 0         # pulse
+        self.output_io_pulse_width = 0  # 10 ms
+        self.autoload = []
+        self.group_control = 0
+
+    def restart(self):
+        """
+        Simulate a restart (power cycle) of the module
+
+        The module switches to the baud rate of its settings, loads the
+        records set for power on auto load to the recognizer and drops
+        messages not yet sent.
+
+        Parameters:
+            None
+
+        Returns:
+            Nothing
+        """
+        with self._cond:
+            self.module_baudrate = self.baudrate_setting
+            self.recognizer = list(self.autoload[:sim_recognizer_size])
+            self.outputs = [0] * sim_recognizer_size
+            self._pending = []
+            self._decoder.reset()
+            self._ring()
+
+    def train(self, record, signature=None):
+        """
+        Mark a record as trained (without training dialog)
+
+        Parameters:
+            record (int): record number
+            signature (str or None): signature of the record
+
+        Returns:
+            Nothing
+        """
+        with self._cond:
+            self.trained[record] = True
+            self.signatures[record] = (signature or "").encode("latin-1")
+
+    def recognize(self, record, delay=0):
+        """
+        Simulate the recognition of a record
+
+        The module reports a record only if it is in the recognizer.
+
+        Parameters:
+            record (int): record number
+            delay (float): time in seconds until the record is spoken
+
+        Returns:
+            recognized (bool): ``True`` if the record is in the recognizer
+        """
+        with self._cond:
+            if record not in self.recognizer:
+                return False
+            index = self.recognizer.index(record)
+            sig = self.signatures[record]
+            self._send(self._now() + delay,
+                    _frame(0x0d, 0x00, 0xff, record, index, len(sig), sig))
+            self._set_output(index)
+            return True
+
+    def schedule(self, events):
+        """
+        Simulate recognitions at given times
+
+        Parameters:
+            events (iterable of tuple): ``(delay, record)`` for every
+                recognition. ``delay`` is the time in seconds from now.
+
+        Returns:
+            Nothing
+        """
+        for delay, record in events:
+            self.recognize(record, delay)
+
+    def _set_output(self, index):
+        """
+        Drive the output IO pin of a recognizer slot
+
+        Parameters:
+            index (int): recognizer slot
+
+        Returns:
+            Nothing
+        """
+        if 1 == self.output_io_mode:         # toggle
+            self.outputs[index] ^= 1
+        elif 2 == self.output_io_mode:       # set
+            self.outputs[index] = 1
+        elif 3 == self.output_io_mode:       # clear
+            self.outputs[index] = 0
+        # pulse: the pin returns to its level after the pulse
+
+    # Transmission
+
+    def _now(self):
+        return self.clock.monotonic()
+
+    def _byte_time(self, baudrate=None):
+        """
+        Returns the transmission time of one byte (10 bits) in seconds
+        """
+        if not self.timing:
+            return 0.
+        return 10. / (baudrate or self.module_baudrate)
+
+    def _send(self, start, data):
+        """
+        Queue a message for transmission to the host
+
+        Parameters:
+            start (float): earliest time the transmission starts
+            data (bytes): message
+
+        Returns:
+            Nothing
+        """
+        # The message is sent with the current baud rate of the module
+        self._seq += 1
+        bisect.insort(self._pending,
+                [start, self._seq, data, self.module_baudrate])
+        self._cond.notify_all()
+        self._ring()
+
+    def _deliver(self):
+        """
+        Move the bytes arrived by now into the input buffer
+
+        Parameters:
+            None
+
+        Returns:
+            Nothing
+        """
+        now = self._now()
+        while self._pending:
+            start, seq, data, baudrate = self._pending[0]
+            start = max(start, self._line_free)
+            if now < start:
+                break
+            byte_time = self._byte_time(baudrate)
+            if byte_time:
+                n = min(len(data), int((now - start) / byte_time))
+            else:
+                n = len(data)
+            if 0 == n:
+                break
+            # At a different baud rate the host receives garbage
+            if self.baudrate == baudrate:
+                self.inbuffer.extend(data[:n])
+            else:
+                self.inbuffer.extend(bytes(n))
+            self._line_free = start + n * byte_time
+            if n == len(data):
+                self._pending.pop(0)
+            else:
+                self._pending[0] = [self._line_free, seq, data[n:], baudrate]
+                break
+
+    def _next_arrival(self):
+        """
+        Returns the time the next byte arrives or ``None``
+        """
+        if not self._pending:
+            return None
+        start = max(self._pending[0][0], self._line_free)
+        return start + self._byte_time(self._pending[0][3])
+
+    def _ring(self):
+        """
+        Make the doorbell pipe (see ``fileno()``) readable if and only if
+        bytes arrived. A timer rings it when the next byte arrives.
+
+        Parameters:
+            None
+
+        Returns:
+            Nothing
+        """
+        if None == self._doorbell:
+            return
+        self._deliver()
+        super()._ring()
+
+        if None != self._timer:
+            self._timer.cancel()
+            self._timer = None
+        arrival = self._next_arrival()
+        if None != arrival and not len(self.inbuffer):
+            self._timer = threading.Timer(max(arrival - self._now(), 0),
+                    self._on_timer)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _on_timer(self):
+        with self._cond:
+            self._ring()
+
+    def close(self):
+        """
+        Release the file descriptors and the timer
+
+        Parameters:
+            None
+
+        Returns:
+            Nothing
+        """
+        with self._cond:
+            if None != self._timer:
+                self._timer.cancel()
+                self._timer = None
+            super().close()
+
+    # Serial port interface
+
+    def read(self, n_bytes=1):
+        """
+        Read data received from the module
+
+        Like ``pyserial`` the method waits until ``n_bytes`` arrived or the
+        timeout (``timeout``) expired. Without timeout it returns as soon as
+        no more data is expected.
+
+        Parameters:
+            n_bytes (int): number of bytes to read
+
+        Returns:
+            data (bytes): data read (can be less than ``n_bytes``)
+        """
+        with self._cond:
+            deadline = None
+            if None != self.timeout:
+                deadline = self._now() + self.timeout
+            while True:
+                self._deliver()
+                if len(self.inbuffer) >= n_bytes:
+                    break
+                wake = self._next_arrival()
+                if None != deadline:
+                    if self._now() >= deadline:
+                        break
+                    if None == wake or wake > deadline:
+                        wake = deadline
+                elif None == wake:
+                    break
+                self._cond.wait(max(wake - self._now(), 0))
+
+            data = bytes(self.inbuffer[:n_bytes])
+            del self.inbuffer[:n_bytes]
+            self._ring()
+            return data
+
+    def readinto(self, buffer):
+        """
+        Read data received from the module into a writable buffer
+
+        Parameters:
+            buffer (bytearray or memoryview): buffer to be filled
+
+        Returns:
+            length (int): number of bytes read (see ``read()``)
+        """
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    @property
+    def in_waiting(self):
+        """
+        Number of bytes arrived and not read yet
+        """
+        with self._cond:
+            self._deliver()
+            return len(self.inbuffer)
+
+    def reset_input_buffer(self):
+        """
+        Discard the bytes arrived and not read yet
+
+        Parameters:
+            None
+
+        Returns:
+            Nothing
+        """
+        with self._cond:
+            self._deliver()
+            del self.inbuffer[:]
+            self._ring()
+
+    def cancel_read(self):
+        """
+        Wake up a pending ``read()``
+        """
+        with self._cond:
+            self._cond.notify_all()
+
+    def write(self, data):
+        """
+        Write commands to the module
+
+        Parameters:
+            data (bytes): command(s)
+
+        Returns:
+            length (int): number of bytes written
+        """
+        with self._cond:
+            self.outbuffer.extend(data)
+
+            # Time the module received the command(s)
+            now = self._now()
+            received = max(now, self._rx_free) + len(data) * self._byte_time()
+            self._rx_free = received
+
+            # At a different baud rate the module receives garbage
+            if self.baudrate != self.module_baudrate:
+                self._decoder.reset()
+                return len(data)
+
+            for command in self._decoder.feed(data):
+                self._execute(command, received + self.response_delay)
+        return len(data)
+
+    # Protocol
+
+    def _execute(self, command, t):
+        """
+        Execute a command and queue the response
+
+        Parameters:
+            command (Frame): command from the host
+            t (float): time the response starts
+
+        Returns:
+            Nothing
+        """
+        cmd = command[2]
+        args = bytes(command[3:-1])
+        handler = getattr(self, "_cmd_%02x" % cmd, None)
+        try:
+            response = handler(args, t) if None != handler else None
+        except (IndexError, ValueError):
+            response = None
+
+        # Handlers return the response or False if they queued it already
+        if None == response:
+            response = _frame(frame_cmd_error, cmd)
+        if response:
+            self._send(t, response)
+
+    def _check(self, record):
+        """
+        Returns the train status of a record (02)
+        """
+        if record >= self.records:
+            return 0xff
+        return 1 if self.trained[record] else 0
+
+    def _cmd_00(self, _args, _t):
+        # Check system settings
+        return _frame(0x00, 0x00, br_conv.index(self.baudrate_setting, 1),
+                self.output_io_mode, self.output_io_pulse_width,
+                1 if self.autoload else 0, self.group_control)
+
+    def _cmd_01(self, _args, _t):
+        # Check recognizer
+        slots = self.recognizer + [0xff] * (sim_recognizer_size
+                - len(self.recognizer))
+        return _frame(0x01, len(self.recognizer), bytes(slots), 0xff)
+
+    def _cmd_02(self, args, t):
+        # Check record train status
+        if b'\xff' == args:
+            records = range(self.records)
+        else:
+            records = args
+        n = sum(self.trained)
+        pairs = bytearray()
+        for r in records:
+            pairs += bytes((r, self._check(r)))
+        # Long lists are split over several messages of 10 records
+        for p in range(0, max(len(pairs), 1), 20):
+            self._send(t, _frame(0x02, n, pairs[p:p+20]))
+        return False
+
+    def _cmd_03(self, args, _t):
+        # Check signature of record
+        r = args[0]
+        sig = self.signatures[r]
+        return _frame(0x03, r, len(sig), sig)
+
+    def _cmd_10(self, _args, _t):
+        # Restore system settings
+        response = _frame(0x10, 0x00)
+        self.restore_system_settings()
+        return response
+
+    def _cmd_11(self, args, t):
+        # Set baud rate. The response is sent with the old baud rate.
+        self.baudrate_setting = br_conv[args[0]]
+        self._send(t, _frame(0x11, 0x00))
+        if self.immediate_baudrate:
+            self.module_baudrate = self.baudrate_setting
+        return False
+
+    def _cmd_12(self, args, _t):
+        # Set output IO mode
+        if args[0] >= 4:
+            raise ValueError
+        self.output_io_mode = args[0]
+        return _frame(0x12, 0x00)
+
+    def _cmd_13(self, args, _t):
+        # Set output IO pulse width
+        if args[0] >= 16:
+            raise ValueError
+        self.output_io_pulse_width = args[0]
+        return _frame(0x13, 0x00)
+
+    def _cmd_14(self, args, _t):
+        # Reset output IO
+        for pin in (args or range(sim_recognizer_size)):
+            self.outputs[pin] = 0
+        return _frame(0x14, 0x00)
+
+    def _cmd_15(self, args, _t):
+        # Set power on auto load
+        self.autoload = list(args[1:]) if args[0] else []
+        return _frame(0x15, 0x00)
+
+    def _cmd_20(self, args, t, signature=b''):
+        # Train record(s): prompt dialog, then status message
+        r = args[0]
+        if r >= self.records:
+            raise ValueError
+        for prompt in sim_train_prompts:
+            self._send(t, _frame(0x0a, r, prompt))
+            t += self.train_delay
+        cmd = 0x21 if signature else 0x20
+        if self.train_success:
+            self.trained[r] = True
+            self.signatures[r] = signature
+            sta = 0x00
+        else:
+            sta = 0x01
+        self._send(t, _frame(cmd, 1, r, sta, signature))
+        return False
+
+    def _cmd_21(self, args, t):
+        # Train record with signature
+        return self._cmd_20(args[:1], t, args[1:])
+
+    def _cmd_22(self, args, _t):
+        # Set signature
+        r = args[0]
+        self.signatures[r] = args[1:]
+        return _frame(0x22, 0x00)
+
+    def _load(self, records):
+        """
+        Load records to the recognizer
+
+        Parameters:
+            records (iterable of int): record numbers
+
+        Returns:
+            status (bytearray): record/status pairs
+        """
+        pairs = bytearray()
+        for r in records:
+            if r >= self.records:
+                sta = sim_load_out_of_range
+            elif not self.trained[r]:
+                sta = sim_load_untrained
+            elif r in self.recognizer:
+                sta = sim_load_already
+            elif len(self.recognizer) >= sim_recognizer_size:
+                sta = sim_load_full
+            else:
+                self.recognizer.append(r)
+                sta = sim_load_success
+            pairs += bytes((r, sta))
+        return pairs
+
+    def _cmd_30(self, args, _t):
+        # Load to recognizer
+        pairs = self._load(args)
+        return _frame(0x30, len(self.recognizer), pairs)
+
+    def _cmd_31(self, _args, _t):
+        # Clear recognizer
+        self.recognizer = []
+        return _frame(0x31, 0x00)
+
+    def _cmd_32(self, args, t):
+        # Group control
+        sub = args[0]
+        if 0x00 == sub:
+            # Set group control by external IO
+            if 0xff != args[1]:
+                self.group_control = args[1]
+            return _frame(0x32, 0x00, self.group_control)
+
+        elif 0x01 == sub:
+            # Load system group
+            g = args[1]
+            self.recognizer = []
+            self._load(range(7 * g, min(7 * g + 7, self.records)))
+            return _frame(0x32, 0x01, g, 0x00)
+        elif 0x02 == sub:
+            # Set user group
+            g = args[1]
+            self.user_groups[g] = list(args[2:2+sim_recognizer_size])
+            return _frame(0x32, 0x02, g, 0x00)
+        elif 0x03 == sub:
+            # Load user group
+            g = args[1]
+            self.recognizer = []
+            self._load(self.user_groups[g])
+            return _frame(0x32, 0x03, g, 0x00)
+        elif 0x04 == sub:
+            # Check user group(s)
+            if 0xff == args[1]:
+                groups = range(sim_user_groups)
+            else:
+                groups = (args[1],)
+            for g in groups:
+                response = _frame(0x32, 0x04, g, bytes(self.user_groups[g]))
+                self._send(t, response)
+            return False
+        raise ValueError
@@ -0,0 +1,134 @@
+# Sinks for the tracing spans of a driver. A span covers one phase of the
+# communication with the module:
+#
+#   command     command from sending until the response was interpreted
+#   send        flushing the input buffer and writing the command
+#   wait_first  waiting for the first message of the response (latency)
+#   drain       receiving the rest of the response
+#   parse       interpreting the response
+#   callback    user callback handling a recognition
+#
+# A span is a dictionary with the name of the phase, its start and end time
+# (seconds, clock of the driver) and attributes of the phase, e.g.:
+#
+#   {"name": "wait_first", "start": 12.5, "end": 12.55, "cmd": 1}
+#
+# Any callable taking a span can be used as sink.
+
+import collections
+import json
+import threading
+
+class RingSink:
+    """
+    Keeps the latest spans in memory
+
+        sink = RingSink(1000)
+        vr = PyVoiceRecognitionV3(device=ser, tracer=sink)
+        ...
+        for span in sink.spans():
+            print(span["name"], span["end"] - span["start"])
+    """
+    def __init__(self, size=1024):
+        """
+        Initialize instance
+
+        Parameters:
+            size (int): number of spans kept. Older spans are dropped.
+
+        Returns:
+            Nothing
+        """
+        self._spans = collections.deque(maxlen = size)
+
+    def __call__(self, span):
+        self._spans.append(span)
+
+    def spans(self, name=None):
+        """
+        Returns the spans kept, oldest first
+
+        Parameters:
+            name (str or None): return only the spans of this phase. If
+                ``None`` all spans.
+
+        Returns:
+            spans (list of dict): spans
+        """
+        spans = list(self._spans)
+        if None != name:
+            spans = [s for s in spans if name == s["name"]]
+        return spans
+
+    def clear(self):
+        """
+        Drop all spans
+
+        Parameters:
+            None
+
+        Returns:
+            Nothing
+        """
+        self._spans.clear()
+
+class JSONLSink:
+    """
+    Appends the spans to a file, one JSON object per line
+
+    The file is closed by ``close()`` or at the end of a ``with`` block:
+
+        with JSONLSink("spans.jsonl") as sink:
+            vr = PyVoiceRecognitionV3(device=ser, tracer=sink)
+            vr.check_recognizer()
+    """
+    def __init__(self, path):
+        """
+        Initialize instance; opens the file
+
+        Parameters:
+            path (str): path of the file. Spans are appended.
+
+        Returns:
+            Nothing
+        """
+        self._file = open(path, "a", encoding = "utf-8")
+        self._lock = threading.Lock()
+
+    def __call__(self, span):
+        line = json.dumps(span) + "\n"
+        with self._lock:
+            self._file.write(line)
+
+    def flush(self):
+        """
+        Write buffered spans to the file
+
+        Parameters:
+            None
+
+        Returns:
+            Nothing
+        """
+        with self._lock:
+            self._file.flush()
+
+    def close(self):
+        """
+        Close the file
+
+        Parameters:
+            None
+
+        Returns:
+            Nothing
+        """
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+#
+# Benchmarks for the hot paths of the driver. They run offline against the
+# serial device mockup (MySerMock) and the module simulator (VR3Simulator),
+# compare the results with stored baselines and fail on regressions.
+#
+# Timings depend on the machine. A calibration loop of plain Python code is
+# measured with every run and stored with the baseline; the results are
+# scaled by the ratio of the two calibration times before comparing, so a
+# baseline recorded on another machine remains usable. Still, a baseline
+# recorded on the machine running the comparison is the most accurate.
+#
+# Run from the root of the repository:
+#
+#   $ python -m benchmarks.bench                 # compare with baseline
+#   $ python -m benchmarks.bench --save          # store new baseline
+#   $ python -m benchmarks.bench --threshold 0.5 # allow 50 % deviation
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import time
+
+from PyVoiceRecognitionV3 import PyVoiceRecognitionV3, MySerMock
+from PyVoiceRecognitionV3 import VR3Simulator, system_clock
+
+# Default location of the stored baselines
+baseline_file = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+        "baseline.json")
+
+# Default maximum relative deviation from the baseline before a result
+# counts as regression
+default_threshold = 0.3
+
+# Messages used to build the traffic
+msg_recognizer = b'\xaa\x0b\x01\x01\x05\xff\xff\xff\xff\xff\xff\xff\x0a'
+msg_recognition = b'\xaa\x09\x0d\x00\xff\x05\x00\x02on\x0a'
+msg_settings = b'\xaa\x08\x00\x00\x00\x00\x00\x00\x00\x0a'
+garbage = b'\x00\x13\xaa\x01\x42'     # false frame head forces a resync
+
+class ChunkMock(MySerMock):
+    """
+    Mockup handing out the input buffer in chunks of limited size, like the
+    buffer of a serial driver
+    """
+    def __init__(self, inbuffer, chunk):
+        super().__init__(inbuffer = inbuffer, timeout = 0)
+        self.chunk = chunk
+
+    @property
+    def in_waiting(self):
+        """
+        Number of bytes handed out by the next read
+        """
+        return min(len(self.inbuffer), self.chunk)
+
+def bench_decode(size=2**22, chunk=4096):
+    """
+    Frame decoding throughput
+
+    Mixed valid messages and garbage bytes are read and split into messages
+    by ``_recv_rsp()``.
+
+    Parameters:
+        size (int): number of bytes of traffic
+        chunk (int): maximum number of bytes per read
+
+    Returns:
+        throughput (float): megabytes per second
+    """
+    unit = msg_recognition + garbage + msg_settings
+    traffic = unit * (size // len(unit))
+    v = PyVoiceRecognitionV3(device=ChunkMock(traffic, chunk))
+
+    start = time.perf_counter()
+    n_messages = 0
+    while True:
+        messages = v._recv_rsp(tout=0, latency=0)
+        if None == messages:
+            break
+        n_messages += len(messages)
+    elapsed = time.perf_counter() - start
+
+    assert n_messages == 2 * (size // len(unit))
+    return len(traffic) / elapsed / 1e6
+
+# Commands measured by bench_round_trip(): name -> function calling the
+# command on a driver
+round_trip_commands = {
+        "check_system_settings": lambda v: v.check_system_settings(),
+        "check_recognizer": lambda v: v.check_recognizer(),
+        "check_record_train_status": lambda v: v.check_record_train_status(1),
+        "check_record_signature": lambda v: v.check_record_signature(1),
+        "set_signature": lambda v: v.set_signature(1, "on"),
+        "train_record": lambda v: v.train_record(2, "off"),
+        "restore_system_settings": lambda v: v.restore_system_settings(),
+        "set_baudrate": lambda v: v.set_baudrate(9600),
+        "set_output_io_mode": lambda v: v.set_output_io_mode("pulse"),
+        "set_output_io_pulse_width":
+            lambda v: v.set_output_io_pulse_width(10),
+        "reset_output_io": lambda v: v.reset_output_io(),
+        "load_to_recognizer": lambda v: v.load_to_recognizer(1),
+        "clear_recognizer": lambda v: v.clear_recognizer(),
+        }
+
+def bench_round_trip(repeat=500):
+    """
+    Round trip latency of the commands
+
+    The commands are answered by the simulator without transmission delays,
+    so the latency is the time spent by the driver and the simulator.
+
+    Parameters:
+        repeat (int): number of calls per command
+
+    Returns:
+        latencies (dict): median latency in microseconds per command
+    """
+    sim = VR3Simulator(records=255)
+    sim.train(1, "on")
+    v = PyVoiceRecognitionV3(device=sim)
+
+    # The training dialog prints the prompts of the module
+    latencies = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        for name in round_trip_commands:
+            command = round_trip_commands[name]
+            samples = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                command(v)
+                samples.append(time.perf_counter() - start)
+            latencies[name] = 1e6 * statistics.median(samples)
+
+    sim.close()
+    return latencies
+
+def bench_recognitions(n_events=100000):
+    """
+    Recognitions per second sustained by ``record_recognized()``
+
+    Parameters:
+        n_events (int): number of recognitions
+
+    Returns:
+        rate (float): recognitions per second
+    """
+    dev = MySerMock()
+    dev.append_to_inbuffer(msg_recognizer + n_events * msg_recognition)
+    v = PyVoiceRecognitionV3(device=dev)
+    events = []
+
+    start = time.perf_counter()
+    v.record_recognized(timeout=1000, callback_func=events.append)
+    elapsed = time.perf_counter() - start
+
+    assert len(events) == n_events
+    return n_events / elapsed
+
+def bench_idle(seconds=5):
+    """
+    CPU time consumed while monitoring a silent module
+
+    The driver waits for recognitions in real time (clock of the operating
+    system) but none arrive.
+
+    Parameters:
+        seconds (float): time to monitor in seconds
+
+    Returns:
+        cpu (float): CPU seconds per monitored minute
+    """
+    dev = MySerMock(clock=system_clock)
+    dev.append_to_inbuffer(msg_recognizer)
+    v = PyVoiceRecognitionV3(device=dev)
+
+    start = time.process_time()
+    v.record_recognized(timeout=1000 * seconds, callback_func=print)
+    cpu = time.process_time() - start
+
+    dev.close()
+    return cpu * 60 / seconds
+
+def bench_calibration(repeat=10):
+    """
+    Speed of the machine running the benchmarks
+
+    A fixed workload of plain Python code (byte handling, dictionaries,
+    function calls) similar to the driver's is timed.
+
+    Parameters:
+        repeat (int): number of runs; the median counts
+
+    Returns:
+        elapsed (float): time in seconds for the workload
+    """
+    def work():
+        table = {}
+        data = bytes(range(256)) * 64
+        for _ in range(1000):
+            pos = 0
+            while True:
+                pos = data.find(b'\xaa', pos)
+                if pos < 0:
+                    break
+                table[pos] = table.get(pos, 0) + data[pos-1]
+                pos += 1
+        return table
+
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        work()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+def run(idle=5):
+    """
+    Run all benchmarks
+
+    Parameters:
+        idle (float): time in seconds for the idle monitoring benchmark
+
+    Returns:
+        results (dict): metric name -> {"value", "unit", "better", "slack"}.
+            ``better`` is "higher" or "lower". ``slack`` is an absolute
+            deviation tolerated in addition to the threshold, for metrics
+            whose values are close to the noise. ``scaled`` marks metrics
+            depending on the speed of the machine (see ``compare()``).
+            ``calibration`` holds the time of the calibration workload.
+    """
+    results = {}
+    results["calibration"] = {"value": bench_calibration(),
+            "unit": "s", "better": "lower"}
+    results["decode_throughput"] = {"value": bench_decode(),
+            "unit": "MB/s", "better": "higher", "scaled": True}
+    latencies = bench_round_trip()
+    for name in latencies:
+        results["round_trip_" + name] = {"value": latencies[name],
+                "unit": "us", "better": "lower", "scaled": True}
+    results["recognitions_per_second"] = {"value": bench_recognitions(),
+            "unit": "1/s", "better": "higher", "scaled": True}
+    # A few milliseconds of CPU time per minute are noise
+    results["idle_cpu_per_minute"] = {"value": bench_idle(idle),
+            "unit": "s", "better": "lower", "slack": 0.06}
+    return results
+
+def compare(results, baseline, threshold):
+    """
+    Compare results with the baseline
+
+    Metrics marked ``scaled`` are compared with the baseline adjusted to the
+    speed of the machine: a machine taking twice as long for the
+    calibration workload is expected to take twice as long (or reach half
+    the rate) as well. A calibration within the threshold of the stored one
+    is taken as noise of the same machine and the baseline is not adjusted.
+    The calibration itself is never a regression.
+
+    Parameters:
+        results (dict): results of ``run()``
+        baseline (dict): stored results of ``run()``
+        threshold (float): maximum relative deviation in the worse direction
+
+    Returns:
+        regressions (list of str): names of the metrics that regressed
+    """
+    factor = 1.
+    if "calibration" in results and "calibration" in baseline:
+        factor = (results["calibration"]["value"]
+                / baseline["calibration"]["value"])
+        if 1 / (1 + threshold) <= factor <= 1 + threshold:
+            factor = 1.
+
+    regressions = []
+    for name in results:
+        if name not in baseline or "calibration" == name:
+            continue
+        value = results[name]["value"]
+        base = baseline[name]["value"]
+        if results[name].get("scaled"):
+            if "higher" == results[name]["better"]:
+                base /= factor
+            else:
+                base *= factor
+        slack = results[name].get("slack", 0)
+        if "higher" == results[name]["better"]:
+            regressed = value < base * (1 - threshold) - slack
+        else:
+            regressed = value > base * (1 + threshold) + slack
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+def main(argv=None):
+    """
+    Run the benchmarks and compare them with the baseline
+
+    Parameters:
+        argv (list of str or None): command line arguments. If ``None``
+            ``sys.argv`` is used.
+
+    Returns:
+        status (int): exit status; 1 if a benchmark regressed, else 0
+    """
+    parser = argparse.ArgumentParser(description =
+            "Benchmarks for PyVoiceRecognitionV3")
+    parser.add_argument("--baseline", default = baseline_file,
+            help = "file with the stored baseline (default: %(default)s)")
+    parser.add_argument("--threshold", type = float,
+            default = default_threshold,
+            help = "maximum relative deviation from the baseline "
+                "(default: %(default)s)")
+    parser.add_argument("--idle", type = float, default = 5,
+            help = "seconds of idle monitoring (default: %(default)s)")
+    parser.add_argument("--save", action = "store_true",
+            help = "store the results as new baseline")
+    args = parser.parse_args(argv)
+
+    results = run(idle = args.idle)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding = "utf-8") as f:
+            baseline = json.load(f)
+
+    regressions = compare(results, baseline, args.threshold)
+    for name in results:
+        line = "%-40s %12.3f %-4s" % (name, results[name]["value"],
+                results[name]["unit"])
+        if name in baseline:
+            line += "  (baseline %.3f)" % baseline[name]["value"]
+        if name in regressions:
+            line += "  REGRESSION"
+        print(line)
+
+    if args.save:
+        with open(args.baseline, "w", encoding = "utf-8") as f:
+            json.dump(results, f, indent = 4, sort_keys = True)
+            f.write("\n")
+        return 0
+
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,9 +1,24 @@
+import asyncio
+import json
+import os
+import socket
 import sys
+import tempfile
+import threading
+import time
 import unittest
 
 sys.path.append('../.')
 from PyVoiceRecognitionV3 import PyVoiceRecognitionV3, MySerMock
-from PyVoiceRecognitionV3 import BadPulseWidth
+from PyVoiceRecognitionV3 import AsyncPyVoiceRecognitionV3, DeviceManager
+from PyVoiceRecognitionV3 import FrameDecoder, ExpectFrames, ExpectRecords
+from PyVoiceRecognitionV3 import Frame, RecognizerStatus, TrainStatus, command_table
+from PyVoiceRecognitionV3 import build_set_group_control
+from PyVoiceRecognitionV3 import decode_frame, decode_records, LoadResult
+from PyVoiceRecognitionV3 import RecognitionEvent, VR3Simulator, VirtualClock
+from PyVoiceRecognitionV3 import system_clock
+from PyVoiceRecognitionV3 import RingSink, JSONLSink
+from PyVoiceRecognitionV3 import BadPulseWidth, BadBaudrate, BadSignature
 
 # Mockup for serial device
 mockdev = MySerMock()
@@ -43,6 +58,554 @@ class Test_send_cmd(unittest.TestCase):
 
         self.assertEqual(rsp,exp_rsp)
 
+class Test_recv_rsp(unittest.TestCase):
+    """
+    Tests for method _recv_rsp()
+    """
+
+    def test_bulk_read(self):
+        """
+        _recv_rsp(): Pending bytes are drained with a single read call
+        """
+        class CountingMock(MySerMock):
+            def __init__(self):
+                super().__init__()
+                self.n_reads = 0
+            def read(self, n_bytes):
+                self.n_reads += 1
+                return super().read(n_bytes)
+
+        dev = CountingMock()
+        msg1 = bytearray(b'\xaa\x03\x13\x00\x0a')
+        msg2 = bytearray(b'\xaa\x03\x14\x00\x0a')
+        dev.append_to_inbuffer(msg1 + msg2)
+
+        rsp = PyVoiceRecognitionV3(device=dev)._recv_rsp()
+
+        self.assertEqual(rsp, [msg1, msg2])
+        # One bulk read for the data; the quiet line is detected by the
+        # clock without reading
+        self.assertEqual(dev.n_reads, 1)
+
+    def test_no_response(self):
+        """
+        _recv_rsp(): No response within latency and timeout
+        """
+        dev = MySerMock()
+        rsp = PyVoiceRecognitionV3(device=dev)._recv_rsp(tout=1, latency=1)
+        self.assertIsNone(rsp)
+
+    def test_split_message(self):
+        """
+        _recv_rsp(): Message split across two reads is not lost
+        """
+        dev = MySerMock()
+        v = PyVoiceRecognitionV3(device=dev)
+        msg = bytearray(b'\xaa\x03\x13\x00\x0a')
+
+        dev.append_to_inbuffer(msg[:2])
+        self.assertIsNone(v._recv_rsp(tout=1, latency=1))
+        dev.append_to_inbuffer(msg[2:])
+        self.assertEqual(v._recv_rsp(tout=1, latency=1), [msg])
+
+    def test_timeout_restored(self):
+        """
+        _read_chunk(): Read timeout of the port is restored
+        """
+        class NoFdMock(MySerMock):
+            def fileno(self):
+                raise OSError
+
+        dev = NoFdMock(timeout=5)
+        v = PyVoiceRecognitionV3(device=dev, clock=system_clock)
+        self.assertEqual(v._read_chunk(1), b'')
+        self.assertEqual(dev.timeout, 5)
+
+    def test_expect_early_return(self):
+        """
+        _recv_rsp(): Return as soon as the expected response is complete
+        """
+        dev = MySerMock()
+        v = PyVoiceRecognitionV3(device=dev)
+        msg = bytearray(b'\xaa\x03\x13\x00\x0a')
+        dev.append_to_inbuffer(msg)
+
+        start = time.time()
+        rsp = v._recv_rsp(tout=5000, expect=ExpectFrames(0x13))
+
+        self.assertEqual(rsp, [msg])
+        # Without expected response the mock would block for tout
+        self.assertLess(time.time() - start, 1)
+
+    def test_expect_all_records(self):
+        """
+        check_record_train_status(): Complete after the records of the module
+        """
+        pairs = b''.join(bytes([r, 0]) for r in range(80))
+        msg = b'\xaa' + bytes([3 + len(pairs), 0x02, 0]) + pairs + b'\x0a'
+
+        for records, elapsed in ((80, 0.01), (255, 0.02)):
+            dev = MySerMock()
+            v = PyVoiceRecognitionV3(device=dev, records=records)
+            dev.append_later(0.01, msg)
+            start = dev.clock.monotonic()
+            status = v.check_record_train_status()
+            self.assertEqual(len(status.train_status), 80)
+            # Expecting more records than the module has waits for tout
+            self.assertAlmostEqual(dev.clock.monotonic() - start, elapsed)
+
+    def test_records_truncated(self):
+        """
+        check_record_train_status(): Module with more records than expected
+        """
+        def status(records):
+            pairs = b''.join(bytes([r, 0]) for r in records)
+            return (b'\xaa' + bytes([3 + len(pairs), 0x02, 0]) + pairs
+                    + b'\x0a')
+
+        dev = MySerMock()
+        v = PyVoiceRecognitionV3(device=dev, records=80)
+        dev.append_later(0.01, status(range(80)) + status(range(80, 100)))
+        self.assertEqual(len(v.check_record_train_status().train_status),
+                80)
+        with self.assertWarns(RuntimeWarning):
+            v.check_system_settings()
+
+class Test_MySerMock(unittest.TestCase):
+    """
+    Tests for the serial device mockup MySerMock
+    """
+
+    def test_underflow(self):
+        """
+        MySerMock: Short read returns at once and accounts the timeout
+        """
+        dev = MySerMock(inbuffer=b'\x01\x02', timeout=5)
+        start = time.time()
+        self.assertEqual(dev.read(3), b'\x01\x02')
+        self.assertEqual(dev.read(), b'')
+        self.assertLess(time.time() - start, 1)
+        self.assertEqual(dev.waited, 10)
+
+        dev.timeout = 0
+        dev.read()
+        self.assertEqual(dev.waited, 10)
+
+    def test_readinto(self):
+        """
+        MySerMock: readinto() fills the buffer and consumes the input
+        """
+        dev = MySerMock()
+        dev.append_to_inbuffer(b'\xaa\x03\x13\x00\x0a')
+        buf = bytearray(3)
+        self.assertEqual(dev.readinto(buf), 3)
+        self.assertEqual(buf, b'\xaa\x03\x13')
+        self.assertEqual(dev.in_waiting, 2)
+        self.assertEqual(dev.readinto(buf), 2)
+        self.assertEqual(buf[:2], b'\x00\x0a')
+        self.assertEqual(dev.in_waiting, 0)
+
+    def test_bulk(self):
+        """
+        MySerMock: Megabytes of recognitions are read in linear time
+        """
+        recognition = b'\xaa\x07\x0d\x00\xff\x03\x00\x00\x0a'
+        n = 2**20 // len(recognition)
+        dev = MySerMock(inbuffer=recognition * n, timeout=0)
+        decoder = FrameDecoder()
+
+        start = time.time()
+        frames = 0
+        while dev.in_waiting:
+            frames += len(decoder.feed(dev.read(256)))
+
+        self.assertEqual(frames, n)
+        self.assertLess(time.time() - start, 5)
+
+class Test_VirtualClock(unittest.TestCase):
+    """
+    Tests for the virtual clock VirtualClock
+    """
+
+    recognizer = bytearray(b'\xaa\x0b\x01\x01\x05\xff\xff\xff\xff\xff\xff\xff\x0a')
+    recognition = bytearray(b'\xaa\x07\x0d\x00\xff\x05\x00\x00\x0a')
+
+    def test_timers(self):
+        """
+        VirtualClock: Timers are called in order while the clock advances
+        """
+        clock = VirtualClock()
+        called = []
+        clock.call_later(2, called.append, 2)
+        clock.call_later(1, called.append, 1)
+        clock.call_at(1, called.append, 3)
+
+        clock.sleep(1.5)
+        self.assertEqual(called, [1, 3])
+        self.assertEqual(clock.monotonic(), 1.5)
+
+        self.assertTrue(clock.wait_until(lambda: 2 in called, 10))
+        self.assertEqual(clock.monotonic(), 2)
+        self.assertFalse(clock.wait_until(lambda: False, 3))
+        self.assertEqual(clock.monotonic(), 5)
+
+    def test_timeout(self):
+        """
+        VirtualClock: Timeouts of the driver take no real time
+        """
+        dev = MySerMock()
+        dev.append_to_inbuffer(self.recognizer)
+        v = PyVoiceRecognitionV3(device=dev)
+
+        start = time.time()
+        events = list(v.iter_recognitions(timeout=60000))
+
+        self.assertEqual(events, [])
+        self.assertGreaterEqual(dev.clock.monotonic(), 60)
+        self.assertLess(time.time() - start, 1)
+
+    def test_delayed_recognition(self):
+        """
+        VirtualClock: Data appended by a timer arrives at its time
+        """
+        dev = MySerMock()
+        dev.append_to_inbuffer(self.recognizer)
+        dev.append_later(5, self.recognition)
+        v = PyVoiceRecognitionV3(device=dev)
+
+        events = list(v.iter_recognitions(timeout=10000, max_events=1))
+
+        self.assertEqual(len(events), 1)
+        self.assertAlmostEqual(events[0]["time_passed_ms"], 5000)
+
+    def test_device_manager(self):
+        """
+        VirtualClock: DeviceManager waits on the clock
+        """
+        clock = VirtualClock()
+        dev = MySerMock(clock=clock)
+        mgr = DeviceManager(clock=clock)
+        mgr.register("a", dev)
+        dev.append_later(3, self.recognition)
+        try:
+            events = list(mgr.events(timeout=10000, max_events=1))
+        finally:
+            mgr.close()
+            dev.close()
+
+        self.assertEqual(events[0][0], "a")
+        self.assertAlmostEqual(events[0][1]["time_passed_ms"], 3000)
+
+class Test_Expect(unittest.TestCase):
+    """
+    Tests for classes ExpectFrames and ExpectRecords
+    """
+
+    def test_expect_frames(self):
+        """
+        ExpectFrames: Count frames of the expected message type
+        """
+        expect = ExpectFrames((0x20, 0x21), n=2)
+        prompt = bytearray(b'\xaa\x04\x0a\x01\x41\x0a')
+        status = bytearray(b'\xaa\x05\x20\x01\x01\x00\x0a')
+        self.assertFalse(expect([prompt, status]))
+        self.assertTrue(expect([prompt, status, status]))
+
+    def test_expect_error(self):
+        """
+        ExpectFrames: Error message completes the response
+        """
+        error = bytearray(b'\xaa\x03\xff\x00\x0a')
+        self.assertTrue(ExpectFrames(0x00)([error]))
+
+    def test_expect_records(self):
+        """
+        ExpectRecords: Record/status pairs split over several messages
+        """
+        expect = ExpectRecords(0x30, 3)
+        msg1 = bytearray(b'\xaa\x07\x30\x03\x01\x00\x02\x00\x0a')
+        msg2 = bytearray(b'\xaa\x05\x30\x03\x03\x00\x0a')
+        self.assertFalse(expect([msg1]))
+        self.assertTrue(expect([msg1, msg2]))
+
+class Test_FrameDecoder(unittest.TestCase):
+    """
+    Tests for class FrameDecoder
+    """
+
+    def test_single_frame(self):
+        """
+        FrameDecoder: Single frame in one chunk
+        """
+        msg = bytearray(b'\xaa\x03\x13\x00\x0a')
+        self.assertEqual(FrameDecoder().feed(msg), [msg])
+
+    def test_byte_by_byte(self):
+        """
+        FrameDecoder: Frame fed byte by byte
+        """
+        msg = bytearray(b'\xaa\x08\x00\x00\x00\x00\x00\x00\x00\x0a')
+        dec = FrameDecoder()
+        frames = []
+        for b in msg:
+            frames += dec.feed(bytes([b]))
+        self.assertEqual(frames, [msg])
+        self.assertEqual(dec.pending(), 0)
+
+    def test_garbage(self):
+        """
+        FrameDecoder: Garbage before, between and after frames is skipped
+        """
+        msg1 = bytearray(b'\xaa\x03\x13\x00\x0a')
+        msg2 = bytearray(b'\xaa\x03\x14\x00\x0a')
+        data = b'\x01\x02' + msg1 + b'\xaa\x05\x0a' + msg2 + b'\x0a\x0b'
+        dec = FrameDecoder()
+        self.assertEqual(dec.feed(data), [msg1, msg2])
+        self.assertEqual(dec.pending(), 0)
+
+    def test_partial_frame_kept(self):
+        """
+        FrameDecoder: Partial frame is kept until completed
+        """
+        msg = bytearray(b'\xaa\x03\x13\x00\x0a')
+        dec = FrameDecoder()
+        self.assertEqual(dec.feed(msg + msg[:3]), [msg])
+        self.assertEqual(dec.pending(), 3)
+        self.assertEqual(dec.feed(msg[3:]), [msg])
+
+    def test_stray_head(self):
+        """
+        FrameDecoder: Stray frame head with large length does not block
+        """
+        msg = bytearray(b'\xaa\x09\x0d\x00\xff\x05\x00\x02on\x0a')
+        dec = FrameDecoder()
+        self.assertEqual(dec.feed(b'\xaa\xf0' + msg + msg), [msg, msg])
+        self.assertEqual(dec.pending(), 0)
+        self.assertEqual(dec.skipped, 2)
+
+        # Split across chunks
+        dec = FrameDecoder()
+        self.assertEqual(dec.feed(b'\xaa\xf0' + msg[:5]), [])
+        self.assertEqual(dec.feed(msg[5:]), [msg])
+
+        # Response of the module behind the garbage
+        dev = MySerMock()
+        v = PyVoiceRecognitionV3(device=dev)
+        dev.append_later(0.01, b'\xaa\xf0' +
+                b'\xaa\x08\x00\x00\x00\x00\x00\x00\x00\x0a')
+        self.assertIsNotNone(v.check_system_settings())
+
+    def test_frame_in_payload(self):
+        """
+        FrameDecoder: Partial frame with a frame in its payload is kept
+        """
+        # Train status of records 0xaa, 0x13 and 0x0a; the pairs look like
+        # the message aa 03 13 00 0a
+        msg = bytearray(b'\xaa\x09\x02\x03\xaa\x03\x13\x00\x0a\x00\x0a')
+        dec = FrameDecoder()
+        self.assertEqual(dec.feed(msg[:9]), [])
+        self.assertEqual(dec.feed(msg[9:]), [msg])
+        self.assertEqual(dec.skipped, 0)
+
+    def test_reset(self):
+        """
+        FrameDecoder: reset() discards partial frame
+        """
+        msg = bytearray(b'\xaa\x03\x13\x00\x0a')
+        dec = FrameDecoder()
+        dec.feed(msg[:3])
+        dec.reset()
+        self.assertEqual(dec.feed(msg[3:]), [])
+        self.assertEqual(dec.pending(), 0)
+
+class Test_Frame(unittest.TestCase):
+    """
+    Tests for class Frame
+    """
+
+    def test_accessors(self):
+        """
+        Frame: Command byte, length and payload
+        """
+        frame = Frame(b'\xaa\x05\x30\x01\x05\x00\x0a')
+        self.assertEqual(frame.cmd, 0x30)
+        self.assertEqual(frame.length, 5)
+        self.assertEqual(frame.payload, b'\x01\x05\x00')
+        self.assertEqual(len(frame), 7)
+        self.assertEqual(frame[4], 5)
+
+    def test_equality(self):
+        """
+        Frame: Compares equal to bytes and bytearray
+        """
+        msg = bytearray(b'\xaa\x03\x13\x00\x0a')
+        frame = Frame(msg)
+        self.assertEqual(frame, msg)
+        self.assertEqual(msg, frame)
+        self.assertEqual([msg], [frame])
+        self.assertEqual(bytes(frame), bytes(msg))
+        self.assertNotEqual(frame, b'\xaa\x03\x14\x00\x0a')
+
+    def test_zero_copy(self):
+        """
+        Frame: Frames decoded from one chunk view the same buffer
+        """
+        msg1 = bytearray(b'\xaa\x03\x13\x00\x0a')
+        msg2 = bytearray(b'\xaa\x03\x14\x00\x0a')
+        frames = FrameDecoder().feed(bytes(msg1 + msg2))
+        self.assertIsInstance(frames[0], Frame)
+        self.assertIs(frames[0]._view.obj, frames[1]._view.obj)
+
+class Test_Result(unittest.TestCase):
+    """
+    Tests for the result types
+    """
+
+    status = RecognizerStatus(raw = None, no_records_in_recognizer = 1,
+            records_in_recognizer = [5], group_mode = None)
+
+    def test_access(self):
+        """
+        Result: Fields readable as attributes and dictionary keys
+        """
+        self.assertEqual(self.status.records_in_recognizer, [5])
+        self.assertEqual(self.status["records_in_recognizer"], [5])
+        self.assertRaises(KeyError, lambda: self.status["foo"])
+        self.assertFalse(hasattr(self.status, "__dict__"))
+
+    def test_dict(self):
+        """
+        Result: Compatibility with dictionaries
+        """
+        d = {
+                "raw": None,
+                "no_records_in_recognizer": 1,
+                "records_in_recognizer": [5],
+                "group_mode": None,
+                }
+        self.assertEqual(self.status.to_dict(), d)
+        self.assertEqual(self.status, d)
+        self.assertEqual(dict(self.status), d)
+
+    def test_release(self):
+        """
+        Result: Raw message dropped, other fields kept
+        """
+        status = TrainStatus(raw = [b'\xaa\x05\x02\x01\x05\x01\x0a'],
+                no_trained_records = 1, trained_records = [5],
+                train_status = ["trained"])
+        status.release()
+        self.assertIsNone(status.raw)
+        self.assertEqual(list(status.keys()), ["raw", "no_trained_records",
+                "trained_records", "train_status"])
+        self.assertEqual(status.get("trained_records"), [5])
+
+class Test_commands(unittest.TestCase):
+    """
+    Tests for the command table
+    """
+
+    def test_static(self):
+        """
+        Command table: Precompiled commands
+        """
+        self.assertEqual(command_table[0x00], vr._compile_cmd(b'\x00'))
+        self.assertEqual(command_table[0x31], vr._compile_cmd(b'\x31'))
+        self.assertIsInstance(command_table[0x01], bytes)
+
+    def test_builders(self):
+        """
+        Command table: Commands with parameters
+        """
+        self.assertEqual(command_table[0x02](5), vr._compile_cmd(b'\x02\x05'))
+        self.assertEqual(command_table[0x02](), vr._compile_cmd(b'\x02\xff'))
+        self.assertEqual(command_table[0x21](1, "on"),
+                vr._compile_cmd(b'\x21\x01on'))
+        self.assertEqual(command_table[0x30]((1, 2, 3)),
+                vr._compile_cmd(b'\x30\x01\x02\x03'))
+        self.assertEqual(command_table[(0x32, 0x02)](1, [4, 5]),
+                vr._compile_cmd(b'\x32\x02\x01\x04\x05'))
+        self.assertEqual(command_table[(0x32, 0x04)](),
+                vr._compile_cmd(b'\x32\x04\xff'))
+
+class Test_decoders(unittest.TestCase):
+    """
+    Tests for the decoder registry
+    """
+
+    def test_dispatch(self):
+        """
+        Decoders: Any message decoded by its command byte
+        """
+        settings = Frame(b'\xaa\x08\x00\x01\x00\x00\x00\x01\x02\x0a')
+        rsp = decode_frame(settings)
+        self.assertEqual(rsp.baudrate, 9600)
+        self.assertEqual(rsp.autoload, True)
+        self.assertEqual(rsp.group_control, "user group")
+
+        recognition = Frame(b'\xaa\x09\x0d\x00\xff\x05\x01\x02on\x0a')
+        event = decode_frame(recognition)
+        self.assertEqual(event.recognized_record, 5)
+        self.assertEqual(event.signature_recognized_record, "on")
+        self.assertEqual(event.group_mode, "not in group mode")
+
+        ack = decode_frame(Frame(b'\xaa\x03\x13\x00\x0a'))
+        self.assertEqual((ack["cmd"], ack["data"]), (0x13, b'\x00'))
+
+    def test_records(self):
+        """
+        Decoders: Record/status pairs split over several messages
+        """
+        msg1 = Frame(b'\xaa\x07\x30\x03\x01\x00\x02\xfe\x0a')
+        msg2 = Frame(b'\xaa\x05\x30\x03\x03\xfc\x0a')
+        rsp = decode_records([msg1, msg2], 0x30)
+        self.assertIsInstance(rsp, LoadResult)
+        self.assertEqual(rsp, {
+                "raw": [msg1, msg2],
+                "no_records_in_recognizer": 3,
+                "records_in_recognizer": [1, 2, 3],
+                "status": ["success", "record untrained",
+                    "already in recognizer"],
+                })
+
+class Test_LazyResult(unittest.TestCase):
+    """
+    Tests for lazily decoded results
+    """
+
+    recognition = Frame(b'\xaa\x09\x0d\x00\xff\x05\x01\x02on\x0a')
+
+    def test_lazy(self):
+        """
+        LazyResult: Field decoded once on first access
+        """
+        calls = []
+        def record(frame):
+            calls.append(frame)
+            return frame[5]
+
+        event = RecognitionEvent(self.recognition,
+                {"recognized_record": record})
+
+        self.assertEqual(calls, [])
+        self.assertEqual(event.recognized_record, 5)
+        self.assertEqual(event["recognized_record"], 5)
+        self.assertEqual(len(calls), 1)
+
+    def test_release(self):
+        """
+        LazyResult: Recognition without raw message
+        """
+        v = PyVoiceRecognitionV3(device=MySerMock(), keep_raw=False)
+
+        event = v._recognition_dict(self.recognition, 0, {
+                "records_in_recognizer": [5], "group_mode": None})
+
+        self.assertIsNone(event.raw)
+        self.assertEqual(event.recognized_record, 5)
+        self.assertEqual(event.index_recognized_record, 1)
+        self.assertEqual(event.signature_recognized_record, "on")
+
 class Test_set_output_io_pulse_width(unittest.TestCase):
     """
     Tests for method set_output_io_pulsewidth()
@@ -189,5 +752,1040 @@ class Test_reset_output_io(unittest.TestCase):
         # Check return value from method
         self.assertEqual(rsp, exp_rsp)
 
+class Test_train_record(unittest.TestCase):
+    """
+    Tests for method train_record()
+    """
+
+    def test_dialog(self):
+        """
+        train_record(): Dialog ends with status message
+        """
+        dev = MySerMock()
+        v = PyVoiceRecognitionV3(device=dev)
+        prompt = bytearray(b'\xaa\x08\x0a\x05Speak\x0a')
+        status = bytearray(b'\xaa\x05\x20\x01\x05\x00\x0a')
+        dev.append_to_inbuffer(prompt + status)
+
+        rsp = v.train_record(5)
+
+        self.assertEqual(dev.outbuffer, bytearray(b'\xaa\x03\x20\x05\x0a'))
+        self.assertEqual(rsp["raw"], status)
+        self.assertEqual(rsp["record"], 5)
+        self.assertEqual(rsp["training_status"], 0)
+
+class Test_record_recognized(unittest.TestCase):
+    """
+    Tests for method record_recognized()
+    """
+
+    def test_recognition(self):
+        """
+        record_recognized(): Recognition arriving with the recognizer status
+        """
+        recognizer = bytearray(b'\xaa\x0b\x01\x01\x05\xff\xff\xff\xff\xff\xff\xff\x0a')
+        recognition = bytearray(b'\xaa\x07\x0d\x00\xff\x05\x00\x00\x0a')
+        dev = MySerMock()
+        dev.append_to_inbuffer(recognizer + recognition)
+        v = PyVoiceRecognitionV3(device=dev)
+        events = []
+
+        v.record_recognized(timeout=100, callback_func=events.append)
+
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0]["raw"], recognition)
+        self.assertEqual(events[0]["recognized_record"], 5)
+        self.assertIsNone(events[0]["signature_recognized_record"])
+
+class Test_signature_table(unittest.TestCase):
+    """
+    Tests for the table of known signatures
+    """
+
+    recognition = bytearray(b'\xaa\x09\x0d\x00\xff\x05\x00\x02on\x0a')
+
+    def test_set_signature(self):
+        """
+        Signature table: Recognition labelled with signature from set_signature()
+        """
+        dev = MySerMock()
+        v = PyVoiceRecognitionV3(device=dev)
+        dev.append_to_inbuffer(bytearray(b'\xaa\x03\x22\x00\x0a'))
+        v.set_signature(5, "on")
+
+        event1 = v._recognition_dict(self.recognition, 0, {
+                "records_in_recognizer": [5], "group_mode": None})
+        event2 = v._recognition_dict(bytearray(self.recognition), 0, {
+                "records_in_recognizer": [5], "group_mode": None})
+
+        self.assertEqual(event1["signature_recognized_record"], "on")
+        # The same string object is handed out for every event
+        self.assertIs(event1["signature_recognized_record"],
+                event2["signature_recognized_record"])
+
+    def test_outdated(self):
+        """
+        Signature table: Outdated signature is decoded from the message
+        """
+        v = PyVoiceRecognitionV3(device=MySerMock())
+        v._remember_signature(5, "light")
+
+        event = v._recognition_dict(self.recognition, 0, {
+                "records_in_recognizer": [5], "group_mode": None})
+
+        self.assertEqual(event["signature_recognized_record"], "on")
+        self.assertEqual(v._signatures[5], "on")
+
+class Test_iter_recognitions(unittest.TestCase):
+    """
+    Tests for method iter_recognitions()
+    """
+
+    recognizer = bytearray(b'\xaa\x0b\x01\x01\x05\xff\xff\xff\xff\xff\xff\xff\x0a')
+    recognition = bytearray(b'\xaa\x07\x0d\x00\xff\x05\x00\x00\x0a')
+
+    def test_max_events(self):
+        """
+        iter_recognitions(): Stop after max_events recognitions
+        """
+        dev = MySerMock()
+        dev.append_to_inbuffer(self.recognizer + 3 * self.recognition)
+        v = PyVoiceRecognitionV3(device=dev)
+
+        start = time.time()
+        events = list(v.iter_recognitions(timeout=5000, max_events=2))
+
+        self.assertEqual(len(events), 2)
+        self.assertLess(time.time() - start, 1)
+
+    def test_stop_event(self):
+        """
+        iter_recognitions(): Stop when stop_event is set
+        """
+        dev = MySerMock()
+        dev.append_to_inbuffer(self.recognizer + self.recognition)
+        v = PyVoiceRecognitionV3(device=dev)
+        stop = threading.Event()
+
+        events = []
+        for event in v.iter_recognitions(stop_event=stop):
+            events.append(event)
+            stop.set()
+
+        self.assertEqual(len(events), 1)
+
+    def test_empty_recognizer(self):
+        """
+        iter_recognitions(): No record in recognizer
+        """
+        dev = MySerMock()
+        dev.append_to_inbuffer(b'\xaa\x0b\x01\x00\xff\xff\xff\xff\xff\xff\xff\xff\x0a')
+        v = PyVoiceRecognitionV3(device=dev)
+        self.assertEqual(list(v.iter_recognitions(timeout=1000)), [])
+
+class Test_batch(unittest.TestCase):
+    """
+    Tests for methods batch() and send_many()
+    """
+
+    def test_batch(self):
+        """
+        batch(): Commands sent back-to-back, responses matched by type
+        """
+        dev = MySerMock()
+        v = PyVoiceRecognitionV3(device=dev)
+        sig1 = bytearray(b'\xaa\x04\x22\x00\x01\x0a')
+        sig2 = bytearray(b'\xaa\x04\x22\x00\x02\x0a')
+        train = bytearray(b'\xaa\x05\x02\x01\x01\x01\x0a')
+        # The response to the status check arrives in between
+        dev.append_to_inbuffer(sig1 + train + sig2)
+
+        start = time.time()
+        with v.batch() as b:
+            self.assertEqual(b.set_signature(1, "on"), 0)
+            # No record, nothing queued
+            self.assertEqual(b.set_signature(None, "on"), None)
+            self.assertEqual(b.check_record_train_status(1), 1)
+            self.assertEqual(b.set_signature(2, "off"), 2)
+
+        self.assertEqual(dev.outbuffer, bytearray(
+            b'\xaa\x05\x22\x01on\x0a'
+            b'\xaa\x03\x02\x01\x0a'
+            b'\xaa\x06\x22\x02off\x0a'))
+        self.assertEqual(b.results[0]["raw"], [sig1])
+        self.assertEqual(b.results[1]["train_status"], ["trained"])
+        self.assertEqual(b.results[2]["raw"], [sig2])
+        self.assertEqual(b.results[2]["signature"], "off")
+        # All responses complete; no waiting for a quiet line
+        self.assertLess(time.time() - start, 0.5)
+
+    def test_batch_multistep_command(self):
+        """
+        batch(): Commands with several exchanges cannot be batched
+        """
+        v = PyVoiceRecognitionV3(device=MySerMock())
+        with v.batch() as b:
+            self.assertRaises(AttributeError, getattr, b, "train_record")
+
+    def test_send_many(self):
+        """
+        send_many(): Raw commands with expected responses
+        """
+        dev = MySerMock()
+        v = PyVoiceRecognitionV3(device=dev)
+        settings = bytearray(b'\xaa\x08\x00\x00\x00\x00\x00\x00\x00\x0a')
+        clear = bytearray(b'\xaa\x03\x31\x00\x0a')
+        dev.append_to_inbuffer(clear + settings)
+
+        rsp = v.send_many([b'\xaa\x02\x00\x0a', b'\xaa\x02\x31\x0a'],
+                [ExpectFrames(0x00), ExpectFrames(0x31)])
+
+        self.assertEqual(rsp, [[settings], [clear]])
+
+    def test_recognition_kept(self):
+        """
+        send_many(): Recognition between the responses is kept
+        """
+        settings = bytearray(b'\xaa\x08\x00\x00\x00\x00\x00\x00\x00\x0a')
+        clear = bytearray(b'\xaa\x03\x31\x00\x0a')
+        dev = Test_async.AnswerMock({
+            0x00: settings + Test_async.recognition + clear,
+            0x01: Test_async.recognizer})
+        v = PyVoiceRecognitionV3(device=dev)
+
+        rsp = v.send_many([b'\xaa\x02\x00\x0a', b'\xaa\x02\x31\x0a'],
+                [ExpectFrames(0x00), ExpectFrames(0x31)])
+        self.assertEqual(rsp, [[settings], [clear]])
+
+        events = list(v.iter_recognitions(timeout=100, max_events=1))
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0]["recognized_record"], 5)
+
+class Test_scan_signatures(unittest.TestCase):
+    """
+    Tests for method scan_signatures()
+    """
+
+    class SignatureMock(MySerMock):
+        """
+        Mock answering 02 (all records) and 03 (per record)
+        """
+        # Records 1 and 3 trained, record 2 untrained
+        status = bytearray(b'\xaa\x09\x02\x02\x01\x01\x02\x00\x03\x01\x0a')
+        signatures = {
+                1: bytearray(b'\xaa\x06\x03\x01\x02on\x0a'),
+                3: bytearray(b'\xaa\x04\x03\x03\x00\x0a'),
+                }
+        def write(self, data):
+            super().write(data)
+            # Several commands can be written at once
+            for cmd in FrameDecoder().feed(data):
+                if 0x02 == cmd[2]:
+                    self.append_to_inbuffer(self.status)
+                elif 0x03 == cmd[2]:
+                    self.append_to_inbuffer(self.signatures[cmd[3]])
+
+    def test_scan(self):
+        """
+        scan_signatures(): Signatures fetched only for trained records
+        """
+        dev = self.SignatureMock()
+        v = PyVoiceRecognitionV3(device=dev)
+
+        signatures = v.scan_signatures()
+
+        self.assertEqual(signatures, {1: "on", 3: None})
+        self.assertEqual(dev.outbuffer, bytearray(
+            b'\xaa\x03\x02\xff\x0a'
+            b'\xaa\x03\x03\x01\x0a'
+            b'\xaa\x03\x03\x03\x0a'))
+
+class Test_cache(unittest.TestCase):
+    """
+    Tests for the cache of the module state
+    """
+
+    class StateMock(MySerMock):
+        """
+        Mock answering commands with canned responses (by command byte)
+        """
+        responses = {
+                0x00: bytearray(b'\xaa\x08\x00\x00\x00\x00\x00\x00\x00\x0a'),
+                0x01: bytearray(b'\xaa\x0b\x01\x01\x05\xff\xff\xff\xff\xff\xff\xff\x0a'),
+                0x30: bytearray(b'\xaa\x05\x30\x01\x05\x00\x0a'),
+                0x31: bytearray(b'\xaa\x03\x31\x00\x0a'),
+                0x32: bytearray(b'\xaa\x04\x32\x00\x01\x0a'),
+                }
+        def __init__(self):
+            super().__init__()
+            self.n_cmds = 0
+        def write(self, data):
+            super().write(data)
+            # Several commands can be written at once
+            for cmd in FrameDecoder().feed(data):
+                self.n_cmds += 1
+                self.append_to_inbuffer(self.responses[cmd[2]])
+
+    def test_hit(self):
+        """
+        Cache: Repeated query answered without round trip
+        """
+        dev = self.StateMock()
+        v = PyVoiceRecognitionV3(device=dev, cache=True)
+
+        rsp1 = v.check_system_settings()
+        rsp2 = v.check_system_settings()
+
+        self.assertEqual(rsp1, rsp2)
+        self.assertEqual(dev.n_cmds, 1)
+        self.assertEqual((v.cache_hits, v.cache_misses), (1, 1))
+
+    def test_disabled(self):
+        """
+        Cache: Every query is sent without cache
+        """
+        dev = self.StateMock()
+        v = PyVoiceRecognitionV3(device=dev)
+
+        v.check_system_settings()
+        v.check_system_settings()
+
+        self.assertEqual(dev.n_cmds, 2)
+
+    def test_invalidation(self):
+        """
+        Cache: Mutating command drops only the outdated responses
+        """
+        dev = self.StateMock()
+        v = PyVoiceRecognitionV3(device=dev, cache=True)
+        v.check_system_settings()
+        v.check_recognizer()
+
+        v.load_to_recognizer(5)
+        v.check_system_settings()
+        v.check_recognizer()
+
+        # Settings from the cache, recognizer queried again
+        self.assertEqual(dev.n_cmds, 4)
+
+    def test_invalidation_group_control(self):
+        """
+        Cache: Group control outdates system settings and recognizer
+        """
+        dev = self.StateMock()
+        v = PyVoiceRecognitionV3(device=dev, cache=True)
+        v.check_system_settings()
+        v.check_recognizer()
+
+        v.send_cmd(build_set_group_control(1))
+        v.check_system_settings()
+        v.check_recognizer()
+
+        self.assertEqual(dev.n_cmds, 5)
+
+    def test_batch_order(self):
+        """
+        Cache: Query batched before a mutating command is not cached
+        """
+        dev = self.StateMock()
+        v = PyVoiceRecognitionV3(device=dev, cache=True)
+
+        with v.batch() as b:
+            b.check_recognizer()
+            b.clear_recognizer()
+        v.check_recognizer()
+
+        self.assertEqual(dev.n_cmds, 3)
+
+    def test_refresh(self):
+        """
+        Cache: refresh() queries the state again
+        """
+        dev = self.StateMock()
+        dev.responses = dict(dev.responses)
+        dev.responses[0x02] = bytearray(b'\xaa\x05\x02\x01\x05\x01\x0a')
+        v = PyVoiceRecognitionV3(device=dev, cache=True)
+        v.check_recognizer()
+
+        v.refresh()
+        self.assertEqual(dev.n_cmds, 4)
+        v.check_system_settings()
+        v.check_recognizer()
+        v.check_record_train_status()
+        self.assertEqual(dev.n_cmds, 4)
+
+class Test_metrics(unittest.TestCase):
+    """
+    Tests for the runtime metrics (metrics=True)
+    """
+
+    recognizer = bytearray(b'\xaa\x0b\x01\x01\x05\xff\xff\xff\xff\xff\xff\xff\x0a')
+    recognition = bytearray(b'\xaa\x07\x0d\x00\xff\x05\x00\x00\x0a')
+
+    def test_disabled(self):
+        """
+        metrics: No metrics by default
+        """
+        v = PyVoiceRecognitionV3(device=MySerMock())
+        self.assertIsNone(v.metrics)
+        self.assertIsNone(v.stats())
+
+    def test_commands(self):
+        """
+        metrics: Calls, bytes and messages per command
+        """
+        sim = VR3Simulator()
+        v = PyVoiceRecognitionV3(device=sim, metrics=True)
+        v.check_recognizer()
+        v.check_recognizer()
+        v.send_cmd(b'\xaa\x02\x77\x0a', expect=ExpectFrames(0x77))
+        sim.close()
+
+        stats = v.stats()
+        rec = stats["commands"][0x01]
+        self.assertEqual(rec["count"], 2)
+        self.assertEqual(rec["bytes_written"], 8)
+        self.assertEqual(rec["bytes_read"], 26)
+        self.assertEqual(rec["frames"], 2)
+        self.assertEqual(rec["latency_histogram"][float("inf")], 2)
+        self.assertEqual(stats["commands"][0x77]["errors"], 1)
+
+    def test_garbage_and_recognitions(self):
+        """
+        metrics: Garbage bytes and recognitions per record
+        """
+        dev = MySerMock()
+        dev.append_to_inbuffer(b'\x00\x01' + self.recognizer
+                + 2 * self.recognition + b'\xaa\x01\x02')
+        v = PyVoiceRecognitionV3(device=dev, metrics=True)
+
+        list(v.iter_recognitions(timeout=1000))
+
+        stats = v.stats()
+        self.assertEqual(stats["recognitions"], {5: 2})
+        self.assertEqual(stats["garbage_bytes"], 5)
+
+    def test_prometheus(self):
+        """
+        metrics: Export in Prometheus text format to file and socket
+        """
+        v = PyVoiceRecognitionV3(device=MySerMock(), metrics=True)
+        v.check_system_settings()
+        labels = {"device": "kitchen"}
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "vr.prom")
+            v.export_metrics(path, labels=labels)
+            with open(path) as f:
+                text = f.read()
+
+            sock_path = os.path.join(tmp, "vr.sock")
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+                server.bind(sock_path)
+                server.listen(1)
+                v.export_metrics(sock_path, labels=labels)
+                conn, _ = server.accept()
+                with conn:
+                    received = b''
+                    while True:
+                        data = conn.recv(65536)
+                        if not data:
+                            break
+                        received += data
+
+        self.assertEqual(received.decode(), text)
+        self.assertIn('pvr3_commands_total{cmd="0x00",device="kitchen"} 1\n',
+                text)
+        self.assertIn('pvr3_command_no_response_total{cmd="0x00",'
+                'device="kitchen"} 1\n', text)
+        self.assertIn('pvr3_command_latency_seconds_bucket{cmd="0x00",'
+                'le="+Inf",device="kitchen"} 1\n', text)
+
+class Test_tracing(unittest.TestCase):
+    """
+    Tests for the tracing spans (tracer=...)
+    """
+
+    recognizer = bytearray(b'\xaa\x0b\x01\x01\x05\xff\xff\xff\xff\xff\xff\xff\x0a')
+    recognition = bytearray(b'\xaa\x07\x0d\x00\xff\x05\x00\x00\x0a')
+
+    def test_command_phases(self):
+        """
+        tracing: Spans for the phases of a command
+        """
+        sink = RingSink()
+        sim = VR3Simulator()
+        v = PyVoiceRecognitionV3(device=sim, tracer=sink)
+        v.check_recognizer()
+        sim.close()
+
+        spans = sink.spans()
+        self.assertEqual([s["name"] for s in spans],
+                ["send", "wait_first", "drain", "parse", "command"])
+        for span in spans:
+            self.assertLessEqual(span["start"], span["end"])
+        self.assertEqual(sink.spans("command")[0]["cmd"], 0x01)
+        self.assertEqual(sink.spans("wait_first")[0]["messages"], 1)
+
+    def test_callback(self):
+        """
+        tracing: Callback spans written to a JSONL file
+        """
+        dev = MySerMock()
+        dev.append_to_inbuffer(self.recognizer + 2 * self.recognition)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "trace.jsonl")
+            with JSONLSink(path) as sink:
+                v = PyVoiceRecognitionV3(device=dev, tracer=sink)
+                v.record_recognized(timeout=1000, callback_func=lambda r: None)
+            self.assertTrue(sink._file.closed)
+            with open(path, encoding="utf-8") as f:
+                spans = [json.loads(line) for line in f]
+
+        callbacks = [s for s in spans if "callback" == s["name"]]
+        self.assertEqual([s["record"] for s in callbacks], [5, 5])
+
+    def test_ring_size(self):
+        """
+        tracing: RingSink keeps the latest spans only
+        """
+        sink = RingSink(2)
+        for i in range(3):
+            sink({"name": "send", "start": i, "end": i})
+        self.assertEqual([s["start"] for s in sink.spans()], [1, 2])
+        sink.clear()
+        self.assertEqual(sink.spans(), [])
+
+class Test_VR3Simulator(unittest.TestCase):
+    """
+    Tests for the module simulator VR3Simulator
+    """
+
+    def test_train_and_recognize(self):
+        """
+        VR3Simulator: Train, load and recognize a record
+        """
+        sim = VR3Simulator()
+        v = PyVoiceRecognitionV3(device=sim)
+
+        train = v.train_record(1, "on")
+        load = v.load_to_recognizer(1, 2)
+        # Spoken after the status check of iter_recognitions()
+        sim.recognize(1, delay=0.05)
+        events = list(v.iter_recognitions(timeout=100, max_events=1))
+
+        self.assertEqual(train["training_status"], 0)
+        self.assertEqual(load.status, ["success", "record untrained"])
+        self.assertEqual(events[0].recognized_record, 1)
+        self.assertEqual(events[0].signature_recognized_record, "on")
+
+    def test_state(self):
+        """
+        VR3Simulator: Settings, train status and signatures
+        """
+        sim = VR3Simulator(records=255)
+        sim.train(3, "light")
+        v = PyVoiceRecognitionV3(device=sim)
+
+        v.set_output_io_mode("toggle")
+        self.assertEqual(v.check_system_settings().output_io_mode, "toggle")
+        status = v.check_record_train_status()
+        self.assertEqual(len(status.trained_records), 255)
+        self.assertEqual(status.no_trained_records, 1)
+        self.assertEqual(v.scan_signatures(), {3: "light"})
+
+    def test_error(self):
+        """
+        VR3Simulator: Unknown command answered with error message
+        """
+        v = PyVoiceRecognitionV3(device=VR3Simulator())
+        rsp = v.send_cmd(b'\xaa\x02\x77\x0a', expect=ExpectFrames(0x77))
+        self.assertEqual(rsp, [b'\xaa\x03\xff\x77\x0a'])
+
+    def test_baudrate(self):
+        """
+        VR3Simulator: No answer at a different baud rate
+        """
+        sim = VR3Simulator()
+        v = PyVoiceRecognitionV3(device=sim)
+
+        # The new baud rate takes effect after a restart
+        v.set_baudrate(19200)
+        self.assertIsNotNone(v.check_recognizer())
+        sim.restart()
+        self.assertIsNone(v.check_recognizer())
+        sim.baudrate = 19200
+        self.assertIsNotNone(v.check_recognizer())
+
+    def test_timing(self):
+        """
+        VR3Simulator: Bytes arrive with the time of the baud rate
+        """
+        sim = VR3Simulator(timing=True, response_delay=0)
+        sim.write(b'\xaa\x02\x01\x0a')
+        self.assertEqual(sim.in_waiting, 0)
+        sim.timeout = 1
+        start = time.monotonic()
+        data = sim.read(13)
+        # 4 bytes command and 13 bytes response at 9600 baud
+        self.assertEqual(len(data), 13)
+        self.assertGreater(time.monotonic() - start, 0.015)
+
+class Test_baudrate(unittest.TestCase):
+    """
+    Tests for methods negotiate_baudrate() and detect_baudrate()
+    """
+
+    def test_negotiate_restart(self):
+        """
+        negotiate_baudrate(): Module and host switch after restart
+        """
+        sim = VR3Simulator()
+        v = PyVoiceRecognitionV3(device=sim)
+
+        self.assertEqual(v.negotiate_baudrate(38400, restart=sim.restart),
+                38400)
+        self.assertEqual(sim.baudrate, 38400)
+        self.assertEqual(sim.module_baudrate, 38400)
+        self.assertEqual(v.check_system_settings().baudrate, 38400)
+        sim.close()
+
+    def test_negotiate_pending(self):
+        """
+        negotiate_baudrate(): Host stays at old baud rate until restart
+        """
+        sim = VR3Simulator()
+        v = PyVoiceRecognitionV3(device=sim)
+
+        self.assertEqual(v.negotiate_baudrate(19200), 9600)
+        self.assertEqual(sim.baudrate, 9600)
+        self.assertEqual(sim.baudrate_setting, 19200)
+        sim.close()
+
+        sim = VR3Simulator(immediate_baudrate=True)
+        v = PyVoiceRecognitionV3(device=sim)
+        self.assertEqual(v.negotiate_baudrate(19200), 19200)
+        sim.close()
+
+    def test_negotiate_no_module(self):
+        """
+        negotiate_baudrate(): No module answering
+        """
+        dev = MySerMock()
+        v = PyVoiceRecognitionV3(device=dev)
+        self.assertIsNone(v.negotiate_baudrate(38400))
+        self.assertEqual(dev.baudrate, 9600)
+        with self.assertRaises(BadBaudrate):
+            v.negotiate_baudrate(115200)
+
+    def test_negotiate_rejected(self):
+        """
+        negotiate_baudrate(): Module rejecting the new baud rate
+        """
+        dev = MySerMock()
+        v = PyVoiceRecognitionV3(device=dev)
+        restarts = []
+        dev.append_later(0.01, b'\xaa\x03\xff\x11\x0a')
+        self.assertIsNone(v.negotiate_baudrate(38400,
+                restart=lambda: restarts.append(True)))
+        self.assertEqual(restarts, [])
+        self.assertEqual(dev.baudrate, 9600)
+        # Only the set baud rate command was sent
+        self.assertEqual(dev.outbuffer, b'\xaa\x03\x11\x05\x0a')
+
+    def test_detect(self):
+        """
+        detect_baudrate(): Module at unknown baud rate
+        """
+        sim = VR3Simulator(module_baudrate=4800)
+        v = PyVoiceRecognitionV3(device=sim)
+        self.assertEqual(v.detect_baudrate(), 4800)
+        self.assertEqual(sim.baudrate, 4800)
+        self.assertIsNotNone(v.check_recognizer())
+        sim.close()
+
+        dev = MySerMock()
+        self.assertIsNone(PyVoiceRecognitionV3(device=dev).detect_baudrate())
+        self.assertEqual(dev.baudrate, 9600)
+
+    def test_wire_time(self):
+        """
+        negotiate_baudrate(): Responses take less time at higher baud rate
+        """
+        sim = VR3Simulator(timing=True, response_delay=0)
+        # The scan completes with the last record; a long timeout only
+        # bridges delays of the scheduler between the messages
+        v = PyVoiceRecognitionV3(device=sim, tout=100, records=80)
+
+        def scan():
+            start = time.monotonic()
+            self.assertEqual(len(v.check_record_train_status().train_status),
+                    80)
+            return time.monotonic() - start
+
+        slow = scan()
+        v.negotiate_baudrate(38400, restart=sim.restart)
+        fast = scan()
+        sim.close()
+
+        self.assertLess(fast, slow / 2)
+
+class Test_adaptive(unittest.TestCase):
+    """
+    Tests for adaptive timing and method calibrate()
+    """
+
+    settings = b'\xaa\x08\x00\x00\x00\x00\x00\x00\x00\x0a'
+
+    def test_gap(self):
+        """
+        Timeout derived from the baud rate
+        """
+        dev = MySerMock()
+        v = PyVoiceRecognitionV3(device=dev, adaptive=True)
+        dev.baudrate = 2400
+        self.assertAlmostEqual(v._gap(), 3 * 10000. / 2400 + 5)
+        # Not shorter than tout
+        dev.baudrate = 9600
+        self.assertEqual(v._gap(), 10)
+        v.tout = 2
+        self.assertAlmostEqual(v._gap(), 3 * 10000. / 9600 + 5)
+        self.assertEqual(PyVoiceRecognitionV3(device=dev)._gap(), 10)
+
+    def test_window(self):
+        """
+        Latency window learned from the observed responses
+        """
+        dev = MySerMock()
+        v = PyVoiceRecognitionV3(device=dev, adaptive=True)
+
+        for _ in range(5):
+            self.assertEqual(v._window(0x00), 50)
+            dev.append_later(0.01, self.settings)
+            self.assertIsNotNone(v.check_system_settings())
+        stats = v.latency_stats()[0x00]
+        self.assertEqual(stats["n"], 5)
+        self.assertAlmostEqual(stats["p50"], 10)
+        self.assertAlmostEqual(stats["window"], 10 * 1.5 + 5)
+
+        # A missing response costs the window instead of the full latency
+        # and resets the learning
+        start = dev.clock.monotonic()
+        self.assertIsNone(v.check_system_settings())
+        self.assertLess(dev.clock.monotonic() - start, 0.05)
+        self.assertNotIn(0x00, v.latency_stats())
+        self.assertEqual(v._window(0x00), 50)
+
+    def test_first_message(self):
+        """
+        Latency measured until the first message of a response
+        """
+        status = b'\xaa\x05\x02\x01\x00\x00\x0a'
+        dev = MySerMock()
+        v = PyVoiceRecognitionV3(device=dev, tout=50, records=2,
+                adaptive=True)
+        dev.append_later(0.01, status)
+        dev.append_later(0.04, status)
+        self.assertEqual(len(v.check_record_train_status().train_status), 2)
+        self.assertAlmostEqual(v.latency_stats()[0x02]["p50"], 10)
+
+    def test_window_bound(self):
+        """
+        Latency window not longer than the configured latency
+        """
+        dev = MySerMock()
+        v = PyVoiceRecognitionV3(device=dev, latency=100, adaptive=True)
+        for _ in range(5):
+            dev.append_later(0.09, self.settings)
+            v.check_system_settings()
+        self.assertEqual(v._window(0x00), 100)
+
+    def test_calibrate(self):
+        """
+        calibrate(): Latencies of a fresh module
+        """
+        sim = VR3Simulator()
+        v = PyVoiceRecognitionV3(device=sim, cache=True)
+        stats = v.calibrate(repeat=5)
+        sim.close()
+
+        self.assertTrue(v.adaptive)
+        self.assertEqual(sorted(stats), [0x00, 0x01, 0x02])
+        for cmd in stats:
+            self.assertEqual(stats[cmd]["n"], 5)
+            self.assertLessEqual(stats[cmd]["p50"], stats[cmd]["p99"])
+            self.assertLessEqual(stats[cmd]["window"], 50)
+        self.assertEqual(v.cache_hits, 0)
+
+class Test_threaded(unittest.TestCase):
+    """
+    Tests for threaded mode (start_reader())
+    """
+
+    class EchoMock(MySerMock):
+        """
+        Mock answering every command with a recognition followed by a
+        canned response
+        """
+        def __init__(self, recognition, response):
+            super().__init__()
+            self.lock = threading.Lock()
+            self.recognition = recognition
+            self.response = response
+        def read(self, n_bytes):
+            with self.lock:
+                return super().read(min(n_bytes, len(self.inbuffer)))
+        @property
+        def in_waiting(self):
+            with self.lock:
+                return len(self.inbuffer)
+        def write(self, data):
+            super().write(data)
+            with self.lock:
+                self.append_to_inbuffer(self.recognition + self.response)
+
+    def test_command_and_recognition(self):
+        """
+        threaded mode: Recognition during a command is not lost
+        """
+        recognition = bytearray(b'\xaa\x07\x0d\x00\xff\x03\x00\x00\x0a')
+        response = bytearray(b'\xaa\x08\x00\x00\x00\x00\x00\x00\x00\x0a')
+        dev = self.EchoMock(recognition, response)
+        v = PyVoiceRecognitionV3(device=dev, threaded=True)
+        received = []
+        v.subscribe(received.append)
+        try:
+            rsp = v.check_system_settings()
+            # The reader blocks in real time instead of spinning through
+            # the timeouts of the virtual clock
+            cpu = time.process_time()
+            time.sleep(0.2)
+            cpu = time.process_time() - cpu
+        finally:
+            v.stop_reader()
+            dev.close()
+
+        self.assertEqual(rsp["raw"], response)
+        self.assertEqual(received, [recognition])
+        self.assertLess(cpu, 0.1)
+        self.assertLess(dev.clock.monotonic(), 1)
+
+    def test_unsubscribe(self):
+        """
+        threaded mode: Unsubscribed callback is not called anymore
+        """
+        v = PyVoiceRecognitionV3(device=MySerMock())
+        received = []
+        v.subscribe(received.append)
+        v.unsubscribe(received.append)
+        v._route(bytearray(b'\xaa\x07\x0d\x00\xff\x03\x00\x00\x0a'))
+        self.assertEqual(received, [])
+
+class Test_async(unittest.TestCase):
+    """
+    Tests for class AsyncPyVoiceRecognitionV3
+    """
+
+    class AnswerMock(MySerMock):
+        """
+        Mock answering commands with canned responses (by command byte)
+        """
+        def __init__(self, responses):
+            super().__init__()
+            self.responses = responses
+        def write(self, data):
+            super().write(data)
+            self.append_to_inbuffer(self.responses.get(data[2], b''))
+
+    recognizer = bytearray(b'\xaa\x0b\x01\x01\x05\xff\xff\xff\xff\xff\xff\xff\x0a')
+    settings = bytearray(b'\xaa\x08\x00\x00\x00\x00\x00\x00\x00\x0a')
+    recognition = bytearray(b'\xaa\x07\x0d\x00\xff\x05\x00\x00\x0a')
+
+    def test_command(self):
+        """
+        AsyncPyVoiceRecognitionV3: Command as coroutine
+        """
+        dev = self.AnswerMock({0x00: self.settings})
+        v = AsyncPyVoiceRecognitionV3(device=dev)
+
+        async def main():
+            try:
+                return await v.check_system_settings()
+            finally:
+                v.close()
+
+        rsp = asyncio.run(main())
+        dev.close()
+
+        self.assertEqual(dev.outbuffer, bytearray(b'\xaa\x02\x00\x0a'))
+        self.assertEqual(rsp["raw"], self.settings)
+        # Read timeout of the port restored by close()
+        self.assertEqual(dev.timeout, 60)
+
+    def test_awaitable(self):
+        """
+        AsyncPyVoiceRecognitionV3: Every command call is awaitable
+        """
+        dev = self.AnswerMock({})
+        v = AsyncPyVoiceRecognitionV3(device=dev)
+
+        async def main():
+            try:
+                self.assertIsNone(await v.set_signature(None, "x"))
+                self.assertIsNone(await v.load_to_recognizer())
+                # Bad arguments raise when awaited, not when called
+                call = v.set_signature(1, "bad signature")
+                with self.assertRaises(BadSignature):
+                    await call
+            finally:
+                v.close()
+
+        asyncio.run(main())
+        dev.close()
+
+    def test_recognitions(self):
+        """
+        AsyncPyVoiceRecognitionV3: Commands while iterating over recognitions
+        """
+        dev = self.AnswerMock({0x00: self.settings, 0x01: self.recognizer})
+        v = AsyncPyVoiceRecognitionV3(device=dev)
+
+        async def main():
+            events = []
+            settings = None
+            try:
+                async for event in v.recognitions(timeout=500):
+                    events.append(event)
+                    settings = await v.check_system_settings()
+                    break
+            finally:
+                v.close()
+            return events, settings
+
+        async def inject():
+            loop = asyncio.get_running_loop()
+            loop.call_later(0.01, dev.append_to_inbuffer, self.recognition)
+            return await main()
+
+        events, settings = asyncio.run(inject())
+        dev.close()
+
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0]["recognized_record"], 5)
+        self.assertEqual(events[0]["records_in_recognizer"], [5, 255, 255, 255, 255, 255, 255])
+        self.assertEqual(settings["raw"], self.settings)
+
+class Test_DeviceManager(unittest.TestCase):
+    """
+    Tests for class DeviceManager
+    """
+
+    recognizer = bytearray(b'\xaa\x0b\x01\x01\x05\xff\xff\xff\xff\xff\xff\xff\x0a')
+    settings = bytearray(b'\xaa\x08\x00\x00\x00\x00\x00\x00\x00\x0a')
+    recognition = bytearray(b'\xaa\x07\x0d\x00\xff\x05\x00\x00\x0a')
+
+    def setUp(self):
+        self.mgr = DeviceManager()
+        self.devs = {}
+        for name in ("a", "b"):
+            dev = Test_async.AnswerMock({0x00: self.settings,
+                0x01: self.recognizer})
+            self.devs[name] = dev
+            self.mgr.register(name, dev)
+
+    def tearDown(self):
+        self.mgr.close()
+        for dev in self.devs.values():
+            dev.close()
+
+    def test_commands(self):
+        """
+        DeviceManager: Commands on several devices
+        """
+        futures = [self.mgr.device(n).check_system_settings() for n in ("a", "b")]
+        for f in futures:
+            self.assertEqual(self.mgr.wait(f, timeout=1000)["raw"], self.settings)
+        for dev in self.devs.values():
+            self.assertEqual(dev.outbuffer, bytearray(b'\xaa\x02\x00\x0a'))
+
+    def test_events(self):
+        """
+        DeviceManager: Merged event stream tagged by device
+        """
+        self.mgr.wait(self.mgr.device("b").check_recognizer(), timeout=1000)
+        self.devs["a"].append_to_inbuffer(self.recognition)
+        self.devs["b"].append_to_inbuffer(self.recognition)
+
+        events = list(self.mgr.events(timeout=1000, max_events=2))
+
+        self.assertEqual(sorted(name for name, event in events), ["a", "b"])
+        for name, event in events:
+            self.assertEqual(event["recognized_record"], 5)
+        records = dict((name, event["records_in_recognizer"]) for name, event in events)
+        self.assertIsNone(records["a"])
+        self.assertEqual(records["b"], [5, 255, 255, 255, 255, 255, 255])
+
+    def test_timeout_restored(self):
+        """
+        DeviceManager: Read timeout restored by unregister()
+        """
+        self.assertEqual(self.devs["a"].timeout, 0)
+        self.mgr.unregister("a")
+        self.assertEqual(self.devs["a"].timeout, 60)
+
+    def test_read_error(self):
+        """
+        DeviceManager: Device failing to read is removed, others go on
+        """
+        class BrokenMock(Test_async.AnswerMock):
+            def read(self, n_bytes=1):
+                raise OSError("device unplugged")
+
+        dev = BrokenMock({0x00: self.settings})
+        self.devs["c"] = dev
+        handle = self.mgr.register("c", dev)
+        failed = [handle.check_system_settings(), handle.check_recognizer()]
+        f = self.mgr.device("a").check_system_settings()
+
+        for future in failed:
+            with self.assertRaises(OSError):
+                self.mgr.wait(future, timeout=1000)
+        self.assertNotIn("c", self.mgr.devices())
+        self.assertEqual(dev.timeout, 60)
+        self.assertEqual(self.mgr.wait(f, timeout=1000)["raw"], self.settings)
+
+    def test_background_thread(self):
+        """
+        DeviceManager: Loop running in a background thread
+        """
+        self.mgr.start()
+        try:
+            f = self.mgr.device("a").check_system_settings()
+            self.assertEqual(self.mgr.wait(f, timeout=1000)["raw"], self.settings)
+        finally:
+            self.mgr.stop()
+
+    def test_register_while_running(self):
+        """
+        DeviceManager: Register and unregister while the loop runs
+        """
+        self.mgr.start()
+        try:
+            for i in range(100):
+                dev = Test_async.AnswerMock({0x00: self.settings})
+                handle = self.mgr.register("c", dev)
+                f = handle.check_system_settings()
+                if i % 2:
+                    self.assertEqual(self.mgr.wait(f, timeout=1000)["raw"],
+                            self.settings)
+                self.mgr.unregister("c")
+                dev.close()
+            self.assertTrue(self.mgr._thread.is_alive())
+            f = self.mgr.device("a").check_system_settings()
+            self.assertEqual(self.mgr.wait(f, timeout=1000)["raw"], self.settings)
+        finally:
+            self.mgr.stop()
+
 if __name__ == '__main__':
     unittest.main()